@@ -0,0 +1,177 @@
+import fnmatch
+import glob
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Sequence
+
+from file_collection import natural_key
+
+DEFAULT_INCLUDE = ("*.pdf",)
+
+
+def _matches(name: str, path: str, patterns: Sequence[str]) -> bool:
+    # Case-insensitive on every platform; patterns may match the name or the path
+    name = name.lower()
+    path = path.replace(os.sep, "/").lower()
+    return any(fnmatch.fnmatchcase(name, p) or fnmatch.fnmatchcase(path, p) for p in patterns)
+
+
+class _GlobPattern:
+    """A glob such as ``scans/**/*.pdf`` split into its fixed base and the rest.
+
+    ``base`` is the leading part without wildcards (``scans``), walked like
+    any folder root; ``matches`` and ``could_contain`` test paths below it,
+    given as lists of names. The rules are those of ``glob.glob`` with
+    ``recursive=True``: wildcards stay within one name, ``**`` spans any
+    number of folders and hidden names only match a pattern starting with a dot.
+    """
+
+    def __init__(self, pattern: str):
+        parts = pattern.replace(os.sep, "/").split("/")
+        fixed = 0
+        while not glob.has_magic(parts[fixed]):
+            fixed += 1
+        self.base = "/".join(parts[:fixed]) or ("/" if fixed else "")
+        flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+        self.parts = [None if p == "**" else (p.startswith("."), re.compile(fnmatch.translate(p), flags))
+                      for p in parts[fixed:] if p]
+
+    @staticmethod
+    def _name_matches(part, name):
+        dotted, regex = part
+        return (dotted or not name.startswith(".")) and regex.match(name) is not None
+
+    def matches(self, names: List[str], i: int = 0, j: int = 0) -> bool:
+        while i < len(self.parts):
+            if self.parts[i] is None:
+                # ** matches zero or more visible folders
+                return self.matches(names, i + 1, j) or (
+                    j < len(names) and not names[j].startswith(".") and self.matches(names, i, j + 1))
+            if j >= len(names) or not self._name_matches(self.parts[i], names[j]):
+                return False
+            i, j = i + 1, j + 1
+        return j == len(names)
+
+    def could_contain(self, names: List[str]) -> bool:
+        """Whether anything below the folder ``names`` can match."""
+        for i, name in enumerate(names):
+            if i >= len(self.parts) - 1:
+                return False
+            if self.parts[i] is None:
+                return not any(n.startswith(".") for n in names[i:])
+            if not self._name_matches(self.parts[i], name):
+                return False
+        return True
+
+
+def _scan_dir(directory):
+    """List one directory, returning ``(files, subdirectories)`` as entry pairs."""
+    files, dirs = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append((entry.name, entry.path))
+                    elif entry.is_file():
+                        files.append((entry.name, entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, dirs
+
+
+class DirectoryScanner:
+    """Concurrent recursive file finder built on ``os.scandir``.
+
+    Directory listings run on a thread pool: as soon as a directory is read,
+    all of its subdirectories are queued, so slow (network) file systems are
+    read in parallel. Results are still yielded in a stable depth-first
+    order with natural sorting inside each directory, so they can be shown
+    as they arrive without a final sort.
+    """
+
+    def __init__(self, include: Sequence[str] = DEFAULT_INCLUDE,
+                 exclude: Sequence[str] = (), workers: int = 8):
+        self.include = [p.lower() for p in include] or ["*"]
+        self.exclude = [p.lower() for p in exclude]
+        self.workers = workers
+
+    def _excluded(self, name, path):
+        return bool(self.exclude) and _matches(name, path, self.exclude)
+
+    def _walk(self, executor, future) -> Iterator[List[str]]:
+        files, dirs = future.result()
+        dirs = sorted((d for d in dirs if not self._excluded(*d)), key=lambda d: natural_key(d[0]))
+        # Queue the children before yielding so they are listed while the caller works
+        children = [executor.submit(_scan_dir, path) for _, path in dirs]
+        matched = [path for name, path in files
+                   if _matches(name, path, self.include) and not self._excluded(name, path)]
+        matched.sort(key=natural_key)
+        if matched:
+            yield matched
+        for child in children:
+            yield from self._walk(executor, child)
+
+    def iter_batches(self, roots: Iterable[str], batch_size: int = 500) -> Iterator[List[str]]:
+        """Yield lists of up to ``batch_size`` matching files under ``roots``.
+
+        Each root may be a file (yielded as is), a directory (walked
+        recursively) or a glob pattern such as ``scans/**/*.pdf``.
+        """
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for files in self._iter_roots(executor, roots):
+                for path in files:
+                    batch.append(path)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    def _walk_glob(self, executor, future, pattern, folder) -> Iterator[List[str]]:
+        # Like _walk, but only folders the pattern can reach are listed; a
+        # folder the pattern matches itself is walked whole. Files must match
+        # the pattern and, like every file found, the include patterns
+        files, dirs = future.result()
+        dirs = sorted((d for d in dirs if not self._excluded(*d)), key=lambda d: natural_key(d[0]))
+        children = []
+        for name, _ in dirs:
+            names = folder + [name]
+            path = os.path.join(pattern.base, *names)
+            if pattern.matches(names):
+                children.append((None, executor.submit(_scan_dir, path)))
+            elif pattern.could_contain(names):
+                children.append((names, executor.submit(_scan_dir, path)))
+        matched = []
+        for name, _ in files:
+            path = os.path.join(pattern.base, *folder, name)
+            if (pattern.matches(folder + [name]) and _matches(name, path, self.include)
+                    and not self._excluded(name, path)):
+                matched.append(path)
+        matched.sort(key=natural_key)
+        if matched:
+            yield matched
+        for names, child in children:
+            if names is None:
+                yield from self._walk(executor, child)
+            else:
+                yield from self._walk_glob(executor, child, pattern, names)
+
+    def _iter_roots(self, executor, roots):
+        for root in roots:
+            if glob.has_magic(root):
+                pattern = _GlobPattern(root)
+                future = executor.submit(_scan_dir, pattern.base or os.curdir)
+                yield from self._walk_glob(executor, future, pattern, [])
+            elif os.path.isdir(root):
+                yield from self._walk(executor, executor.submit(_scan_dir, root))
+            else:
+                yield [root]
+
+    def find(self, roots: Iterable[str]) -> List[str]:
+        """Return every matching file under ``roots``."""
+        return [path for batch in self.iter_batches(roots) for path in batch]
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from importlib import metadata
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "environment_cache.json"
+
+
+def pip_version() -> Optional[str]:
+    """Version of pip installed for this interpreter, or None; no subprocess needed."""
+    try:
+        return metadata.version("pip")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def environment_fingerprint(requirements: str = "requirements.txt") -> str:
+    """Hash of the interpreter, the requirements file and every installed distribution.
+
+    Installing, upgrading or removing any package, editing the requirements
+    or switching interpreters changes the fingerprint.
+    """
+    try:
+        with open(requirements, "rb") as f:
+            requirements_hash = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        requirements_hash = None
+    distributions = sorted(
+        (dist.metadata["Name"] or "", dist.version or "") for dist in metadata.distributions())
+    state = {
+        "executable": os.path.abspath(sys.executable),
+        "version": sys.version,
+        "requirements": requirements_hash,
+        "distributions": distributions,
+    }
+    return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()
+
+
+class EnvironmentCache:
+    """Remembers the environment fingerprint of the last successful setup.
+
+    While the fingerprint is unchanged the pip checks, upgrade and
+    requirements install can all be skipped. Delete the cache file to force
+    a full setup.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, requirements: str = "requirements.txt"):
+        self.path = path
+        self.requirements = requirements
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def is_current(self) -> bool:
+        """True if nothing changed since the last recorded setup."""
+        start = time.perf_counter()
+        recorded = self.load().get("fingerprint")
+        current = recorded is not None and recorded == environment_fingerprint(self.requirements)
+        logger.info(f"Environment check took {time.perf_counter() - start:.3f}s "
+                    f"({'unchanged' if current else 'setup needed'})")
+        return current
+
+    def record(self):
+        """Store the current fingerprint after a successful setup."""
+        data = {"fingerprint": environment_fingerprint(self.requirements),
+                "executable": os.path.abspath(sys.executable),
+                "recorded": time.time()}
+        partial = f"{self.path}.tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(partial, self.path)
+
+    def invalidate(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,135 @@
+import itertools
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def natural_key(path: str):
+    """Sort key for file names that orders ``page2`` before ``page10``."""
+    parts = _DIGITS.split(os.path.basename(path).lower())
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in parts]
+
+
+class FileEntry:
+    """A file in the merge list, with its view row id and page selection."""
+
+    __slots__ = ("path", "iid", "page_spec")
+
+    def __init__(self, path: str, iid: str, page_spec: Optional[str] = None):
+        self.path = path
+        self.iid = iid
+        self.page_spec = page_spec
+
+
+class FileCollection:
+    """Ordered merge list with O(1) membership and row-id lookups.
+
+    The order lives in a plain list; a dict indexes entries by path and by
+    view row id, so duplicate checks and selection lookups never scan the
+    list. Bulk removal rebuilds the order in a single O(N) pass.
+    """
+
+    def __init__(self):
+        self.order: List[str] = []
+        self.entries: Dict[str, FileEntry] = {}
+        self.by_iid: Dict[str, FileEntry] = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def entry(self, path: str) -> FileEntry:
+        return self.entries[path]
+
+    def path_for(self, iid: str) -> str:
+        return self.by_iid[iid].path
+
+    def add(self, paths: Iterable[str]) -> List[FileEntry]:
+        """Append ``paths`` not already present and return their new entries."""
+        added = []
+        for path in paths:
+            if path in self.entries:
+                continue
+            entry = FileEntry(path, f"f{next(self._ids)}")
+            self.entries[path] = entry
+            self.by_iid[entry.iid] = entry
+            self.order.append(path)
+            added.append(entry)
+        return added
+
+    def remove(self, paths: Iterable[str]) -> List[FileEntry]:
+        """Remove ``paths`` and return the removed entries."""
+        removed = []
+        for path in paths:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                del self.by_iid[entry.iid]
+                removed.append(entry)
+        if removed:
+            self.order = [p for p in self.order if p in self.entries]
+        return removed
+
+    def index(self, path: str) -> int:
+        return self.order.index(path)
+
+    def shift(self, paths: Iterable[str], step: int):
+        """Move every path in ``paths`` one place up (``step=-1``) or down (``+1``).
+
+        Selected blocks move together and stop at the ends of the list, in
+        one O(N) pass.
+        """
+        chosen = set(paths)
+        order = self.order
+        if step < 0:
+            positions = range(1, len(order))
+        else:
+            positions = range(len(order) - 2, -1, -1)
+        for i in positions:
+            j = i + step
+            if order[i] in chosen and order[j] not in chosen:
+                order[i], order[j] = order[j], order[i]
+
+    def move_to(self, paths: Iterable[str], index: int):
+        """Move ``paths`` as one block, in list order, to ``index``.
+
+        ``index`` counts positions among the entries that are not moved, so
+        ``0`` means the top and ``len(self)`` the bottom.
+        """
+        chosen = set(paths)
+        block = [p for p in self.order if p in chosen]
+        rest = [p for p in self.order if p not in chosen]
+        index = max(0, min(index, len(rest)))
+        self.order = rest[:index] + block + rest[index:]
+
+    def move_next_to(self, paths: Iterable[str], target: str, after: bool = False):
+        """Move ``paths`` as one block just before (or after) ``target``."""
+        chosen = set(paths)
+        rest_index = 0
+        for path in self.order:
+            if path == target:
+                break
+            if path not in chosen:
+                rest_index += 1
+        self.move_to(chosen, rest_index + 1 if after else rest_index)
+
+    def sort(self, key: Callable[[str], object], reverse: bool = False):
+        self.order.sort(key=key, reverse=reverse)
+
+    def set_page_spec(self, path: str, page_spec: Optional[str]):
+        self.entries[path].page_spec = page_spec or None
+
+    def merge_inputs(self):
+        """Return the merge engine inputs: paths or ``(path, page_spec)`` pairs."""
+        inputs = []
+        for path in self.order:
+            page_spec = self.entries[path].page_spec
+            inputs.append((path, page_spec) if page_spec else path)
+        return inputs
@@ -0,0 +1,357 @@
+import bisect
+import contextlib
+import difflib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import List, Optional
+
+import fitz  # PyMuPDF
+
+import merge_engine
+from input_cache import InputCache
+from merge_trace import NULL_TRACER
+from pdf_sources import is_source
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = ".merge.json"
+SIDECAR_VERSION = 2
+
+# Incremental saves append; rewrite the whole file once they exceed its compacted size
+MAX_APPENDED_RATIO = 1.0
+
+
+def sidecar_path(output_file: str) -> str:
+    """Return the path of the manifest kept next to ``output_file``."""
+    return output_file + SIDECAR_SUFFIX
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_sidecar(output_file):
+    """Return the manifest for ``output_file`` if it describes the file on disk."""
+    try:
+        with open(sidecar_path(output_file), encoding="utf-8") as f:
+            sidecar = json.load(f)
+        stat = os.stat(output_file)
+    except (OSError, ValueError):
+        return None
+    if sidecar.get("version") != SIDECAR_VERSION:
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (sidecar["output_size"], sidecar["output_mtime_ns"]):
+        logger.info(f"{output_file} changed since its last merge; rebuilding it")
+        return None
+    return sidecar
+
+
+def _write_sidecar(output_file, records, profile, dedup, base_size, bookmarks=None):
+    stat = os.stat(output_file)
+    sidecar = {
+        "version": SIDECAR_VERSION,
+        "profile": profile,
+        "dedup": dedup,
+        "bookmarks": bookmarks,
+        "output_size": stat.st_size,
+        "output_mtime_ns": stat.st_mtime_ns,
+        "base_size": base_size,
+        "page_count": sum(r["count"] for r in records),
+        "inputs": records,
+    }
+    partial = merge_engine.partial_path(sidecar_path(output_file))
+    with open(partial, "w", encoding="utf-8") as f:
+        # dumps without indent uses the C encoder; outlines make the manifest large
+        f.write(json.dumps(sidecar))
+    os.replace(partial, sidecar_path(output_file))
+
+
+def _input_records(inputs, previous) -> List[dict]:
+    """Describe each input by path, page selection, size, mtime and content hash.
+
+    Hashes are reused from ``previous`` records when size and mtime match,
+    so only files that were touched are read.
+    """
+    known = {(r["path"], r["size"], r["mtime_ns"]): r["sha256"] for r in previous}
+    records = []
+    for item in inputs:
+        path, page_spec = merge_engine.split_input(item)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found: {path}") from None
+        sha256 = known.get((path, stat.st_size, stat.st_mtime_ns)) or file_sha256(path)
+        records.append({"path": path, "pages": page_spec, "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns, "sha256": sha256})
+    return records
+
+
+def _discard(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _key(record):
+    return record["path"], record["pages"], record["sha256"]
+
+
+def _assign_spans(records):
+    start = 0
+    for record in records:
+        record["start"] = start
+        start += record["count"]
+
+
+def _dest_to_json(dest):
+    if dest is None:
+        return None
+    dest = dict(dest)
+    if "to" in dest:
+        dest["to"] = [dest["to"].x, dest["to"].y]
+    return dest
+
+
+def _dest_from_json(dest):
+    if dest is None:
+        return None
+    dest = dict(dest)
+    if "to" in dest:
+        dest["to"] = fitz.Point(*dest["to"])
+    return dest
+
+
+def _record_outline(rows):
+    """Make ``outline_entries`` rows (at offset 0) storable in the manifest."""
+    return [[level, title, target, _dest_to_json(rest[0] if rest else None)]
+            for level, title, target, *rest in rows]
+
+
+def _split_outline(pdf, records):
+    """Give each record the rows of ``pdf``'s outline that belong to its page span.
+
+    The merged outline lists the inputs' entries in input order, so entries
+    without a page stay with the input of the entry before them.
+    """
+    starts = [record["start"] for record in records]
+    for record in records:
+        record["outline"] = []
+    index = 0
+    for level, title, page, dest in merge_engine.read_outline(pdf):
+        if page >= 0:
+            index = max(bisect.bisect_right(starts, page) - 1, 0)
+        record = records[index]
+        target = page - record["start"] + 1 if page >= 0 else -1
+        record["outline"].append([level, title, target, _dest_to_json(dest)])
+
+
+def _merged_outline(records):
+    """Return ``set_toc`` rows for the whole output from the records' outlines."""
+    rows = []
+    for record in records:
+        for level, title, target, dest in record["outline"]:
+            row = [level, title, target + record["start"] if target > 0 else target]
+            if dest is not None:
+                row.append(_dest_from_json(dest))
+            rows.append(row)
+    return rows
+
+
+def update_merge(inputs: List, output_file: str, progress=None, cancel_event=None,
+                 dedup: bool = False, profile: str = "fast",
+                 cache: Optional[InputCache] = None, tracer=NULL_TRACER,
+                 bookmarks: Optional[str] = None, lock=None) -> int:
+    """Bring ``output_file`` up to date with ``inputs`` and return its page count.
+
+    A manifest of input hashes and the page span each input occupies is
+    kept next to the output (see ``sidecar_path``). When it matches the
+    output on disk, only inputs that were added, removed or changed are
+    spliced in: their old pages are deleted and the new ones inserted at the
+    same place, and the result is saved incrementally, so the work is
+    proportional to the change. If nothing changed the output is left
+    alone. Without a usable manifest, when the save profile changed, or
+    for profiles that rewrite the whole file anyway (anything but ``fast``
+    without ``dedup``), the output is built from scratch with
+    ``merge_engine.merge_files``. With ``bookmarks``, the manifest keeps
+    each input's outline entries, and after a splice the outline is
+    rewritten from them; only the changed inputs are read. ``lock`` is as
+    for ``merge_files``.
+    """
+    lock = lock or contextlib.nullcontext()
+    items = list(map(merge_engine.split_input, inputs))
+    if not isinstance(output_file, str) or any(is_source(path) for path, _ in items):
+        raise ValueError("Incremental merges need input and output files on disk")
+    inputs = [(os.path.abspath(path), spec) for path, spec in items]
+    sidecar = _load_sidecar(output_file)
+    if sidecar is not None and ((sidecar["profile"], sidecar["dedup"], sidecar.get("bookmarks"))
+                                != (profile, dedup, bookmarks)):
+        sidecar = None
+
+    records = _input_records(inputs, sidecar["inputs"] if sidecar else [])
+    if sidecar is None:
+        return _full_merge(inputs, output_file, records, progress, cancel_event,
+                           dedup, profile, cache, tracer, bookmarks, lock)
+
+    old = sidecar["inputs"]
+    matcher = difflib.SequenceMatcher(None, [_key(r) for r in old], [_key(r) for r in records],
+                                      autojunk=False)
+    opcodes = matcher.get_opcodes()
+    if all(tag == "equal" for tag, *_ in opcodes):
+        if any(r["mtime_ns"] != o["mtime_ns"] for r, o in zip(records, old)):
+            # Touched but identical inputs: remember the new mtimes to skip hashing next time
+            for record, previous in zip(records, old):
+                record["count"] = previous["count"]
+                if bookmarks:
+                    record["outline"] = previous["outline"]
+            _assign_spans(records)
+            _write_sidecar(output_file, records, profile, dedup, sidecar["base_size"], bookmarks)
+        logger.info(f"{output_file} is up to date")
+        if progress is not None:
+            progress(len(inputs), len(inputs), sidecar["page_count"])
+        return sidecar["page_count"]
+
+    if merge_engine.save_options(profile, dedup):
+        # Compacting profiles rewrite every object anyway; merging afresh is faster
+        return _full_merge(inputs, output_file, records, progress, cancel_event,
+                           dedup, profile, cache, tracer, bookmarks, lock)
+    return _splice(output_file, sidecar, records, opcodes, progress, cancel_event,
+                   cache, tracer, bookmarks, lock)
+
+
+def _full_merge(inputs, output_file, records, progress, cancel_event, dedup, profile,
+                cache, tracer, bookmarks=None, lock=contextlib.nullcontext()):
+    pages_before = [0]
+
+    def count_pages(files_done, total_files, pages_done):
+        if files_done > 0 and "count" not in records[files_done - 1]:
+            # The first report after an input is complete; others come from within one
+            records[files_done - 1]["count"] = pages_done - pages_before[0]
+            pages_before[0] = pages_done
+        if progress is not None:
+            progress(files_done, total_files, pages_done)
+
+    page_count = merge_engine.merge_files(inputs, output_file, progress=count_pages,
+                                          cancel_event=cancel_event, dedup=dedup,
+                                          profile=profile, cache=cache, tracer=tracer,
+                                          bookmarks=bookmarks, lock=lock)
+    _assign_spans(records)
+    if bookmarks:
+        # Kept per input so that a later splice rewrites the outline without rereading them
+        with lock, fitz.open(output_file) as merged:
+            _split_outline(merged, records)
+    _write_sidecar(output_file, records, profile, dedup, os.path.getsize(output_file),
+                   bookmarks)
+    return page_count
+
+
+def _insert_record(doc, pdf, record, at, bookmarks, on_pages=None):
+    """Insert ``record``'s pages of ``pdf`` at page ``at`` and note its outline rows."""
+    record["count"] = merge_engine.insert_pages(doc, pdf, record["pages"], at, on_pages)
+    if bookmarks:
+        pages = (merge_engine.parse_page_spec(record["pages"], pdf.page_count)
+                 if record["pages"] else None)
+        title = merge_engine.input_title(record["path"]) if bookmarks == "inputs" else None
+        record["outline"] = _record_outline(merge_engine.outline_entries(pdf, 0, pages, title))
+
+
+def _splice(output_file, sidecar, records, opcodes, progress, cancel_event, cache, tracer,
+            bookmarks=None, lock=contextlib.nullcontext()):
+    start = time.perf_counter()
+    old = sidecar["inputs"]
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                records[j]["count"] = old[i]["count"]
+                if bookmarks:
+                    records[j]["outline"] = old[i]["outline"]
+    changed = sum(j2 - j1 for tag, i1, i2, j1, j2 in opcodes if tag != "equal")
+    removed = sum(i2 - i1 for tag, i1, i2, j1, j2 in opcodes if tag != "equal")
+
+    def check_cancel():
+        if cancel_event is not None and cancel_event.is_set():
+            raise merge_engine.MergeCancelled("Merge cancelled")
+
+    def on_pages(copied):
+        # Within a large input: report the pages in the output so far
+        check_cancel()
+        if progress is not None:
+            progress(done, changed, doc.page_count)
+
+    # Edit a copy, so the output stays intact until the update is complete
+    partial = merge_engine.partial_path(output_file)
+    compacted = merge_engine.partial_path(output_file)
+    shutil.copyfile(output_file, partial)
+    try:
+        # Held throughout: splices are short, and the document is edited in place
+        with lock:
+            doc = fitz.open(partial)
+            try:
+                if bookmarks:
+                    # The outline is rewritten below. Unlinking the old one first spares
+                    # delete_pages and set_toc from walking every entry.
+                    doc.xref_set_key(doc.pdf_catalog(), "Outlines", "null")
+                done = 0
+                # Later spans first, so the page numbers of earlier spans stay valid
+                for tag, i1, i2, j1, j2 in reversed(opcodes):
+                    if tag == "equal":
+                        continue
+                    position = old[i1]["start"] if i1 < len(old) else sidecar["page_count"]
+                    end = old[i2 - 1]["start"] + old[i2 - 1]["count"] if i2 > i1 else position
+                    with tracer.span("splice", output=output_file, removed_pages=end - position,
+                                     inputs=j2 - j1) as span:
+                        if end > position:
+                            doc.delete_pages(from_page=position, to_page=end - 1)
+                        for j in range(j1, j2):
+                            check_cancel()
+                            record = records[j]
+                            at = position if position < doc.page_count else -1
+                            if cache is not None:
+                                _insert_record(doc, cache.open(record["path"]), record, at,
+                                               bookmarks, on_pages)
+                            else:
+                                with fitz.open(record["path"]) as pdf:
+                                    _insert_record(doc, pdf, record, at, bookmarks, on_pages)
+                            position += record["count"]
+                            done += 1
+                            if progress is not None:
+                                progress(done, changed, doc.page_count)
+                        span["inserted_pages"] = sum(records[j]["count"] for j in range(j1, j2))
+
+                page_count = doc.page_count
+                _assign_spans(records)
+                if bookmarks:
+                    # Entries of unchanged inputs come from the manifest, shifted to their new spans
+                    merge_engine.apply_outline(doc, _merged_outline(records), tracer)
+                base_size = sidecar["base_size"]
+                appended = os.path.getsize(partial) - base_size
+                with tracer.span("save", output=output_file, pages=page_count,
+                                 profile="fast") as span:
+                    if doc.can_save_incrementally() and appended <= base_size * MAX_APPENDED_RATIO:
+                        # Only the new and changed objects are written
+                        doc.save(partial, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+                        saved = partial
+                    else:
+                        # Drop what earlier updates appended, including the deleted pages
+                        saved = compacted
+                        doc.save(compacted, garbage=1)
+                        base_size = os.path.getsize(compacted)
+                    span["incremental"] = saved == partial
+                    span["bytes"] = os.path.getsize(saved)
+            finally:
+                doc.close()
+        os.replace(saved, output_file)
+    finally:
+        _discard(partial)
+        _discard(compacted)
+
+    _write_sidecar(output_file, records, "fast", False, base_size, bookmarks)
+    logger.info(f"Updated {output_file}: {changed} inputs inserted, {removed} removed "
+                f"of {len(records)} in {time.perf_counter() - start:.2f}s")
+    return page_count
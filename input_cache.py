@@ -0,0 +1,76 @@
+import os
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+
+
+class InputCache:
+    """Size-bounded LRU cache of open source documents.
+
+    Entries are keyed by absolute path and validated against the file's
+    modification time and size, so an input that changes on disk is re-opened
+    instead of served stale. The cache is bounded both by the total on-disk
+    size of the cached files and by the number of open documents (each one
+    holds a file handle). Documents returned by ``open`` belong to the cache
+    and must not be closed by the caller. Not thread-safe: use one cache per
+    thread or process.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=128):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # path -> (signature, document, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(self, pdf_path):
+        """Return an open document for ``pdf_path``, parsing it only on a miss."""
+        key = os.path.abspath(pdf_path)
+        stat = os.stat(key)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] == signature:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            # File changed on disk since it was cached
+            self._discard(key)
+
+        self.misses += 1
+        document = fitz.open(key)
+        self.entries[key] = (signature, document, stat.st_size)
+        self.total_bytes += stat.st_size
+        self._evict(keep=key)
+        return document
+
+    def _discard(self, key):
+        _, document, size = self.entries.pop(key)
+        self.total_bytes -= size
+        document.close()
+
+    def _evict(self, keep):
+        # Drop least recently used entries, but never the one just handed out
+        while len(self.entries) > 1 and (self.total_bytes > self.max_bytes
+                                         or len(self.entries) > self.max_entries):
+            oldest = next(iter(self.entries))
+            if oldest == keep:
+                break
+            self._discard(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        for key in list(self.entries):
+            self._discard(key)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+        }
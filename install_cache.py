@@ -0,0 +1,320 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Everything can be pointed at a local mirror (or a test server) through these
+MIRROR_ENV = "PYTHON_SETUP_MIRROR"
+GET_PIP_ENV = "PYTHON_SETUP_GET_PIP_URL"
+INSTALLER_SHA256_ENV = "PYTHON_SETUP_INSTALLER_SHA256"
+WHEELHOUSE_ENV = "PYTHON_SETUP_WHEELHOUSE"
+CACHE_ENV = "PYTHON_SETUP_CACHE"
+
+DEFAULT_MIRROR = "https://www.python.org/ftp/python"
+DEFAULT_GET_PIP_URL = "https://bootstrap.pypa.io/get-pip.py"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".python_setup", "cache")
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def python_mirror() -> str:
+    return os.environ.get(MIRROR_ENV, DEFAULT_MIRROR).rstrip("/")
+
+
+def get_pip_url() -> str:
+    return os.environ.get(GET_PIP_ENV, DEFAULT_GET_PIP_URL)
+
+
+def cache_dir() -> str:
+    return os.environ.get(CACHE_ENV, DEFAULT_CACHE_DIR)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def timed(label: str, log=None):
+    """Log how long the ``with`` block took, as ``"<label> took 1.23s"``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (log or logger.info)(f"{label} took {time.perf_counter() - start:.2f}s")
+
+
+class ChecksumError(Exception):
+    """A download did not match its expected size or SHA-256."""
+
+
+class DownloadCache:
+    """Content-addressed cache of downloaded files, with resumable downloads.
+
+    Files are stored as ``<dir>/sha256/<ab>/<sha256>`` and an index maps each
+    URL to the hash of what it last returned, so the same installer is
+    downloaded once per machine (or once per fleet, with a shared cache
+    directory). Interrupted downloads are kept as ``<dir>/partial/...`` with
+    the response's ``ETag``/``Last-Modified`` and resumed with an HTTP
+    ``Range`` plus ``If-Range`` request, so a file that changed meanwhile is
+    downloaded whole instead of spliced onto the old part. Every download is checked against the
+    ``Content-Length`` and, when one is given, the expected SHA-256, and a
+    cached file is hashed again before each reuse, so a corrupt or
+    tampered file is fetched afresh instead of installed.
+    """
+
+    def __init__(self, directory: Optional[str] = None, timeout: float = 60):
+        self.directory = directory or cache_dir()
+        self.timeout = timeout
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.hits = 0
+        self.downloads = 0
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        os.makedirs(self.directory, exist_ok=True)
+        partial = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1)
+        os.replace(partial, self.index_path)
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, "sha256", sha256[:2], sha256)
+
+    def _partial_path(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "partial", key)
+
+    def _cached(self, sha256):
+        """Return the stored file for ``sha256`` if it is intact."""
+        path = self.blob_path(sha256)
+        if not os.path.exists(path):
+            return None
+        if file_sha256(path) != sha256:
+            logger.warning(f"Cached file {path} is corrupt; downloading it again")
+            os.remove(path)
+            return None
+        return path
+
+    def fetch(self, url: str, sha256: Optional[str] = None,
+              max_age: Optional[float] = None) -> str:
+        """Return the path of a verified local copy of ``url``.
+
+        With ``sha256``, any cached file with that content is used, whatever
+        URL it came from. Otherwise the file last downloaded from ``url`` is
+        reused, unless it is older than ``max_age`` seconds. ``sha256`` may
+        be given in either case, as python.org publishes some in upper case.
+        """
+        if sha256 is not None:
+            # Blobs are named by the lower-case hex digest
+            sha256 = sha256.strip().lower()
+        index = self._load_index()
+        entry = index.get(url)
+        wanted = sha256 or (entry or {}).get("sha256")
+        fresh = (sha256 is not None or entry is None or max_age is None
+                 or time.time() - entry.get("fetched", 0) < max_age)
+        if wanted and fresh:
+            path = self._cached(wanted)
+            if path is not None:
+                self.hits += 1
+                logger.info(f"Using cached {url} ({os.path.getsize(path) / 1024:.0f} KB)")
+                return path
+
+        with timed(f"Downloading {url}"):
+            path = self._download(url, sha256)
+        self.downloads += 1
+        index = self._load_index()
+        index[url] = {"sha256": os.path.basename(path), "fetched": time.time(),
+                      "bytes": os.path.getsize(path)}
+        self._save_index(index)
+        return path
+
+    def fetch_text(self, url: str, max_age: Optional[float] = None,
+                   encoding: str = "utf-8") -> str:
+        with open(self.fetch(url, max_age=max_age), encoding=encoding, errors="replace") as f:
+            return f.read()
+
+    def _download(self, url, sha256):
+        partial = self._partial_path(url)
+        os.makedirs(os.path.dirname(partial), exist_ok=True)
+        validator = self._resume_validator(url, partial, sha256)
+        offset = os.path.getsize(partial) if validator else 0
+
+        request = urllib.request.Request(url)
+        if offset:
+            # If-Range: the server sends the whole file (200) if it changed since
+            request.add_header("Range", f"bytes={offset}-")
+            request.add_header("If-Range", validator)
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 416 or not offset:
+                raise
+            # Range not satisfiable: the file shrank or changed; start over
+            _discard(partial, partial + ".json")
+            return self._download(url, sha256)
+
+        with response:
+            if response.status == 206 and not self._same_version(response, validator, offset):
+                # The server ignored If-Range and sent part of another version
+                _discard(partial, partial + ".json")
+                return self._download(url, sha256)
+            if response.status == 206:
+                logger.info(f"Resuming {url} at {offset / 1024:.0f} KB")
+                mode = "ab"
+            else:
+                offset, mode = 0, "wb"
+                self._save_validator(partial, response)
+            length = response.headers.get("Content-Length")
+            expected_size = offset + int(length) if length is not None else None
+            with open(partial, mode) as f:
+                for block in iter(lambda: response.read(BLOCK_SIZE), b""):
+                    f.write(block)
+
+        size = os.path.getsize(partial)
+        if expected_size is not None and size != expected_size:
+            # Keep what arrived; the next attempt resumes from there if it can
+            raise ChecksumError(f"Download of {url} incomplete: got {size} of "
+                                f"{expected_size} bytes")
+
+        actual = file_sha256(partial)
+        _discard(partial + ".json")
+        if sha256 is not None and actual != sha256:
+            os.remove(partial)
+            raise ChecksumError(f"Checksum mismatch for {url}: expected {sha256}, got {actual}")
+
+        path = self.blob_path(actual)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(partial, path)
+        return path
+
+    def _resume_validator(self, url, partial, sha256):
+        """Return the ``If-Range`` value to resume ``partial`` with, or ``None`` to start over.
+
+        Resuming joins bytes from two responses, so it needs proof that both
+        came from the same version of the file: a strong ``ETag``, or, when
+        the expected SHA-256 will catch a bad join anyway, ``Last-Modified``.
+        Partial files without such a validator are discarded.
+        """
+        if not os.path.exists(partial):
+            return None
+        try:
+            with open(partial + ".json", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        etag = saved.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        if sha256 is not None and saved.get("last_modified"):
+            return saved["last_modified"]
+        logger.info(f"Discarding partial download of {url}: it cannot be resumed safely")
+        _discard(partial, partial + ".json")
+        return None
+
+    def _save_validator(self, partial, response):
+        saved = {"etag": response.headers.get("ETag"),
+                 "last_modified": response.headers.get("Last-Modified")}
+        with open(partial + ".json", "w", encoding="utf-8") as f:
+            json.dump(saved, f)
+
+    def _same_version(self, response, validator, offset):
+        if not offset or not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+            return False
+        current = response.headers.get("ETag" if validator.startswith('"') else "Last-Modified")
+        return current is None or current == validator
+
+
+def _discard(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def find_wheelhouse(base_dir: str = ".") -> Optional[str]:
+    """Return the wheel directory to install from offline, if there is one.
+
+    ``$PYTHON_SETUP_WHEELHOUSE`` wins; otherwise a ``wheelhouse`` folder
+    next to the requirements is used when it exists.
+    """
+    configured = os.environ.get(WHEELHOUSE_ENV)
+    if configured:
+        return configured
+    candidate = os.path.join(base_dir, "wheelhouse")
+    return candidate if os.path.isdir(candidate) else None
+
+
+def pip_install_command(requirements: str = "requirements.txt",
+                        wheelhouse: Optional[str] = None, user: bool = False,
+                        upgrade_pip: bool = False) -> List[str]:
+    """Build one ``pip install`` command for the requirements (and pip itself).
+
+    With a ``wheelhouse``, pip installs only from that folder and never
+    touches the network. Otherwise wheels are kept in the download cache's
+    ``pip`` folder, so reinstalling the same versions downloads nothing.
+    Upgrading pip and installing the requirements happen in the same run,
+    which saves starting pip and resolving twice.
+    """
+    cmd = [sys.executable, "-m", "pip", "install", "--disable-pip-version-check",
+           "-r", requirements]
+    if wheelhouse:
+        cmd += ["--no-index", "--find-links", wheelhouse]
+    else:
+        cmd += ["--cache-dir", os.path.join(cache_dir(), "pip"), "--prefer-binary"]
+    if upgrade_pip:
+        cmd[4:4] = ["--upgrade", "pip"]
+    if user:
+        cmd.append("--user")
+    return cmd
+
+
+def wheelhouse_command(requirements: str = "requirements.txt",
+                       directory: str = "wheelhouse") -> List[str]:
+    """Command that downloads or builds wheels for the requirements (and pip) into ``directory``.
+
+    Run it once on a connected machine of the same platform and Python
+    version, then ship the folder for offline installs.
+    """
+    return [sys.executable, "-m", "pip", "wheel", "--disable-pip-version-check",
+            "--cache-dir", os.path.join(cache_dir(), "pip"),
+            "-w", directory, "-r", requirements, "pip"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="install_cache",
+        description="Prepare a wheelhouse for offline setup.")
+    parser.add_argument("-r", "--requirements", default="requirements.txt")
+    parser.add_argument("-w", "--wheelhouse", default="wheelhouse",
+                        help="folder to write the wheels to (default wheelhouse)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    with timed(f"Building wheelhouse {args.wheelhouse}"):
+        return subprocess.run(wheelhouse_command(args.requirements, args.wheelhouse)).returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
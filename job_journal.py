@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+import fitz  # PyMuPDF
+
+from merge_engine import MergeJob, MergeResult, run_jobs, split_input
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    output TEXT PRIMARY KEY,
+    inputs TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    pages INTEGER,
+    output_size INTEGER,
+    output_mtime_ns INTEGER,
+    error TEXT,
+    updated REAL
+)
+"""
+
+
+def input_hash(job: MergeJob) -> str:
+    """Fingerprint of a job's inputs: paths, page selections, sizes and mtimes.
+
+    File contents are not read, so checking 50k jobs on restart stays cheap;
+    any rewrite of an input changes its mtime and with it the fingerprint.
+    """
+    digest = hashlib.sha256()
+    for item in job.inputs:
+        path, page_spec = split_input(item)
+        try:
+            stat = os.stat(path)
+            signature = [path, page_spec, stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            signature = [path, page_spec, None, None]
+        digest.update(json.dumps(signature).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class JobJournal:
+    """SQLite record of every output in a batch and how far it got.
+
+    Each output is stored with its inputs, an input fingerprint, its state
+    (``pending``, ``done`` or ``failed``), the number of attempts and, once
+    done, the size and mtime of the file written. Results are committed as
+    they arrive, so a batch killed midway can be restarted with the same
+    journal and only redo what did not finish.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(_SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def completed(self, job: MergeJob) -> Optional[int]:
+        """Return the page count if ``job`` is done with the same inputs and an intact output."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT state, input_hash, pages, output_size, output_mtime_ns "
+                "FROM jobs WHERE output = ?", (os.path.abspath(job.output),)).fetchone()
+        if row is None or row[0] != "done":
+            return None
+        _, recorded_hash, pages, size, mtime_ns = row
+        if recorded_hash != input_hash(job):
+            return None
+        try:
+            stat = os.stat(job.output)
+        except OSError:
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            return None
+        # Opening reads only the xref, so a damaged output fails cheaply here
+        try:
+            with fitz.open(job.output) as doc:
+                return pages if doc.page_count == pages else None
+        except Exception:
+            return None
+
+    def begin(self, jobs: Iterable[MergeJob]):
+        """Record ``jobs`` as pending (keeping attempt counts) in one transaction."""
+        now = time.time()
+        rows = [(os.path.abspath(job.output), json.dumps(job.inputs), input_hash(job), now)
+                for job in jobs]
+        with self.lock:
+            self.db.executemany(
+                "INSERT INTO jobs (output, inputs, input_hash, state, updated) "
+                "VALUES (?, ?, ?, 'pending', ?) "
+                "ON CONFLICT(output) DO UPDATE SET inputs = excluded.inputs, "
+                "input_hash = excluded.input_hash, state = 'pending', "
+                "error = NULL, updated = excluded.updated", rows)
+            self.db.commit()
+
+    def record(self, result: MergeResult):
+        """Store the outcome of one attempt at ``result.job``."""
+        job = result.job
+        size = mtime_ns = None
+        if result.ok:
+            stat = os.stat(job.output)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, pages = ?, "
+                "output_size = ?, output_mtime_ns = ?, error = ?, updated = ? "
+                "WHERE output = ?",
+                ("done" if result.ok else "failed", result.pages, size, mtime_ns,
+                 result.error, time.time(), os.path.abspath(job.output)))
+            self.db.commit()
+
+    def counts(self) -> dict:
+        with self.lock:
+            return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+
+def run_journaled(jobs: List[MergeJob], journal: JobJournal, retries: int = 2,
+                  retry_delay: float = 1.0, **run_options) -> List[Optional[MergeResult]]:
+    """Run ``jobs`` through ``run_jobs``, skipping work ``journal`` shows as done.
+
+    Outputs already complete with unchanged inputs are not merged again;
+    their result has the recorded page count and no elapsed time. Failed
+    jobs are retried up to ``retries`` times, waiting ``retry_delay``
+    seconds before the first retry and twice as long before each further
+    one (``fail_fast`` turns retries off). Every attempt is recorded as soon
+    as it finishes.
+    """
+    results: List[Optional[MergeResult]] = [None] * len(jobs)
+    todo = []
+    for index, job in enumerate(jobs):
+        pages = journal.completed(job)
+        if pages is None:
+            todo.append(index)
+        else:
+            results[index] = MergeResult(job, pages=pages)
+    if len(todo) < len(jobs):
+        logger.info(f"Journal: skipping {len(jobs) - len(todo)} outputs already complete")
+    journal.begin(jobs[i] for i in todo)
+
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = retry_delay * 2 ** (attempt - 1)
+            logger.info(f"Retrying {len(todo)} failed jobs in {delay:.1f}s "
+                        f"(attempt {attempt + 1} of {retries + 1})")
+            time.sleep(delay)
+        attempt_results = run_jobs([jobs[i] for i in todo], on_result=journal.record,
+                                   **run_options)
+        for index, result in zip(todo, attempt_results):
+            results[index] = result
+        todo = [i for i, result in zip(todo, attempt_results)
+                if result is not None and not result.ok]
+        if not todo or run_options.get("fail_fast"):
+            break
+    return results
@@ -12,6 +12,10 @@ import shutil
 from pathlib import Path
 import ctypes
 import threading
+import time
+
+from env_cache import EnvironmentCache, pip_version
+from install_cache import find_wheelhouse, pip_install_command, timed
 
 class ProjectLauncher:
     def __init__(self):
@@ -92,13 +96,17 @@ class ProjectLauncher:
         self.logger = logging.getLogger(__name__)
         
     def update_system_info(self):
-        """Update the system information display."""
+        """Update the system information display without blocking the window."""
         os_info = f"OS: {platform.system()} {platform.release()}"
         python_version = f"Python: {platform.python_version()}"
-        pip_version = f"Pip: {self.get_pip_version()}"
+        self.system_info.config(text=f"{os_info}\n{python_version}\nPip: checking...")
         
-        system_info = f"{os_info}\n{python_version}\n{pip_version}"
-        self.system_info.config(text=system_info)
+        def load_pip_version():
+            pip_info = f"Pip: {self.get_pip_version()}"
+            system_info = f"{os_info}\n{python_version}\n{pip_info}"
+            self.root.after(0, lambda: self.system_info.config(text=system_info))
+            
+        threading.Thread(target=load_pip_version, daemon=True).start()
         
     def log_and_update(self, message):
         self.logger.info(message)
@@ -106,21 +114,12 @@ class ProjectLauncher:
         self.root.after(0, self.status_text.see, tk.END)
         
     def check_pip(self):
-        try:
-            subprocess.run([sys.executable, "-m", "pip", "--version"], 
-                         capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
+        return pip_version() is not None
             
     def get_pip_version(self):
-        """Get pip version without the full path."""
+        """Get pip version from the installed package metadata (no pip subprocess)."""
         try:
-            result = subprocess.run([sys.executable, '-m', 'pip', '--version'], 
-                                 capture_output=True, text=True)
-            # Extract just the version number from pip output
-            version = result.stdout.split()[1]
-            return version
+            return pip_version() or "Not installed"
         except Exception as e:
             logging.error(f"Error getting pip version: {e}")
             return "Unknown"
@@ -128,10 +127,16 @@ class ProjectLauncher:
     def ensure_python_environment(self):
         """Ensure Python and pip are installed and configured"""
         try:
+            # Nothing to do if the interpreter, requirements and packages are as last set up
+            if EnvironmentCache().is_current():
+                self.log_and_update("Python environment unchanged since last setup. Skipping setup.")
+                return
+                
             # Import and run python_setup if it exists
             if os.path.exists("python_setup.py"):
                 self.log_and_update("Setting up Python environment...")
-                subprocess.run([sys.executable, "python_setup.py"], check=True)
+                with timed("Python environment setup", self.log_and_update):
+                    subprocess.run([sys.executable, "python_setup.py"], check=True)
             else:
                 self.log_and_update("Warning: python_setup.py not found. Skipping environment setup.")
         except Exception as e:
@@ -141,11 +146,15 @@ class ProjectLauncher:
     def install_requirements(self):
         """Install project dependencies"""
         try:
-            self.log_and_update("Installing requirements...")
-            cmd = [sys.executable, "-m", "pip", "install", "-r", "requirements.txt"]
-            if not self.is_admin:
-                cmd.append("--user")
-            subprocess.run(cmd, check=True)
+            # Installs offline from the wheelhouse when there is one
+            wheelhouse = find_wheelhouse()
+            if wheelhouse:
+                self.log_and_update(f"Installing requirements offline from {wheelhouse}...")
+            else:
+                self.log_and_update("Installing requirements...")
+            cmd = pip_install_command(wheelhouse=wheelhouse, user=not self.is_admin)
+            with timed("Requirements installation", self.log_and_update):
+                subprocess.run(cmd, check=True)
             self.log_and_update("Requirements installed successfully")
         except subprocess.CalledProcessError as e:
             self.log_and_update(f"Error installing requirements: {str(e)}")
@@ -155,7 +164,11 @@ class ProjectLauncher:
         """Execute a Python script"""
         try:
             self.log_and_update(f"Executing {script_path}...")
-            if os.path.exists(script_path):
+            if script_path == "pdf_merger.py":
+                # Hosted in this process; wait for its window to close like a script run
+                self.run_pdf_merger_window()
+                self.log_and_update(f"Successfully executed {script_path}")
+            elif os.path.exists(script_path):
                 subprocess.run([sys.executable, script_path], check=True)
                 self.log_and_update(f"Successfully executed {script_path}")
             else:
@@ -164,14 +177,57 @@ class ProjectLauncher:
             self.log_and_update(f"Error executing {script_path}: {str(e)}")
             raise
             
+    def open_pdf_merger(self):
+        """Open the PDF merger as a window of this launcher and return the window.
+        
+        No new interpreter is started and PyMuPDF is only loaded in the
+        background once the window is up, so the window opens in a fraction
+        of a second; the time taken is logged.
+        """
+        started = time.perf_counter()
+        import pdf_merger
+        
+        window = tk.Toplevel(self.root)
+        app = pdf_merger.PDFMergerApp(window)
+        app.report_ready(started)
+        return window
+        
+    def run_pdf_merger_window(self):
+        """Open the PDF merger from a worker thread and block until it is closed"""
+        closed = threading.Event()
+        errors = []
+        
+        def open_window():
+            try:
+                window = self.open_pdf_merger()
+            except Exception as e:
+                errors.append(e)
+                closed.set()
+                return
+            window.bind("<Destroy>", lambda event: closed.set() if event.widget is window else None,
+                        add="+")
+            
+        self.root.after(0, open_window)
+        closed.wait()
+        if errors:
+            raise errors[0]
+            
     def launch_pdf_merger(self):
         """Launch the PDF merger tool"""
         try:
-            if os.path.exists("pdf_merger.py"):
-                subprocess.Popen([sys.executable, "pdf_merger.py"])
-            else:
-                self.log_and_update("Error: PDF merger tool not found")
-                messagebox.showerror("Error", "PDF merger tool not found")
+            self.open_pdf_merger()
+        except ImportError as e:
+            # Fall back to a separate interpreter if the merger cannot be loaded here
+            self.log_and_update(f"Cannot open PDF merger in the launcher ({e}), starting it separately")
+            try:
+                if os.path.exists("pdf_merger.py"):
+                    subprocess.Popen([sys.executable, "pdf_merger.py"])
+                else:
+                    self.log_and_update("Error: PDF merger tool not found")
+                    messagebox.showerror("Error", "PDF merger tool not found")
+            except Exception as e:
+                self.log_and_update(f"Error launching PDF merger: {str(e)}")
+                messagebox.showerror("Error", f"Failed to launch PDF merger: {str(e)}")
         except Exception as e:
             self.log_and_update(f"Error launching PDF merger: {str(e)}")
             messagebox.showerror("Error", f"Failed to launch PDF merger: {str(e)}")
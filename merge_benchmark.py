@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+import merge_engine
+
+
+def make_corpus(directory, count, pages_per_file=3):
+    """Write ``count`` small synthetic PDFs into ``directory`` and return their paths."""
+    paths = []
+    for i in range(count):
+        doc = fitz.open()
+        for page_no in range(pages_per_file):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Synthetic input {i}, page {page_no + 1}", fontsize=14)
+        path = os.path.join(directory, f"input-{i:06d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def make_image_corpus(directory, count, pages_per_file=5, image_side=1000):
+    """Write ``count`` PDFs whose pages each hold an incompressible RGB image."""
+    paths = []
+    for i in range(count):
+        doc = fitz.open()
+        for _ in range(pages_per_file):
+            samples = os.urandom(image_side * image_side * 3)
+            pixmap = fitz.Pixmap(fitz.csRGB, image_side, image_side, samples, 0)
+            page = doc.new_page()
+            page.insert_image(page.rect, pixmap=pixmap)
+        path = os.path.join(directory, f"image-{i:06d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def make_font_corpus(directory, count, pages_per_file=2):
+    """Write ``count`` PDFs that each embed their own copies of several fonts."""
+    fonts = {name: fitz.Font(name).buffer for name in ("helv", "tiro", "cour", "hebo", "tibo", "cobo")}
+    paths = []
+    for i in range(count):
+        doc = fitz.open()
+        for page_no in range(pages_per_file):
+            page = doc.new_page()
+            y = 72
+            for name, buffer in fonts.items():
+                page.insert_font(fontname=f"F{name}", fontbuffer=buffer)
+                page.insert_text((72, y), f"Input {i}, page {page_no + 1} in {name}", fontname=f"F{name}")
+                y += 24
+        path = os.path.join(directory, f"font-{i:06d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+# Synthetic corpora for the benchmark suite: name -> (description, builder(directory, scale))
+CORPORA = {
+    "tiny": ("many one-page text files",
+             lambda d, scale: make_corpus(d, max(int(2000 * scale), 2), pages_per_file=1)),
+    "huge": ("a few files with thousands of pages",
+             lambda d, scale: make_corpus(d, 3, pages_per_file=max(int(2000 * scale), 2))),
+    "image": ("image-heavy pages with incompressible images",
+              lambda d, scale: make_image_corpus(d, max(int(40 * scale), 2), image_side=600)),
+    "font": ("pages embedding six fonts each",
+             lambda d, scale: make_font_corpus(d, max(int(200 * scale), 2))),
+}
+
+
+def build_corpora(root, scale, names):
+    """Generate each named corpus in its own folder; 'mixed' interleaves all others."""
+    wanted = set(CORPORA) if "mixed" in names else set(names)
+    corpora = {}
+    for name, (_, builder) in CORPORA.items():
+        if name in wanted:
+            directory = os.path.join(root, name)
+            os.makedirs(directory, exist_ok=True)
+            corpora[name] = builder(directory, scale)
+    if "mixed" in names:
+        # Seeded shuffle so every run merges the same order
+        mixed = [path for name in CORPORA for path in corpora[name]]
+        random.Random(0).shuffle(mixed)
+        corpora["mixed"] = mixed
+    return corpora
+
+
+def measure_merge(inputs, output, engine_args=""):
+    """Merge ``inputs`` in a fresh engine process and return its measurements.
+
+    The merge time is taken inside the child so interpreter start-up is not
+    counted; peak RSS comes from ``os.wait4`` and is ``None`` where that is
+    unavailable (Windows).
+    """
+    manifest = output + ".json"
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump([{"output": output, "inputs": inputs}], f)
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                "--run-manifest", manifest, "--engine-args", engine_args],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    stdout = process.stdout.read()
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peak_rss_mb = usage.ru_maxrss / 1024
+    else:
+        process.wait()
+        peak_rss_mb = None
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark merge failed for {output}")
+    return json.loads(stdout)["seconds"], peak_rss_mb
+
+
+def engine_options(engine_args):
+    """Parse ``--engine-args`` with the merge engine's parser into ``run_jobs`` options.
+
+    Every run option is forwarded, so a run labelled ``--tree 64 -j 4``
+    measures the tree merge. Options the benchmark cannot apply (inputs,
+    outputs, the service, journals, profilers) are rejected rather than
+    ignored, as are combinations the merge engine itself refuses.
+    """
+    parser = merge_engine.build_parser()
+    args = parser.parse_args(shlex.split(engine_args))
+    unsupported = [flag for flag, given in (
+        ("input files", args.inputs), ("--output", args.output),
+        ("--manifest", args.manifest), ("--include", args.include),
+        ("--exclude", args.exclude), ("--preflight", args.preflight),
+        ("--journal", args.journal), ("--server", args.server != parser.get_default("server")),
+        ("--cprofile", args.cprofile), ("--tracemalloc", args.tracemalloc)) if given]
+    if unsupported:
+        parser.error(f"--engine-args cannot include {', '.join(unsupported)}; "
+                     f"the benchmark supplies the inputs and runs the merge locally")
+    args.server = None  # $PDF_MERGER_SERVER is for the command line, not the benchmark
+    merge_engine.check_args(parser, args)
+    return merge_engine.run_options(args)
+
+
+def run_manifest(manifest, engine_args):
+    """Child side of ``measure_merge``: run the jobs and print their merge time."""
+    options = engine_options(engine_args)
+    jobs = merge_engine.load_manifest(manifest)
+    start = time.perf_counter()
+    results = merge_engine.run_jobs(jobs, **options)
+    elapsed = time.perf_counter() - start
+    if not all(r is not None and r.ok for r in results):
+        sys.exit(1)
+    print(json.dumps({"seconds": elapsed}))
+
+
+def run_suite(names, scale, engine_args="", corpus_dir=None):
+    """Run the merge engine over each synthetic corpus and return the results."""
+    work_dir = corpus_dir or tempfile.mkdtemp(prefix="merge-bench-")
+    try:
+        corpora = build_corpora(work_dir, scale, names)
+        results = {}
+        for name in names:
+            inputs = corpora[name]
+            pages = 0
+            for path in inputs:
+                with fitz.open(path) as doc:
+                    pages += doc.page_count
+            input_mb = sum(os.path.getsize(p) for p in inputs) / (1024 * 1024)
+            output = os.path.join(work_dir, f"{name}-merged.pdf")
+            seconds, peak_rss_mb = measure_merge(inputs, output, engine_args)
+            results[name] = {
+                "inputs": len(inputs),
+                "pages": pages,
+                "input_mb": round(input_mb, 2),
+                "seconds": round(seconds, 4),
+                "pages_per_s": round(pages / seconds, 1) if seconds else None,
+                "mb_per_s": round(input_mb / seconds, 2) if seconds else None,
+                "peak_rss_mb": round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+                "output_mb": round(os.path.getsize(output) / (1024 * 1024), 2),
+            }
+            os.remove(output)
+        return {
+            "environment": {
+                "python": platform.python_version(),
+                "pymupdf": fitz.VersionBind,
+                "platform": platform.platform(),
+                "engine_args": engine_args,
+                "scale": scale,
+            },
+            "results": results,
+        }
+    finally:
+        if corpus_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# Metric -> True if larger is better; compared against the baseline
+SUITE_METRICS = {"pages_per_s": True, "mb_per_s": True, "peak_rss_mb": False, "output_mb": False}
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Print per-metric changes against ``baseline`` and return the regressions."""
+    regressions = []
+    print(f"{'corpus':>8} {'metric':>12} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in SUITE_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{name:>8} {metric:>12} {old:>10} {new:>10} {change:>+7.1%}{flag}")
+            if flag:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def print_suite(report):
+    print(f"{'corpus':>8} {'inputs':>7} {'pages':>7} {'in MB':>8} {'time (s)':>9} "
+          f"{'pages/s':>9} {'MB/s':>7} {'RSS MB':>7} {'out MB':>7}")
+    for name, r in report["results"].items():
+        rss = "n/a" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.0f}"
+        print(f"{name:>8} {r['inputs']:>7} {r['pages']:>7} {r['input_mb']:>8.1f} {r['seconds']:>9.2f} "
+              f"{r['pages_per_s']:>9.0f} {r['mb_per_s']:>7.1f} {rss:>7} {r['output_mb']:>7.1f}")
+
+
+def bench_memory(file_counts, budget_mb):
+    """Compare peak RSS of the in-memory merge and the low-memory mode."""
+    print(f"{'input MB':>9} {'mode':>12} {'time (s)':>9} {'peak RSS (MB)':>14}")
+    for count in file_counts:
+        work_dir = tempfile.mkdtemp(prefix="merge-bench-")
+        try:
+            inputs = make_image_corpus(work_dir, count)
+            input_mb = sum(os.path.getsize(p) for p in inputs) / (1024 * 1024)
+            output = os.path.join(work_dir, "merged.pdf")
+            for mode, engine_args in (("in-memory", ""),
+                                      (f"budget {budget_mb}", f"--memory-budget {budget_mb}")):
+                elapsed, rss = measure_merge(inputs, output, engine_args)
+                print(f"{input_mb:>9.0f} {mode:>12} {elapsed:>9.2f} {rss:>14.0f}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_profiles(file_count):
+    """Tabulate merge time and output size for each save profile."""
+    print(f"{'corpus':>8} {'profile':>11} {'time (s)':>9} {'output KB':>10}")
+    work_dir = tempfile.mkdtemp(prefix="merge-bench-")
+    try:
+        corpora = {
+            "text": make_corpus(work_dir, file_count),
+            "image": make_image_corpus(work_dir, max(file_count // 50, 1), image_side=400),
+        }
+        for name, inputs in corpora.items():
+            for profile in merge_engine.SAVE_PROFILES:
+                output = os.path.join(work_dir, f"{name}-{profile}.pdf")
+                elapsed = time_call(merge_engine.merge_files, inputs, output, profile=profile)
+                print(f"{name:>8} {profile:>11} {elapsed:>9.2f} {os.path.getsize(output) / 1024:>10.0f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_tree(sizes, pages_per_file, workers, chunk_size):
+    """Compare the linear merge loop with tree_merge for each input count."""
+    print(f"{'inputs':>8} {'linear (s)':>12} {'tree (s)':>10} {'speedup':>8}")
+    for size in sizes:
+        work_dir = tempfile.mkdtemp(prefix="merge-bench-")
+        try:
+            inputs = make_corpus(work_dir, size, pages_per_file)
+            linear = time_call(merge_engine.merge_files, inputs,
+                               os.path.join(work_dir, "linear.pdf"))
+            tree = time_call(merge_engine.tree_merge, inputs,
+                             os.path.join(work_dir, "tree.pdf"), chunk_size, workers)
+            print(f"{size:>8} {linear:>12.2f} {tree:>10.2f} {linear / tree:>7.2f}x")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PDF merge engine.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000],
+                        help="input counts to benchmark")
+    parser.add_argument("--pages-per-file", type=int, default=3)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--memory", type=int, nargs="+", metavar="FILES",
+                        help="run the peak-RSS benchmark with these counts of "
+                             "~15 MB image-heavy inputs instead")
+    parser.add_argument("--memory-budget", type=int, default=64, metavar="MB")
+    parser.add_argument("--profiles", type=int, metavar="FILES",
+                        help="tabulate time and size per save profile for this many inputs")
+    parser.add_argument("--suite", nargs="*", metavar="CORPUS",
+                        choices=list(CORPORA) + ["mixed"],
+                        help="run the benchmark suite on these synthetic corpora "
+                             f"(default: all of {', '.join(CORPORA)}, mixed)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply corpus sizes (e.g. 0.1 for a quick run)")
+    parser.add_argument("--corpus-dir", help="generate corpora here and keep them")
+    parser.add_argument("--json", metavar="PATH", help="write suite results as JSON")
+    parser.add_argument("--baseline", metavar="PATH",
+                        help="compare suite results with a saved JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed relative regression against the baseline (default 0.10)")
+    parser.add_argument("--engine-args", default="",
+                        help="extra merge engine options for the suite, e.g. '--profile compact'")
+    parser.add_argument("--run-manifest", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_manifest:
+        run_manifest(args.run_manifest, args.engine_args)
+        return 0
+    # Fail here rather than in every child process, whose errors are not shown
+    engine_options(args.engine_args)
+
+    if args.suite is not None:
+        names = args.suite or list(CORPORA) + ["mixed"]
+        report = run_suite(names, args.scale, args.engine_args, args.corpus_dir)
+        print_suite(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = compare_to_baseline(report, baseline, args.tolerance)
+            if regressions:
+                print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+                return 1
+        return 0
+
+    if args.profiles:
+        bench_profiles(args.profiles)
+    elif args.memory:
+        bench_memory(args.memory, args.memory_budget)
+    else:
+        bench_tree(args.sizes, args.pages_per_file, args.workers, args.chunk_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1130 @@
+import argparse
+import contextlib
+import csv
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List, Optional
+
+import fitz  # PyMuPDF
+
+from dir_scanner import DEFAULT_INCLUDE, DirectoryScanner
+from input_cache import InputCache
+from merge_trace import NULL_TRACER, get_tracer
+from pdf_sources import is_source, parse_source, source_name
+
+logger = logging.getLogger(__name__)
+
+# Named Document.save() option sets, from lowest latency to smallest/most portable
+SAVE_PROFILES = {
+    "fast": {},
+    "compact": {"garbage": 4, "deflate": True},
+    "linearized": {"garbage": 4, "deflate": True, "linear": True},
+}
+
+# How merge_files builds the output outline: an entry per input with its
+# outline nested under it, or the inputs' outlines only
+BOOKMARK_MODES = ("inputs", "outlines")
+
+# Pages copied per insert_pdf call when a caller follows progress within an
+# input, so large inputs report progress and can be cancelled part way
+PAGE_CHUNK = 100
+
+# Object streams need a newer PyMuPDF than the pinned one; use them when present
+if "use_objstms" in inspect.signature(fitz.Document.save).parameters:
+    SAVE_PROFILES["compact"]["use_objstms"] = True
+
+
+class MergeCancelled(Exception):
+    """Raised when a merge is cancelled through its cancel event."""
+
+
+class MergeJob:
+    """One output document built from an ordered list of input PDFs.
+
+    Each input is either a path or a ``(path, page_spec)`` pair; see
+    ``parse_page_spec`` for the page selection syntax. Paths may be
+    ``pdf_sources`` buffers or ZIP members, and ``output`` a writable binary
+    stream for jobs run in this process.
+    """
+
+    def __init__(self, output: str, inputs: List):
+        self.output = output
+        self.inputs = list(inputs)
+
+    def __repr__(self):
+        return f"MergeJob({self.output!r}, {len(self.inputs)} inputs)"
+
+
+class MergeResult:
+    """Outcome of a single merge job."""
+
+    def __init__(self, job: MergeJob, pages: int = 0, elapsed: float = 0.0,
+                 error: Optional[str] = None, cache_hits: int = 0, cache_misses: int = 0):
+        self.job = job
+        self.pages = pages
+        self.elapsed = elapsed
+        self.error = error
+        self.cache_hits = cache_hits
+        self.cache_misses = cache_misses
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+_PAGE_TERM = re.compile(r"^(?:(?P<start>\d+)?(?P<dash>-)(?P<end>\d+)?|(?P<page>\d+)"
+                        r"|last\s*(?P<last>\d+)|(?P<parity>odd|even))$", re.IGNORECASE)
+
+
+def _page_terms(spec: str):
+    terms = []
+    for term in spec.split(","):
+        term = term.strip()
+        match = _PAGE_TERM.match(term)
+        if not term or not match or (match.group("dash") and not (match.group("start") or match.group("end"))):
+            raise ValueError(f"Invalid page selection {term!r} in {spec!r}")
+        terms.append(match)
+    return terms
+
+
+def validate_page_spec(spec: str):
+    """Raise ``ValueError`` if ``spec`` is not a valid page selection."""
+    _page_terms(spec)
+
+
+def parse_page_spec(spec: str, page_count: int) -> List[int]:
+    """Return the 0-based page numbers selected by ``spec``.
+
+    ``spec`` is a comma-separated list of 1-based terms: ``5``, ``2-7``,
+    ``9-`` (to the end), ``-3`` (up to page 3), ``last 4``, ``odd`` and
+    ``even``. Pages come out in the order written, and a range whose start
+    is after its end runs backwards.
+    """
+    pages = []
+    for match in _page_terms(spec):
+        if match.group("page"):
+            start = end = int(match.group("page"))
+        elif match.group("dash"):
+            start = int(match.group("start") or 1)
+            end = int(match.group("end") or page_count)
+        elif match.group("last"):
+            start = max(page_count - int(match.group("last")) + 1, 1)
+            end = page_count
+        else:
+            first = 1 if match.group("parity").lower() == "odd" else 2
+            pages.extend(range(first - 1, page_count, 2))
+            continue
+        for number in (start, end):
+            if not 1 <= number <= page_count:
+                raise ValueError(f"Page {number} out of range 1-{page_count} in {spec!r}")
+        step = 1 if end >= start else -1
+        pages.extend(range(start - 1, end - 1 + step, step))
+    return pages
+
+
+def page_runs(pages: List[int]):
+    """Collapse page numbers into ``(from_page, to_page)`` runs for ``insert_pdf``.
+
+    Runs may be descending (``from_page > to_page``), which ``insert_pdf``
+    copies in reverse.
+    """
+    runs = []
+    for page in pages:
+        if runs:
+            start, end = runs[-1]
+            if start == end and abs(page - end) == 1:
+                runs[-1][1] = page
+                continue
+            if start != end and page - end == (1 if end > start else -1):
+                runs[-1][1] = page
+                continue
+        runs.append([page, page])
+    return [tuple(run) for run in runs]
+
+
+def split_input(item):
+    """Return ``(path, page_spec)`` for a path or ``(path, page_spec)`` input.
+
+    The path may also be a ``pdf_sources.PdfSource`` (a buffer or ZIP member).
+    """
+    if isinstance(item, (tuple, list)):
+        return item[0], item[1] or None
+    return item, None
+
+
+def _check_inputs_exist(inputs):
+    for item in inputs:
+        pdf_path = split_input(item)[0]
+        if not is_source(pdf_path) and not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"File not found: {pdf_path}")
+
+
+def input_size(pdf_path) -> int:
+    return pdf_path.size if is_source(pdf_path) else os.path.getsize(pdf_path)
+
+
+def open_input(pdf_path):
+    """Open a path or ``PdfSource``; sources are read from memory."""
+    return pdf_path.open() if is_source(pdf_path) else fitz.open(pdf_path)
+
+
+def output_name(output) -> str:
+    """Return a printable name for an output path or writable binary stream."""
+    return output if isinstance(output, str) else getattr(output, "name", "<stream>")
+
+
+def insert_pages(merged_pdf, pdf, page_spec=None, start_at: int = -1, on_pages=None) -> int:
+    """Copy the pages of ``pdf`` selected by ``page_spec`` (all if ``None``).
+
+    Pages are appended, or inserted before page ``start_at`` of
+    ``merged_pdf`` when it is not negative. Returns the number of pages
+    copied. ``on_pages`` is as for ``insert_runs``.
+    """
+    if not page_spec and (on_pages is None or pdf.page_count <= PAGE_CHUNK):
+        merged_pdf.insert_pdf(pdf, start_at=start_at)
+        if on_pages is not None:
+            on_pages(pdf.page_count)
+        return pdf.page_count
+    runs = (page_runs(parse_page_spec(page_spec, pdf.page_count)) if page_spec
+            else [(0, pdf.page_count - 1)])
+    return insert_runs(merged_pdf, pdf, runs, start_at, on_pages)
+
+
+def _page_chunks(from_page, to_page):
+    step = 1 if to_page >= from_page else -1
+    for first in range(from_page, to_page + step, step * PAGE_CHUNK):
+        last = first + step * (PAGE_CHUNK - 1)
+        yield first, (min(last, to_page) if step > 0 else max(last, to_page))
+
+
+def insert_runs(merged_pdf, pdf, runs, start_at: int = -1, on_pages=None) -> int:
+    """Copy ``(from_page, to_page)`` runs of ``pdf`` (see ``page_runs``); see ``insert_pages``.
+
+    With ``on_pages``, runs are copied ``PAGE_CHUNK`` pages at a time and
+    ``on_pages(copied)`` is called after each piece with the number of pages
+    copied so far; it may raise (``MergeCancelled``) to stop part way.
+    """
+    copied = 0
+    for i, (from_page, to_page) in enumerate(runs):
+        first_at = start_at + copied if start_at >= 0 else merged_pdf.page_count
+        pieces = list(_page_chunks(from_page, to_page)) if on_pages is not None else [(from_page, to_page)]
+        for j, (first, last) in enumerate(pieces):
+            # final=0 keeps the graft map, so resources shared by runs are copied once.
+            # Links are added per run below, so those between pieces are kept.
+            merged_pdf.insert_pdf(pdf, from_page=first, to_page=last,
+                                  start_at=start_at + copied if start_at >= 0 else -1,
+                                  links=len(pieces) == 1,
+                                  final=int(i == len(runs) - 1 and j == len(pieces) - 1))
+            copied += abs(last - first) + 1
+            if on_pages is not None:
+                on_pages(copied)
+        if len(pieces) > 1:
+            fitz.utils.do_links(merged_pdf, pdf, from_page=from_page, to_page=to_page,
+                                start_at=first_at)
+    return copied
+
+
+def input_title(pdf_path) -> str:
+    """Return the bookmark title for an input: its file name without extension."""
+    return os.path.splitext(os.path.basename(source_name(pdf_path)))[0]
+
+
+def outline_entries(pdf, offset: int, pages: Optional[List[int]] = None,
+                    title: Optional[str] = None, outline: Optional[List[tuple]] = None) -> List[list]:
+    """Return ``set_toc`` rows for the outline of ``pdf`` once copied into another document.
+
+    ``offset`` is the 0-based output page where the copy starts and
+    ``pages`` the source pages copied, in output order (all if ``None``).
+    With ``title``, a level-1 row for the input leads and the source outline
+    is nested under it. Rows pointing at pages that were not copied are
+    dropped and their children moved up, so the hierarchy stays valid.
+    The work is linear in the outline size, so rows for thousands of inputs
+    can be collected and applied with a single ``set_toc``. Pass
+    ``outline`` (from ``read_outline``) to reuse one reading of the source
+    for several copies.
+    """
+    rows = []
+    depth = 0
+    if title is not None:
+        rows.append([1, title, offset + 1])
+        depth = 1
+    if outline is None:
+        outline = read_outline(pdf)
+    if not outline:
+        return rows
+
+    page_count, position = pdf.page_count, {}
+    if pages is not None:
+        # A page copied more than once is bookmarked at its first copy
+        page_count = 0
+        for i, page in enumerate(pages):
+            position.setdefault(page, offset + i)
+
+    last_level = depth
+    for level, text, page, dest in outline:
+        if page < 0:
+            target = -1
+        elif page < page_count:
+            target = offset + page + 1
+        elif page in position:
+            target = position[page] + 1
+        else:
+            continue
+        level = min(level + depth, last_level + 1)
+        last_level = level
+        rows.append([level, text, target, dest])
+    return rows
+
+
+def read_outline(pdf) -> List[tuple]:
+    """Return the outline of ``pdf`` as ``(level, title, 0-based page, dest)`` tuples.
+
+    ``page`` is -1 for entries without a destination in the document.
+    Target positions and web links are kept; colours and styles are not.
+    The outline tree is walked directly rather than through
+    ``get_toc(simple=False)``, which resolves every destination again and
+    is many times slower.
+    """
+    entries = []
+    stack = [(pdf.outline, 1)]
+    while stack:
+        item, level = stack.pop()
+        if item is None:
+            continue
+        # Depth first: this item, its children, then its next sibling
+        stack.append((item.next, level))
+        stack.append((item.down, level + 1))
+
+        if item.page < 0:
+            # A web link, another file or nothing
+            dest = ({"kind": fitz.LINK_URI, "uri": item.uri}
+                    if item.is_external and item.uri else {"kind": fitz.LINK_NONE})
+        else:
+            dest = {"kind": fitz.LINK_GOTO}
+            if item.y == item.y:  # NaN when the destination has no position
+                dest["to"] = fitz.Point(item.x if item.x == item.x else 0, item.y)
+        entries.append((level, item.title, item.page, dest))
+    return entries
+
+
+def apply_outline(doc, rows, tracer=NULL_TRACER):
+    """Replace the outline of ``doc`` with ``set_toc`` rows in one call."""
+    # Only the top level starts expanded, however many entries there are
+    with tracer.span("set_toc", entries=len(rows)):
+        doc.set_toc(rows, collapse=1)
+
+
+def find_duplicate_streams(doc):
+    """Return ``(count, bytes)`` of stream objects that duplicate an earlier one.
+
+    Streams are compared by a hash of their object dictionary and raw
+    (still compressed) data, which is what ``save(garbage=4)`` collapses.
+    """
+    seen = set()
+    duplicates = 0
+    duplicate_bytes = 0
+    for xref in range(1, doc.xref_length()):
+        if not doc.xref_is_stream(xref):
+            continue
+        raw = doc.xref_stream_raw(xref)
+        digest = hashlib.sha256(doc.xref_object(xref, compressed=True).encode() + b"\0" + raw).digest()
+        if digest in seen:
+            duplicates += 1
+            duplicate_bytes += len(raw)
+        else:
+            seen.add(digest)
+    return duplicates, duplicate_bytes
+
+
+def save_options(profile: str = "fast", dedup: bool = False) -> dict:
+    """Return the ``Document.save`` keyword arguments for a profile."""
+    if profile not in SAVE_PROFILES:
+        raise ValueError(f"Unknown save profile {profile!r}; "
+                         f"choose from {', '.join(SAVE_PROFILES)}")
+    options = dict(SAVE_PROFILES[profile])
+    if dedup:
+        # garbage=4 merges duplicate objects, comparing stream contents too
+        options["garbage"] = 4
+    return options
+
+
+def partial_path(output_file: str) -> str:
+    """Return a unique temporary path next to ``output_file``.
+
+    Outputs are written there and renamed into place once complete, so a
+    file under the final name is never a partial one. The rename stays on
+    one file system because the temporary file is in the same directory.
+    """
+    directory, name = os.path.split(os.path.abspath(output_file))
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.part")
+
+
+def _discard(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def merge_files(inputs: List, output_file: str, progress=None,
+                cancel_event=None, dedup: bool = False, profile: str = "fast",
+                cache: Optional[InputCache] = None, tracer=NULL_TRACER,
+                bookmarks: Optional[str] = None, lock=None) -> int:
+    """Merge ``inputs`` in order into ``output_file`` and return the page count.
+
+    ``progress`` is called as ``progress(files_done, total_files, pages_done)``
+    after each input, and within an input every ``PAGE_CHUNK`` pages (with
+    ``files_done`` not counting it yet). If ``cancel_event`` (a
+    ``threading.Event``) gets set, the merge stops at the next of these
+    points with ``MergeCancelled``. The output
+    is saved under a temporary name and renamed into place, so
+    ``output_file`` is either complete or untouched. With ``dedup``, identical fonts, images and
+    ICC profiles copied in from different inputs are stored once. ``profile``
+    names an entry of ``SAVE_PROFILES``. Inputs are taken from ``cache`` when
+    one is given, so frequently reused files are parsed only once.
+    ``output_file`` may also be a writable binary stream, such as
+    ``sys.stdout.buffer`` or an ``io.BytesIO``; the document is then
+    serialized in memory and written to it once complete.
+    ``tracer`` (see ``merge_trace``) records open, insert_pdf, close and save
+    timings for each input and for the whole job.
+
+    ``bookmarks`` builds the output's outline (see ``BOOKMARK_MODES``):
+    ``"inputs"`` adds one entry per input with its own outline nested
+    under it, ``"outlines"`` copies the inputs' outlines only. Page offsets
+    are tracked while copying and the outline is written with a single
+    ``set_toc`` call before saving. Without it the output has no outline.
+
+    MuPDF is not thread-safe. A program that also uses PyMuPDF on other
+    threads passes its shared ``lock`` (see ``preflight.fitz_lock``). It is
+    held for each input's open, copy and close and for the final save, and
+    released in between so the other threads can make progress.
+    """
+    lock = lock or contextlib.nullcontext()
+    options = save_options(profile, dedup)
+    if bookmarks is not None and bookmarks not in BOOKMARK_MODES:
+        raise ValueError(f"Unknown bookmark mode {bookmarks!r}; "
+                         f"choose from {', '.join(BOOKMARK_MODES)}")
+    outline = []
+    # Create a new PDF document
+    with lock:
+        merged_pdf = fitz.open()
+
+    def on_pages(copied):
+        # Called between the insert_pdf calls of the current input
+        if cancel_event is not None and cancel_event.is_set():
+            raise MergeCancelled("Merge cancelled")
+        if progress is not None and copied < len(pages):
+            progress(index, len(inputs), before + copied)
+
+    try:
+        with tracer.span("job", output=output_name(output_file), inputs=len(inputs)) as job_span:
+            # Add pages from each PDF
+            for index, item in enumerate(inputs):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise MergeCancelled("Merge cancelled")
+                pdf_path, page_spec = split_input(item)
+                name = source_name(pdf_path)
+                # Sources are not files the cache could validate by mtime
+                cached = cache is not None and not is_source(pdf_path)
+                if not is_source(pdf_path) and not os.path.exists(pdf_path):
+                    raise FileNotFoundError(f"File not found: {pdf_path}")
+
+                # MuPDF is not thread-safe; other threads may use it between inputs
+                with lock:
+                    with tracer.span("open", input=name, bytes=input_size(pdf_path)) as span:
+                        if cached:
+                            hits = cache.hits
+                            pdf = cache.open(pdf_path)
+                            span["cached"] = cache.hits > hits
+                        else:
+                            pdf = open_input(pdf_path)
+                        span["pages"] = pdf.page_count
+                    try:
+                        with tracer.span("insert_pdf", input=name, selection=page_spec) as span:
+                            before = merged_pdf.page_count
+                            pages = (parse_page_spec(page_spec, pdf.page_count) if page_spec
+                                     else range(pdf.page_count))
+                            insert_pages(merged_pdf, pdf, page_spec, on_pages=on_pages if (
+                                progress is not None or cancel_event is not None) else None)
+                            span["pages"] = merged_pdf.page_count - before
+                        if bookmarks:
+                            outline.extend(outline_entries(
+                                pdf, before, pages if page_spec else None,
+                                input_title(pdf_path) if bookmarks == "inputs" else None))
+                    finally:
+                        if not cached:
+                            with tracer.span("close", input=name):
+                                pdf.close()
+                    pages_done = merged_pdf.page_count
+                if progress is not None:
+                    progress(index + 1, len(inputs), pages_done)
+
+            if cancel_event is not None and cancel_event.is_set():
+                raise MergeCancelled("Merge cancelled")
+
+            with lock:
+                if outline and merged_pdf.page_count:
+                    apply_outline(merged_pdf, outline, tracer)
+
+                if dedup:
+                    duplicates, duplicate_bytes = find_duplicate_streams(merged_pdf)
+                    logger.info(f"Deduplicating {duplicates} shared streams "
+                                f"({duplicate_bytes / 1024:.0f} KB) in {output_name(output_file)}")
+
+                # Save the merged PDF, never leaving a truncated file behind
+                page_count = merged_pdf.page_count
+                with tracer.span("save", output=output_name(output_file), pages=page_count,
+                                 profile=profile) as span:
+                    if not isinstance(output_file, str):
+                        data = merged_pdf.tobytes(**options)
+                        output_file.write(data)
+                        output_file.flush()
+                        span["bytes"] = len(data)
+                    else:
+                        partial = partial_path(output_file)
+                        try:
+                            merged_pdf.save(partial, **options)
+                            os.replace(partial, output_file)
+                        except BaseException:
+                            _discard(partial)
+                            raise
+                        span["bytes"] = os.path.getsize(output_file)
+            job_span.update(pages=page_count, bytes=span["bytes"])
+            return page_count
+    finally:
+        with lock:
+            merged_pdf.close()
+
+
+def _flush_segment(output_file, pending, outline=None):
+    """Append ``(path, from_page, to_page)`` slices to ``output_file`` and save it.
+
+    The file is written afresh to a second temporary file. MuPDF copies the
+    objects already on disk without holding them, so memory stays at one
+    segment. An incremental save would append fewer bytes, but MuPDF
+    rereads the whole file dozens of times to write one, which made it
+    about four times slower.
+    """
+    if not os.path.exists(output_file):
+        merged_pdf = fitz.open()
+    else:
+        merged_pdf = fitz.open(output_file)
+    rewritten = partial_path(output_file)
+    try:
+        for pdf_path, from_page, to_page in pending:
+            pdf = open_input(pdf_path)
+            try:
+                merged_pdf.insert_pdf(pdf, from_page=from_page, to_page=to_page)
+            finally:
+                pdf.close()
+        if outline:
+            apply_outline(merged_pdf, outline)
+        merged_pdf.save(rewritten)
+        page_count = merged_pdf.page_count
+    except BaseException:
+        _discard(rewritten)
+        raise
+    finally:
+        # Closing drops every object MuPDF cached for this segment
+        merged_pdf.close()
+    os.replace(rewritten, output_file)
+    return page_count
+
+
+def stream_merge(inputs: List, output_file: str, memory_budget: int,
+                 progress=None, cancel_event=None, bookmarks: Optional[str] = None) -> int:
+    """Merge ``inputs`` into ``output_file`` with bounded memory use.
+
+    Inputs are appended in segments of roughly ``memory_budget / 2`` bytes of
+    source data; after each segment the output is saved and closed, so only
+    one segment is ever held in memory. Inputs larger than a segment are
+    split into page ranges. Resources shared between segments
+    (fonts, images) are copied once per segment rather than once per output.
+    Segments are saved to a temporary file that replaces ``output_file``
+    only once the last one is written, so ``output_file`` must be a path.
+    Sources (see ``pdf_sources``) are read again for every segment they
+    are split across. ``bookmarks`` is as for ``merge_files``; the outline
+    is collected while planning the segments and written with the last one.
+
+    Every save rewrites the output so far, so the total time grows with the
+    square of the output size divided by the budget. 120 MB of images take
+    2.1 s with a 16 MB budget (0.23 s in memory), 240 MB take 9.1 s, and
+    240 MB with a 64 MB budget take 2.3 s. Use the largest budget you can
+    afford for multi-gigabyte outputs.
+    """
+    if not isinstance(output_file, str):
+        raise ValueError("Low-memory merges save to a file; cannot write them to a stream")
+    segment_bytes = max(memory_budget // 2, 1)
+    _check_inputs_exist(inputs)
+
+    partial = partial_path(output_file)
+    try:
+        pending = []
+        pending_bytes = 0
+        page_count = 0
+        planned_pages = 0
+        outline = []
+        for index, item in enumerate(inputs):
+            if cancel_event is not None and cancel_event.is_set():
+                raise MergeCancelled("Merge cancelled")
+
+            pdf_path, page_spec = split_input(item)
+            file_size = input_size(pdf_path)
+            with open_input(pdf_path) as pdf:
+                pdf_pages = pdf.page_count
+                selected = parse_page_spec(page_spec, pdf_pages) if page_spec else None
+                if bookmarks:
+                    outline.extend(outline_entries(
+                        pdf, planned_pages, selected,
+                        input_title(pdf_path) if bookmarks == "inputs" else None))
+            planned_pages += pdf_pages if selected is None else len(selected)
+            if selected is not None:
+                runs = page_runs(selected)
+            else:
+                runs = [(0, pdf_pages - 1)] if pdf_pages else []
+            bytes_per_page = max(file_size // max(pdf_pages, 1), 1)
+            pages_per_slice = max(segment_bytes // bytes_per_page, 1)
+
+            for run_start, run_end in runs:
+                step = 1 if run_end >= run_start else -1
+                for from_page in range(run_start, run_end + step, step * pages_per_slice):
+                    to_page = from_page + step * (pages_per_slice - 1)
+                    to_page = min(to_page, run_end) if step > 0 else max(to_page, run_end)
+                    slice_bytes = (abs(to_page - from_page) + 1) * bytes_per_page
+                    if pending and pending_bytes + slice_bytes > segment_bytes:
+                        page_count = _flush_segment(partial, pending)
+                        pending, pending_bytes = [], 0
+                    pending.append((pdf_path, from_page, to_page))
+                    pending_bytes += slice_bytes
+
+            if progress is not None:
+                progress(index + 1, len(inputs), page_count)
+
+        if cancel_event is not None and cancel_event.is_set():
+            raise MergeCancelled("Merge cancelled")
+        if pending or outline or not os.path.exists(partial):
+            page_count = _flush_segment(partial, pending, outline if planned_pages else None)
+        os.replace(partial, output_file)
+        return page_count
+    except BaseException:
+        _discard(partial)
+        raise
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def tree_merge(inputs: List, output_file: str, chunk_size: int = 64,
+               workers: int = 1, **merge_options) -> int:
+    """Merge ``inputs`` into ``output_file`` by hierarchical reduction.
+
+    Inputs are merged in chunks of ``chunk_size`` into intermediate documents
+    on a process pool, then the intermediates are merged the same way, level
+    by level, until one chunk is left for the final merge. Chunks never cross
+    or reorder, so the output page order matches ``inputs``. Intermediates
+    are saved with the fast profile; ``merge_options`` (``dedup``,
+    ``profile``) apply to the final level, where all copies meet. With
+    ``bookmarks``, the first level builds the outline of each chunk and
+    later levels carry those outlines over unchanged.
+    """
+    bookmarks = merge_options.pop("bookmarks", None)
+    chunk_size = max(chunk_size, 2)
+    if len(inputs) <= chunk_size:
+        return merge_files(inputs, output_file, bookmarks=bookmarks, **merge_options)
+
+    _check_inputs_exist(inputs)
+
+    # Keep intermediates next to the output so the final read stays on one disk
+    temp_dir = tempfile.mkdtemp(prefix=".merge-", dir=os.path.dirname(os.path.abspath(output_file))
+                                if isinstance(output_file, str) else None)
+    try:
+        with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+            level = 0
+            current = list(inputs)
+            while len(current) > chunk_size:
+                chunks = _chunks(current, chunk_size)
+                outputs = [os.path.join(temp_dir, f"L{level}-{i:06d}.pdf")
+                           for i in range(len(chunks))]
+                # map() yields in submission order and re-raises worker errors
+                merge_chunk = functools.partial(merge_files, bookmarks=bookmarks if level == 0
+                                                else bookmarks and "outlines")
+                list(executor.map(merge_chunk, chunks, outputs))
+                logger.debug(f"Tree merge level {level}: {len(current)} -> {len(outputs)} documents")
+                current = outputs
+                level += 1
+        return merge_files(current, output_file, bookmarks=bookmarks and "outlines",
+                           **merge_options)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+# Per-process input cache for batch runs; each pool worker gets its own
+_input_cache = None
+
+
+def _get_input_cache(cache_bytes):
+    global _input_cache
+    if _input_cache is None or _input_cache.max_bytes != cache_bytes:
+        if _input_cache is not None:
+            _input_cache.clear()
+        _input_cache = InputCache(max_bytes=cache_bytes)
+    return _input_cache
+
+
+def run_job(job: MergeJob, tree_chunk_size: int = 0, workers: int = 1,
+            memory_budget: int = 0, cache_bytes: int = 0, trace_path: Optional[str] = None,
+            incremental: bool = False, **merge_options) -> MergeResult:
+    """Run a single job, capturing any error in the result.
+
+    ``merge_options`` (``dedup``, ``profile``, ``bookmarks``) are passed on
+    to the merge; stream mode ignores all but ``bookmarks`` because it
+    never holds the whole output to compact or deduplicate it. With ``cache_bytes``, plain merges
+    reuse source documents parsed by earlier jobs in the same process.
+    ``trace_path`` names a JSON-lines file to append timing spans to; plain
+    merges trace every input, stream and tree merges only the whole job.
+    With ``incremental``, plain merges only splice changed inputs into an
+    existing output (see ``incremental_merge.update_merge``).
+    """
+    start = time.perf_counter()
+    tracer = get_tracer(trace_path)
+    cache = None
+    if cache_bytes and not memory_budget and not tree_chunk_size:
+        cache = _get_input_cache(cache_bytes)
+        merge_options["cache"] = cache
+        hits, misses = cache.hits, cache.misses
+    try:
+        if memory_budget:
+            with tracer.span("job", output=output_name(job.output), inputs=len(job.inputs),
+                             mode="stream") as span:
+                pages = span["pages"] = stream_merge(job.inputs, job.output, memory_budget,
+                                                     bookmarks=merge_options.get("bookmarks"))
+        elif tree_chunk_size:
+            with tracer.span("job", output=output_name(job.output), inputs=len(job.inputs),
+                             mode="tree") as span:
+                pages = span["pages"] = tree_merge(job.inputs, job.output, tree_chunk_size,
+                                                   workers, **merge_options)
+        elif incremental:
+            import incremental_merge  # imports this module, so not at top level
+
+            pages = incremental_merge.update_merge(job.inputs, job.output, tracer=tracer,
+                                                   **merge_options)
+        else:
+            pages = merge_files(job.inputs, job.output, tracer=tracer, **merge_options)
+        result = MergeResult(job, pages=pages, elapsed=time.perf_counter() - start)
+    except Exception as e:
+        result = MergeResult(job, elapsed=time.perf_counter() - start, error=str(e))
+    if cache is not None:
+        result.cache_hits = cache.hits - hits
+        result.cache_misses = cache.misses - misses
+    return result
+
+
+def log_result(result: MergeResult):
+    job = result.job
+    if result.ok:
+        logger.info(f"Merged {len(job.inputs)} files ({result.pages} pages) "
+                    f"into {output_name(job.output)} in {result.elapsed:.2f}s")
+    else:
+        logger.error(f"Failed to merge {output_name(job.output)}: {result.error}")
+
+
+def run_jobs(jobs: List[MergeJob], fail_fast: bool = False, workers: int = 1,
+             max_pending: Optional[int] = None,
+             tree_chunk_size: int = 0,
+             memory_budget: int = 0, cache_bytes: int = 0,
+             trace_path: Optional[str] = None, on_result=None,
+             **merge_options) -> List[Optional[MergeResult]]:
+    """Run merge jobs and return their results in job order.
+
+    With ``workers`` greater than one, independent jobs are spread across a
+    process pool. At most ``max_pending`` jobs (default ``2 * workers``) are
+    submitted at a time, so huge manifests are not queued all at once. Jobs
+    skipped because of ``fail_fast`` have a result of ``None``.
+
+    With ``tree_chunk_size`` set, jobs run one at a time and each uses the
+    workers for a tree merge (see ``tree_merge``) instead. ``memory_budget``
+    (bytes) switches each job to ``stream_merge``; the budget applies per
+    worker process, as does ``cache_bytes``. Every process appends its
+    spans to ``trace_path`` when it is given. ``on_result`` is called in
+    this process with each result as soon as it is in. ``merge_options``
+    are passed to ``run_job``.
+    """
+    if workers <= 1 or tree_chunk_size:
+        results = []
+        for job in jobs:
+            result = run_job(job, tree_chunk_size, workers, memory_budget, cache_bytes,
+                             trace_path, **merge_options)
+            results.append(result)
+            log_result(result)
+            if on_result is not None:
+                on_result(result)
+            if fail_fast and not result.ok:
+                break
+        return results + [None] * (len(jobs) - len(results))
+
+    max_pending = max(max_pending or 2 * workers, workers)
+    results = [None] * len(jobs)
+    pending = {}
+    next_index = 0
+    failed = False
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or (next_index < len(jobs) and not failed):
+            # Top up the queue to the bounded depth
+            while next_index < len(jobs) and len(pending) < max_pending and not failed:
+                future = executor.submit(run_job, jobs[next_index],
+                                         memory_budget=memory_budget,
+                                         cache_bytes=cache_bytes, trace_path=trace_path,
+                                         **merge_options)
+                pending[future] = next_index
+                next_index += 1
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. crashed inside MuPDF)
+                    result = MergeResult(jobs[index], error=f"Worker failed: {e}")
+                results[index] = result
+                log_result(result)
+                if on_result is not None:
+                    on_result(result)
+                if fail_fast and not result.ok:
+                    failed = True
+
+    return results
+
+
+def _resolve(base_dir, path):
+    return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+
+def _manifest_input(base_dir, path, pages=None):
+    path = _resolve(base_dir, path)
+    if not pages:
+        return path
+    validate_page_spec(pages)
+    return (path, pages)
+
+
+def load_manifest(manifest_path: str) -> List[MergeJob]:
+    """Load merge jobs from a CSV or JSON manifest.
+
+    JSON manifests are either a list of ``{"output": ..., "inputs": [...]}``
+    objects or a mapping of output path to input list; each input is a path
+    or a ``{"path": ..., "pages": ...}`` object. CSV manifests have one
+    ``output,input[,pages]`` row per input; rows for the same output are
+    merged in file order. Relative paths are resolved against the manifest's
+    directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    if manifest_path.lower().endswith(".json"):
+        with open(manifest_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            entries = [{"output": k, "inputs": v} for k, v in data.items()]
+        else:
+            entries = data
+        jobs = []
+        for entry in entries:
+            if "output" not in entry or not entry.get("inputs"):
+                raise ValueError(f"Invalid manifest entry in {manifest_path}: {entry!r}")
+            inputs = []
+            for item in entry["inputs"]:
+                if isinstance(item, dict):
+                    inputs.append(_manifest_input(base_dir, item["path"], item.get("pages")))
+                else:
+                    inputs.append(_manifest_input(base_dir, item))
+            jobs.append(MergeJob(_resolve(base_dir, entry["output"]), inputs))
+        return jobs
+
+    # CSV: keep outputs in first-seen order
+    jobs = {}
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            if not row or row[0].startswith("#"):
+                continue
+            if line_no == 1 and [c.strip().lower() for c in row[:2]] == ["output", "input"]:
+                continue
+            if len(row) < 2:
+                raise ValueError(f"{manifest_path}:{line_no}: expected 'output,input[,pages]'")
+            output = _resolve(base_dir, row[0].strip())
+            job = jobs.setdefault(output, MergeJob(output, []))
+            pages = row[2].strip() if len(row) > 2 else None
+            try:
+                job.inputs.append(_manifest_input(base_dir, row[1].strip(), pages))
+            except ValueError as e:
+                raise ValueError(f"{manifest_path}:{line_no}: {e}")
+    return list(jobs.values())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdf_merger",
+        description="Merge PDF files without the GUI.")
+    parser.add_argument("inputs", nargs="*",
+                        help="input PDFs, folders (searched recursively), glob "
+                             "patterns, ZIP archives, ARCHIVE.zip!MEMBER.pdf or - "
+                             "(standard input) for a single merge (requires --output)")
+    parser.add_argument("-o", "--output",
+                        help="output file for a single merge (- for standard output)")
+    parser.add_argument("-m", "--manifest", action="append", default=[],
+                        help="CSV or JSON manifest of merge jobs (repeatable)")
+    parser.add_argument("--include", action="append", metavar="PATTERN",
+                        help="file pattern to take from folder inputs "
+                             "(repeatable, default *.pdf)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="skip files and folders matching PATTERN (repeatable)")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="stop at the first failed job")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of worker processes (0 = one per CPU)")
+    parser.add_argument("--max-pending", type=int,
+                        help="maximum jobs queued to the worker pool at once")
+    parser.add_argument("--tree", type=int, metavar="CHUNK", default=0,
+                        help="tree-merge each output in chunks of CHUNK inputs "
+                             "across the workers (for outputs with many inputs)")
+    parser.add_argument("--memory-budget", type=int, metavar="MB", default=0,
+                        help="low-memory mode: save the output after each segment "
+                             "of about MB megabytes of input, so that is all each "
+                             "merge holds")
+    parser.add_argument("--dedup", action="store_true",
+                        help="store identical fonts, images and ICC profiles "
+                             "from different inputs only once")
+    parser.add_argument("--profile", choices=list(SAVE_PROFILES), default="fast",
+                        help="output save profile (default: fast)")
+    parser.add_argument("--bookmarks", nargs="?", const="inputs", choices=BOOKMARK_MODES,
+                        help="build the output outline: one bookmark per input with "
+                             "its own bookmarks nested under it (the default), or "
+                             "'outlines' to copy the inputs' bookmarks only")
+    parser.add_argument("--preflight", action="store_true",
+                        help="check every input (exists, opens, not password "
+                             "protected, page selections in range) before merging")
+    parser.add_argument("--cache-mb", type=int, default=256, metavar="MB",
+                        help="keep up to MB megabytes of reused inputs parsed "
+                             "between jobs, per process (0 disables; default 256)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep a manifest next to each output and on later runs "
+                             "only splice in inputs that changed")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="SQLite journal of finished outputs; rerunning with the "
+                             "same journal skips outputs that are complete and valid")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="with --journal, retry failed jobs this many times (default 2)")
+    parser.add_argument("--retry-delay", type=float, default=1.0, metavar="SECONDS",
+                        help="wait before the first retry, doubled for each further "
+                             "one (default 1)")
+    parser.add_argument("--server", metavar="ADDRESS",
+                        default=os.environ.get("PDF_MERGER_SERVER"),
+                        help="submit the jobs to a running merge_service at ADDRESS "
+                             "(http://host:port or unix:/path; default $PDF_MERGER_SERVER)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="append per-input open/insert/close/save timings and "
+                             "per-job totals to PATH as JSON lines")
+    parser.add_argument("--cprofile", metavar="PATH",
+                        help="profile the main process with cProfile and write "
+                             "the stats to PATH (view with python -m pstats)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="track Python allocations in the main process and "
+                             "log the peak and the top allocation sites")
+    return parser
+
+
+def _log_allocations(tracer, limit=10):
+    """Log (and trace) peak traced memory and the biggest allocation sites."""
+    import tracemalloc
+
+    current, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics("lineno")[:limit]
+    tracemalloc.stop()
+    logger.info(f"tracemalloc: peak {peak / 1024 / 1024:.1f} MB, "
+                f"current {current / 1024 / 1024:.1f} MB")
+    for stat in top:
+        logger.info(f"tracemalloc: {stat}")
+    tracer.emit({"phase": "tracemalloc", "peak_bytes": peak, "current_bytes": current,
+                 "top": [{"site": str(stat.traceback), "bytes": stat.size,
+                          "count": stat.count} for stat in top]})
+
+
+def check_args(parser, args):
+    """Reject option combinations in ``args`` that could not all take effect.
+
+    Only checks what needs no inputs, so it runs before any are scanned;
+    ``parser.error`` exits.
+    """
+    if args.incremental and (args.tree or args.memory_budget):
+        parser.error("--incremental cannot be combined with --tree or --memory-budget")
+    if args.memory_budget:
+        # Stream mode never holds the whole output to split, compact or deduplicate it
+        ignored = [flag for flag, given in (
+            ("--tree", args.tree), ("--dedup", args.dedup),
+            (f"--profile {args.profile}", args.profile != parser.get_default("profile"))) if given]
+        if ignored:
+            parser.error(f"--memory-budget saves the output segment by segment; it cannot "
+                         f"be combined with {', '.join(ignored)}")
+    if args.server:
+        # These shape the local run only; the service would silently ignore them
+        local_only = [flag for flag, given in (
+            ("--journal", args.journal), ("--incremental", args.incremental),
+            ("--tree", args.tree), ("--memory-budget", args.memory_budget),
+            ("--trace", args.trace),
+            ("--cache-mb", args.cache_mb != parser.get_default("cache_mb"))) if given]
+        if local_only:
+            parser.error(f"--server merges on the service; it cannot be combined with "
+                         f"{', '.join(local_only)} (the service has its own --cache-mb "
+                         f"and --trace)")
+    if args.output == "-" and (args.manifest or args.memory_budget):
+        parser.error("--output - writes a single merge; it cannot be combined with "
+                     "--manifest or --memory-budget")
+
+
+def run_options(args) -> dict:
+    """Return the ``run_jobs`` keyword arguments for parsed command-line ``args``."""
+    return dict(fail_fast=args.fail_fast,
+                workers=args.workers if args.workers > 0 else (os.cpu_count() or 1),
+                max_pending=args.max_pending, tree_chunk_size=args.tree,
+                memory_budget=args.memory_budget * 1024 * 1024,
+                cache_bytes=args.cache_mb * 1024 * 1024,
+                trace_path=os.path.abspath(args.trace) if args.trace else None,
+                incremental=args.incremental, dedup=args.dedup, profile=args.profile,
+                bookmarks=args.bookmarks)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # Flag combinations are rejected before any input is scanned or read
+    check_args(parser, args)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    jobs = []
+    to_stdout = args.output == "-"
+    if args.inputs:
+        if not args.output:
+            parser.error("--output is required when input files are given")
+        if args.inputs.count("-") > 1:
+            parser.error("standard input can only be read once")
+        # Folders and globs expand in natural order; duplicates are merged once
+        # (paths as given, and ZIP members by archive and member name).
+        # Standard input and ZIP archives/members are read in memory, not extracted
+        include = args.include or DEFAULT_INCLUDE
+        scanner = DirectoryScanner(include=include, exclude=args.exclude)
+        inputs, roots = [], []
+        for arg in args.inputs:
+            sources = parse_source(arg, include)
+            if sources is None:
+                roots.append(arg)
+                continue
+            # Scan the plain paths before this one together, keeping the order
+            inputs.extend(scanner.find(roots) if roots else [])
+            inputs.extend(sources)
+            roots = []
+        inputs.extend(scanner.find(roots) if roots else [])
+        inputs = list(dict.fromkeys(inputs))
+        if not inputs:
+            parser.error("no input files found")
+        logger.info(f"Found {len(inputs)} input files")
+        jobs.append(MergeJob(sys.stdout.buffer if to_stdout else args.output, inputs))
+    for manifest in args.manifest:
+        jobs.extend(load_manifest(manifest))
+    if not jobs:
+        parser.error("nothing to merge: give input files with --output or a --manifest")
+
+    in_memory = to_stdout or any(is_source(split_input(item)[0]) for job in jobs for item in job.inputs)
+    if in_memory and (args.server or args.journal or args.incremental):
+        parser.error("--server, --journal and --incremental need input and output "
+                     "files; they cannot be used with standard input/output or ZIP inputs")
+
+    if args.preflight:
+        import preflight  # imports this module, so not at top level
+
+        problems = preflight.find_problems([item for job in jobs for item in job.inputs])
+        if problems:
+            for problem in problems:
+                logger.error(f"Preflight: {problem}")
+            logger.error(f"Refusing to merge: {len(problems)} unusable inputs")
+            return 2
+
+    if args.server:
+        import merge_service  # imports this module, so not at top level
+
+        start = time.perf_counter()
+        try:
+            results = merge_service.run_remote(merge_service.MergeClient(args.server), jobs,
+                                               fail_fast=args.fail_fast, dedup=args.dedup,
+                                               profile=args.profile, bookmarks=args.bookmarks)
+        except (OSError, merge_service.ServiceError) as e:
+            logger.error(f"Merge service at {args.server} failed: {e}")
+            return 1
+        succeeded = sum(1 for r in results if r is not None and r.ok)
+        logger.info(f"Completed {succeeded}/{len(jobs)} jobs on {args.server} "
+                    f"in {time.perf_counter() - start:.2f}s")
+        return 0 if succeeded == len(jobs) else 1
+
+    options = run_options(args)
+    if to_stdout and not args.tree:
+        # Standard output cannot be handed to a worker process
+        options["workers"] = 1
+
+    if args.tracemalloc:
+        import tracemalloc
+
+        tracemalloc.start()
+    profiler = None
+    if args.cprofile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        if args.journal:
+            import job_journal  # imports this module, so not at top level
+
+            journal = job_journal.JobJournal(args.journal)
+            try:
+                results = job_journal.run_journaled(jobs, journal, retries=args.retries,
+                                                    retry_delay=args.retry_delay,
+                                                    **options)
+                logger.info(f"Journal {args.journal}: {journal.counts()}")
+            finally:
+                journal.close()
+        else:
+            results = run_jobs(jobs, **options)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+            logger.info(f"cProfile stats written to {args.cprofile}")
+        if args.tracemalloc:
+            _log_allocations(get_tracer(options["trace_path"]))
+    finished = [r for r in results if r is not None]
+    succeeded = sum(1 for r in finished if r.ok)
+    logger.info(f"Completed {succeeded}/{len(jobs)} jobs "
+                f"in {time.perf_counter() - start:.2f}s")
+    hits = sum(r.cache_hits for r in finished)
+    misses = sum(r.cache_misses for r in finished)
+    if hits or misses:
+        logger.info(f"Input cache: {hits} hits, {misses} misses")
+    return 0 if succeeded == len(jobs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,702 @@
+import argparse
+import hmac
+import http.client
+import itertools
+import json
+import logging
+import math
+import os
+import secrets
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, quote, urlsplit
+
+import merge_engine
+from merge_engine import MergeJob, MergeResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+UPLOAD_CHUNK = 1024 * 1024
+# Clients send this token as "Authorization: Bearer ..."; the file is readable by its owner only
+TOKEN_ENV = "PDF_MERGER_TOKEN"
+DEFAULT_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".pdf_merger", "service-token")
+UPLOAD_TYPES = ("application/pdf", "application/octet-stream")
+
+
+def service_token(token_file: str = DEFAULT_TOKEN_FILE) -> Optional[str]:
+    """Return the token to reach a local service: ``$PDF_MERGER_TOKEN`` or the token file."""
+    token = os.environ.get(TOKEN_ENV)
+    if token:
+        return token
+    try:
+        with open(token_file, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def write_token(token: str, token_file: str = DEFAULT_TOKEN_FILE):
+    os.makedirs(os.path.dirname(token_file), exist_ok=True)
+    if os.path.exists(token_file):
+        os.remove(token_file)
+    fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+
+
+def _inside(path, roots) -> bool:
+    real = os.path.realpath(path)
+    for root in roots:
+        try:
+            if os.path.commonpath([real, root]) == root:
+                return True
+        except ValueError:
+            pass  # different drives
+    return False
+
+
+class ServiceJob:
+    """A merge job queued on the service, with its pool future once submitted."""
+
+    def __init__(self, job_id: str, job: MergeJob, options: dict):
+        self.id = job_id
+        self.job = job
+        self.options = options
+        self.submitted = time.time()
+        self.future = None
+
+    @property
+    def cancelled(self):
+        # Read from the future: its done-callbacks run inside Future.cancel(),
+        # before the caller could set a flag of its own
+        return self.future is not None and self.future.cancelled()
+
+    @property
+    def status(self):
+        if self.cancelled:
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        result = self.result()
+        return "done" if result.ok else "failed"
+
+    def result(self) -> MergeResult:
+        try:
+            return self.future.result()
+        except Exception as e:
+            # The worker process itself died (e.g. crashed inside MuPDF)
+            return MergeResult(self.job, error=f"Worker failed: {e}")
+
+    def describe(self):
+        info = {"id": self.id, "status": self.status, "output": self.job.output,
+                "inputs": len(self.job.inputs), "submitted": self.submitted}
+        if self.future.done() and not self.cancelled:
+            result = self.result()
+            info.update(pages=result.pages, elapsed=round(result.elapsed, 3),
+                        error=result.error)
+        return info
+
+
+class MergeService:
+    """Runs merge jobs on a pool of long-lived worker processes.
+
+    Workers import PyMuPDF once and keep their input cache between jobs, so
+    a request pays neither interpreter startup nor the import. At most
+    ``workers`` jobs run at a time and at most ``max_queued`` wait behind
+    them; further submissions are refused until the queue drains. Uploaded
+    files and outputs without an explicit path live in ``spool_dir``. The
+    results of the last ``keep_finished`` jobs stay available for polling;
+    spooled files of older jobs are deleted with them, and the rest at
+    shutdown.
+
+    Every request but ``/health`` must carry ``token`` (a random one is
+    made if none is given), and jobs may only read and write files inside
+    ``spool_dir`` and ``roots``, so another local user or a web page
+    posting to localhost cannot make the service overwrite arbitrary files.
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 64, spool_dir: Optional[str] = None,
+                 cache_bytes: int = 256 * 1024 * 1024, trace_path: Optional[str] = None,
+                 keep_finished: int = 1000, token: Optional[str] = None,
+                 roots: Optional[List[str]] = None):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.owns_spool = spool_dir is None
+        self.spool_dir = spool_dir or tempfile.mkdtemp(prefix="pdf-merger-")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.spooled = set()
+        self.token = token or secrets.token_urlsafe(32)
+        self.roots = [os.path.realpath(root) for root in [self.spool_dir, *(roots or [])]]
+        self.cache_bytes = cache_bytes
+        self.trace_path = trace_path
+        self.keep_finished = keep_finished
+        self.jobs: Dict[str, ServiceJob] = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # Start every worker now so the first real job is not the one paying for it
+        for future in [self.executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+
+    def pending(self):
+        with self.lock:
+            return self._pending()
+
+    def _pending(self):
+        return sum(1 for job in self.jobs.values() if not job.future.done())
+
+    def submit(self, job: MergeJob, **options) -> ServiceJob:
+        """Queue ``job``; raises ``RuntimeError`` when the queue is full."""
+        # Checked and queued under one lock, so concurrent requests cannot overrun the bound
+        with self.lock:
+            if self._pending() >= self.workers + self.max_queued:
+                raise RuntimeError("merge queue is full")
+            job_id = f"j{next(self._ids)}"
+            entry = ServiceJob(job_id, job, options)
+            entry.future = self.executor.submit(
+                merge_engine.run_job, job, cache_bytes=self.cache_bytes,
+                trace_path=self.trace_path, **options)
+            self.jobs[job_id] = entry
+            forgotten = self._forget_finished()
+        logger.info(f"Queued {job_id}: {len(job.inputs)} inputs -> {job.output}")
+        entry.future.add_done_callback(lambda _: self._log(entry))
+        self._remove_spooled(forgotten)
+        return entry
+
+    def check_path(self, path: str):
+        """Raise ``PermissionError`` unless ``path`` is inside the allowed roots."""
+        if not _inside(path, self.roots):
+            raise PermissionError(f"{path} is outside the directories this service may use")
+
+    def _forget_finished(self):
+        # Keep results of the most recent jobs only; dicts iterate oldest first
+        excess = len(self.jobs) - self.keep_finished
+        forgotten = [i for i, job in self.jobs.items() if job.future.done()][:max(excess, 0)]
+        return [self.jobs.pop(job_id) for job_id in forgotten]
+
+    def _remove_spooled(self, entries):
+        """Delete the spooled output and uploads of forgotten jobs that no other job uses."""
+        if not entries:
+            return
+        with self.lock:
+            in_use = {merge_engine.split_input(item)[0]
+                      for job in self.jobs.values() for item in job.job.inputs}
+            paths = {entry.job.output for entry in entries}
+            paths.update(merge_engine.split_input(item)[0]
+                         for entry in entries for item in entry.job.inputs)
+            paths = (paths & self.spooled) - in_use
+            self.spooled -= paths
+        for path in paths:
+            _discard(path)
+
+    def _log(self, entry):
+        if entry.cancelled:
+            logger.info(f"{entry.id} cancelled")
+            return
+        result = entry.result()
+        if result.ok:
+            logger.info(f"{entry.id} done: {result.pages} pages in {result.elapsed:.2f}s")
+        else:
+            logger.error(f"{entry.id} failed: {result.error}")
+
+    def get(self, job_id: str) -> Optional[ServiceJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet; running merges finish."""
+        entry = self.get(job_id)
+        return entry is not None and entry.future.cancel()
+
+    def spool_path(self, name: str) -> str:
+        base = os.path.basename(name) or "upload.pdf"
+        path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex[:12]}-{base}")
+        with self.lock:
+            self.spooled.add(path)
+        return path
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            paths, self.spooled = self.spooled, set()
+        if self.owns_spool:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+        else:
+            for path in paths:
+                _discard(path)
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _parse_inputs(items, base_dir, service: MergeService) -> List:
+    """Turn request inputs (paths, ``[path, pages]`` or ``{"path", "pages"}``) into merge inputs."""
+    inputs = []
+    for item in items:
+        if isinstance(item, dict):
+            path, pages = item["path"], item.get("pages")
+        elif isinstance(item, (list, tuple)):
+            path, pages = item
+        else:
+            path, pages = item, None
+        if not isinstance(path, str):
+            raise ValueError(f"Invalid input: {item!r}")
+        path = path if os.path.isabs(path) else os.path.join(base_dir, path)
+        service.check_path(path)
+        if pages:
+            merge_engine.validate_page_spec(pages)
+            inputs.append((path, pages))
+        else:
+            inputs.append(path)
+    return inputs
+
+
+class MergeRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of the merge service.
+
+    ``POST /uploads?name=a.pdf``   stream the body to the spool directory
+    ``POST /jobs[?wait=SECONDS]``  queue ``{"inputs": [...], "output": ...}``
+    ``GET /jobs/ID[?wait=...]``    job status, pages, elapsed time and error
+    ``GET /jobs/ID/output``        download the merged file
+    ``DELETE /jobs/ID``            cancel a job that has not started
+    ``GET /health``                worker count and queue depth
+
+    All but ``/health`` need ``Authorization: Bearer <token>``. Job requests
+    must be ``application/json`` and uploads ``application/pdf``, which a
+    browser cannot send cross-site without a CORS preflight.
+    """
+
+    server_version = "PDFMergerService/1.0"
+    service: MergeService = None
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        """Check the bearer token, answering 401 when it is missing or wrong."""
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode("utf-8"),
+                                                              self.service.token.encode("utf-8")):
+            return True
+        self.send_json(401, {"error": "Missing or invalid token"})
+        return False
+
+    def content_type(self):
+        return self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+
+    def route(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return parts, query
+
+    @staticmethod
+    def wait_seconds(query) -> float:
+        """Return the ``wait`` query parameter; ``ValueError`` if it is not a number."""
+        try:
+            timeout = float(query.get("wait", 0) or 0)
+        except ValueError:
+            timeout = math.nan
+        if not math.isfinite(timeout):
+            raise ValueError(f"Invalid wait: {query['wait']}")
+        return timeout
+
+    def wait_for(self, entry, timeout):
+        if timeout > 0 and not entry.cancelled:
+            try:
+                entry.future.exception(timeout=timeout)
+            except Exception:
+                pass  # still running, or cancelled while waiting
+
+    def do_GET(self):
+        parts, query = self.route()
+        if parts == ["health"]:
+            self.send_json(200, {"workers": self.service.workers,
+                                 "pending": self.service.pending()})
+            return
+        if not self.authorized():
+            return
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            entry = self.service.get(parts[1])
+            if entry is None:
+                self.send_json(404, {"error": f"Unknown job: {parts[1]}"})
+            elif len(parts) == 2:
+                try:
+                    timeout = self.wait_seconds(query)
+                except ValueError as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
+                self.wait_for(entry, timeout)
+                self.send_json(200, entry.describe())
+            elif parts[2] == "output" and entry.status == "done":
+                self.send_file(entry.job.output)
+            else:
+                self.send_json(409, {"error": f"Job {entry.id} is {entry.status}"})
+            return
+        self.send_json(404, {"error": "Not found"})
+
+    def send_file(self, path):
+        with open(path, "rb") as f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, UPLOAD_CHUNK)
+
+    def do_POST(self):
+        parts, query = self.route()
+        if not self.authorized():
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self.send_json(411, {"error": "Content-Length required"})
+            return
+        try:
+            length = int(length)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            self.send_json(400, {"error": f"Invalid Content-Length: {length}"})
+            return
+
+        if parts == ["uploads"]:
+            if self.content_type() not in UPLOAD_TYPES:
+                self.send_json(415, {"error": "Uploads must be application/pdf"})
+                return
+            # Stream to disk in chunks; uploads never sit in memory whole
+            path = self.service.spool_path(query.get("name", "upload.pdf"))
+            with open(path, "wb") as f:
+                remaining = length
+                while remaining:
+                    chunk = self.rfile.read(min(UPLOAD_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            if remaining:
+                with self.service.lock:
+                    self.service.spooled.discard(path)
+                os.remove(path)
+                self.send_json(400, {"error": "Upload truncated"})
+                return
+            self.send_json(201, {"path": path, "bytes": length})
+            return
+
+        if parts == ["jobs"]:
+            if self.content_type() != "application/json":
+                self.send_json(415, {"error": "Jobs must be application/json"})
+                return
+            try:
+                timeout = self.wait_seconds(query)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                inputs = _parse_inputs(request.get("inputs") or [], self.service.spool_dir,
+                                       self.service)
+                if not inputs:
+                    raise ValueError("No inputs given")
+                output = request.get("output")
+                if output:
+                    if not str(output).lower().endswith(".pdf"):
+                        raise ValueError(f"Output must be a .pdf file: {output}")
+                    self.service.check_path(output)
+                else:
+                    output = self.service.spool_path("merged.pdf")
+                options = {}
+                if "dedup" in request:
+                    options["dedup"] = bool(request["dedup"])
+                if "profile" in request:
+                    merge_engine.save_options(request["profile"])
+                    options["profile"] = request["profile"]
+                if request.get("bookmarks"):
+                    if request["bookmarks"] not in merge_engine.BOOKMARK_MODES:
+                        raise ValueError(f"Unknown bookmark mode {request['bookmarks']!r}")
+                    options["bookmarks"] = request["bookmarks"]
+                entry = self.service.submit(MergeJob(os.path.abspath(output), inputs), **options)
+            except PermissionError as e:
+                self.send_json(403, {"error": str(e)})
+                return
+            except RuntimeError as e:
+                self.send_json(503, {"error": str(e)})
+                return
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            self.wait_for(entry, timeout)
+            self.send_json(202 if entry.status in ("queued", "running") else 200,
+                           entry.describe())
+            return
+        self.send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self):
+        parts, _ = self.route()
+        if not self.authorized():
+            return
+        if len(parts) == 2 and parts[0] == "jobs":
+            entry = self.service.get(parts[1])
+            if entry is None:
+                self.send_json(404, {"error": f"Unknown job: {parts[1]}"})
+            elif self.service.cancel(entry.id):
+                self.send_json(200, entry.describe())
+            else:
+                self.send_json(409, {"error": f"Job {entry.id} is {entry.status}"})
+            return
+        self.send_json(404, {"error": "Not found"})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_handler(service: MergeService):
+    return type("BoundMergeRequestHandler", (MergeRequestHandler,), {"service": service})
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServiceError(Exception):
+    """Raised by ``MergeClient`` when the service rejects a request."""
+
+
+class MergeClient:
+    """Client for a running merge service.
+
+    ``address`` is ``http://host:port`` or ``unix:/path/to/socket``. The
+    ``token`` defaults to ``$PDF_MERGER_TOKEN``, then to the token file a
+    local service writes at startup.
+    """
+
+    def __init__(self, address: str, timeout: Optional[float] = None,
+                 token: Optional[str] = None):
+        self.address = address
+        self.timeout = timeout
+        self.token = token or service_token()
+
+    def _headers(self, headers=None):
+        headers = dict(headers or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def _connection(self):
+        if self.address.startswith("unix:"):
+            return _UnixHTTPConnection(self.address[len("unix:"):], self.timeout)
+        url = urlsplit(self.address if "://" in self.address else f"http://{self.address}")
+        return http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT,
+                                          timeout=self.timeout)
+
+    def _request(self, method, path, body=None, headers=None):
+        conn = self._connection()
+        try:
+            conn.request(method, path, body=body, headers=self._headers(headers))
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"{}")
+        finally:
+            conn.close()
+        if response.status >= 400:
+            raise ServiceError(data.get("error", f"HTTP {response.status}"))
+        return data
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def upload(self, path: str) -> str:
+        """Stream a local file to the service and return its path there."""
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            name = quote(os.path.basename(path))
+            data = self._request("POST", f"/uploads?name={name}", body=f,
+                                 headers={"Content-Length": str(size),
+                                          "Content-Type": "application/pdf"})
+        return data["path"]
+
+    def submit(self, inputs: List, output: Optional[str] = None, wait: float = 0,
+               **options) -> dict:
+        """Queue a merge and return its job description (with ``id``).
+
+        ``inputs`` are paths on the service's machine, or ``(path, pages)``
+        pairs; relative paths are made absolute here, so only files returned
+        by ``upload`` should be given for a service on another machine. With ``wait``, the call blocks up to that many seconds for
+        the result.
+        """
+        items = []
+        for item in inputs:
+            path, pages = merge_engine.split_input(item)
+            path = os.path.abspath(path)
+            items.append([path, pages] if pages else path)
+        request = dict(options, inputs=items)
+        if output:
+            request["output"] = os.path.abspath(output)
+        body = json.dumps(request).encode("utf-8")
+        return self._request("POST", f"/jobs?wait={wait}" if wait else "/jobs", body=body,
+                             headers={"Content-Type": "application/json",
+                                      "Content-Length": str(len(body))})
+
+    def status(self, job_id: str, wait: float = 0) -> dict:
+        return self._request("GET", f"/jobs/{job_id}?wait={wait}" if wait else f"/jobs/{job_id}")
+
+    def wait(self, job_id: str, poll: float = 5) -> dict:
+        """Block until the job has finished, failed or been cancelled."""
+        while True:
+            info = self.status(job_id, wait=poll)
+            if info["status"] not in ("queued", "running"):
+                return info
+
+    def cancel(self, job_id: str) -> dict:
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def download(self, job_id: str, path: str):
+        """Copy a finished job's output to the local ``path``."""
+        conn = self._connection()
+        try:
+            conn.request("GET", f"/jobs/{job_id}/output", headers=self._headers())
+            response = conn.getresponse()
+            if response.status != 200:
+                raise ServiceError(json.loads(response.read() or b"{}").get("error"))
+            with open(path, "wb") as f:
+                shutil.copyfileobj(response, f, UPLOAD_CHUNK)
+        finally:
+            conn.close()
+
+
+def run_remote(client: MergeClient, jobs: List[MergeJob], fail_fast: bool = False,
+               **merge_options) -> List[Optional[MergeResult]]:
+    """Run ``jobs`` on a merge service, with the same results as ``run_jobs``.
+
+    All jobs are queued up front so the service's workers stay busy; with
+    ``fail_fast``, jobs that have not started when one fails are cancelled.
+    """
+    queued = [client.submit(job.inputs, job.output, **merge_options)["id"] for job in jobs]
+    results = []
+    for index, job_id in enumerate(queued):
+        info = client.wait(job_id)
+        if info["status"] == "cancelled":
+            results.append(None)
+            continue
+        result = MergeResult(jobs[index], pages=info.get("pages") or 0,
+                             elapsed=info.get("elapsed") or 0, error=info.get("error"))
+        results.append(result)
+        merge_engine.log_result(result)
+        if fail_fast and not result.ok:
+            for later in queued[index + 1:]:
+                try:
+                    client.cancel(later)
+                except ServiceError:
+                    pass  # already running; it will finish on its own
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="merge_service",
+        description="Keep PDF merge workers warm and accept jobs over HTTP or a Unix socket.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"HTTP port (default {DEFAULT_PORT}; 0 disables HTTP)")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="also listen on a Unix socket at PATH")
+    parser.add_argument("-j", "--workers", type=int, default=2,
+                        help="merges run at the same time (default 2)")
+    parser.add_argument("--max-queued", type=int, default=64,
+                        help="jobs allowed to wait for a worker (default 64)")
+    parser.add_argument("--spool-dir",
+                        help="directory for uploads and outputs without a path "
+                             "(default: a temporary directory removed at shutdown)")
+    parser.add_argument("--root", action="append", default=[], metavar="DIR",
+                        help="directory jobs may read inputs from and write outputs to; "
+                             "repeatable (default: your home directory and the current one)")
+    parser.add_argument("--token",
+                        help=f"token clients must send (default ${TOKEN_ENV}, or a random "
+                             f"one written to {DEFAULT_TOKEN_FILE})")
+    parser.add_argument("--token-file", default=DEFAULT_TOKEN_FILE, metavar="PATH",
+                        help="where to write a generated token for local clients")
+    parser.add_argument("--cache-mb", type=int, default=256, metavar="MB",
+                        help="input cache per worker (default 256)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="append merge timing spans to PATH (see --trace of the CLI)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not args.port and not args.socket:
+        parser.error("nothing to listen on: give --port or --socket")
+
+    token = args.token or os.environ.get(TOKEN_ENV)
+    if not token:
+        token = secrets.token_urlsafe(32)
+        write_token(token, args.token_file)
+        logger.info(f"Access token written to {args.token_file}")
+    roots = args.root or [os.path.expanduser("~"), os.getcwd()]
+    service = MergeService(workers=max(args.workers, 1), max_queued=args.max_queued,
+                           spool_dir=args.spool_dir, cache_bytes=args.cache_mb * 1024 * 1024,
+                           trace_path=os.path.abspath(args.trace) if args.trace else None,
+                           token=token, roots=roots)
+    handler = make_handler(service)
+    servers = []
+    if args.port:
+        servers.append(ThreadingHTTPServer((args.host, args.port), handler))
+        logger.info(f"Listening on http://{args.host}:{servers[-1].server_address[1]}")
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        servers.append(UnixHTTPServer(args.socket, handler))
+        logger.info(f"Listening on unix:{args.socket}")
+    logger.info(f"{service.workers} workers ready, spooling to {service.spool_dir}; "
+                f"jobs may use {', '.join(service.roots[1:])}")
+
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Stop cleanly on SIGTERM too, so the spool directory is removed
+    signal.signal(signal.SIGTERM,
+                  lambda *_: threading.Thread(target=servers[0].shutdown, daemon=True).start())
+    try:
+        servers[0].serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
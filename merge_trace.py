@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class MergeTracer:
+    """Writes timing spans for merge phases to a JSON-lines file.
+
+    Each span is one line with the phase name, start time, duration in
+    seconds, process id and any fields attached to it (input path, page
+    count, byte size, ...). The file is opened in append mode and every line
+    is written in a single call, so several worker processes can trace to
+    the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, record: dict):
+        record.setdefault("pid", os.getpid())
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+    @contextmanager
+    def span(self, phase: str, **fields):
+        """Time the enclosed block; the yielded dict may be filled with more fields."""
+        start = time.time()
+        t0 = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.emit({"phase": phase, "start": round(start, 6),
+                       "seconds": round(time.perf_counter() - t0, 6), **fields})
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class _NullTracer:
+    """Tracer that records nothing; used when tracing is off."""
+
+    def emit(self, record):
+        pass
+
+    @contextmanager
+    def span(self, phase, **fields):
+        yield fields
+
+    def close(self):
+        pass
+
+
+NULL_TRACER = _NullTracer()
+
+# One tracer per process and path, so pool workers reuse their open file
+_tracers = {}
+
+
+def get_tracer(path=None):
+    """Return the process-wide tracer for ``path`` (a no-op tracer for ``None``)."""
+    if not path:
+        return NULL_TRACER
+    tracer = _tracers.get(path)
+    if tracer is None:
+        tracer = _tracers[path] = MergeTracer(path)
+    return tracer
@@ -1,14 +1,32 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-import fitz  # PyMuPDF
+from tkinter import filedialog, messagebox, simpledialog, ttk
+import logging
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Set
 
+import merge_trace
+from dir_scanner import DirectoryScanner
+from file_collection import FileCollection, natural_key
+
 class PDFMergerApp:
+    # Preview pane geometry, in pixels
+    THUMB_WIDTH = 96
+    THUMB_ROW = 150
+    
     def __init__(self, root):
         self.root = root
         self.root.title("PDF Merger Tool")
-        self.root.geometry("600x400")
+        self.root.geometry("860x450")
+        
+        # Configure logging; PDF_MERGER_TRACE names a JSON-lines file for merge timings
+        self.setup_logging()
+        self.tracer = merge_trace.get_tracer(os.environ.get("PDF_MERGER_TRACE"))
+        # PDF_MERGER_SERVER hands merges to a running merge_service with warm workers
+        self.server = os.environ.get("PDF_MERGER_SERVER")
         
         # Configure grid weights
         self.root.grid_rowconfigure(0, weight=1)
@@ -33,14 +51,53 @@ class PDFMergerApp:
         list_frame.grid_rowconfigure(0, weight=1)
         list_frame.grid_columnconfigure(0, weight=1)
         
-        # File list
-        self.file_listbox = tk.Listbox(list_frame, width=60, height=15)
-        self.file_listbox.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        # File list; only rows that change are touched, so large lists stay responsive
+        self.file_tree = ttk.Treeview(list_frame, columns=("pages", "size", "status"),
+                                      height=15, selectmode='extended')
+        self.file_tree.heading("#0", text="File")
+        self.file_tree.heading("pages", text="Pages")
+        self.file_tree.heading("size", text="Size")
+        self.file_tree.heading("status", text="Version / status")
+        self.file_tree.column("#0", width=300)
+        self.file_tree.column("pages", width=60, anchor=tk.E, stretch=False)
+        self.file_tree.column("size", width=80, anchor=tk.E, stretch=False)
+        self.file_tree.column("status", width=180)
+        self.file_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Scrollbar for listbox
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.file_listbox.yview)
+        # Scrollbar for file list
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.file_tree.yview)
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        self.file_listbox.configure(yscrollcommand=scrollbar.set)
+        self.file_tree.configure(yscrollcommand=scrollbar.set)
+        
+        # Thumbnails of the selected files' pages; only visible rows get canvas items
+        preview_frame = ttk.LabelFrame(list_frame, text="Preview")
+        preview_frame.grid(row=0, column=2, sticky=(tk.N, tk.S), padx=(5, 0))
+        preview_frame.grid_rowconfigure(0, weight=1)
+        self.preview_canvas = tk.Canvas(preview_frame, width=self.THUMB_WIDTH + 20,
+                                        highlightthickness=0)
+        self.preview_canvas.grid(row=0, column=0, sticky=(tk.N, tk.S))
+        preview_scrollbar = ttk.Scrollbar(preview_frame, orient=tk.VERTICAL,
+                                          command=self.preview_canvas.yview)
+        preview_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        
+        def on_preview_scroll(first, last):
+            preview_scrollbar.set(first, last)
+            self.schedule_preview_draw()
+            
+        self.preview_canvas.configure(yscrollcommand=on_preview_scroll)
+        self.preview_canvas.bind("<Configure>", lambda event: self.schedule_preview_draw())
+        self.file_tree.bind("<<TreeviewSelect>>", lambda event: self.show_preview(), add="+")
+        self.preview_pages = []
+        self.preview_items = {}  # page index -> (canvas items, future or None)
+        self.preview_photos = {}  # page index -> PhotoImage, visible pages only
+        self.preview_generation = 0
+        self.preview_draw_pending = False
+        self.thumbnails = None
+        
+        # Drag the selected rows to reorder them
+        self.file_tree.bind("<ButtonPress-1>", self.on_drag_start, add="+")
+        self.file_tree.bind("<ButtonRelease-1>", self.on_drag_drop, add="+")
+        self.drag_row = None
         
         # Button frame
         button_frame = ttk.Frame(main_frame)
@@ -51,21 +108,194 @@ class PDFMergerApp:
         ttk.Button(button_frame, text="Remove Selected", command=self.remove_selected).grid(row=0, column=1, padx=5)
         ttk.Button(button_frame, text="Move Up", command=self.move_up).grid(row=0, column=2, padx=5)
         ttk.Button(button_frame, text="Move Down", command=self.move_down).grid(row=0, column=3, padx=5)
+        ttk.Button(button_frame, text="Set Pages...", command=self.set_pages).grid(row=0, column=4, padx=5)
+        ttk.Button(button_frame, text="Add Folder...", command=self.add_folder).grid(row=1, column=0, padx=5, pady=5)
+        ttk.Button(button_frame, text="Move to Top", command=self.move_to_top).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Button(button_frame, text="Move to Bottom", command=self.move_to_bottom).grid(row=1, column=2, padx=5, pady=5)
+        
+        # Sort menu
+        sort_button = ttk.Menubutton(button_frame, text="Sort by")
+        sort_menu = tk.Menu(sort_button, tearoff=0)
+        sort_menu.add_command(label="Name", command=lambda: self.sort_files(lambda p: os.path.basename(p).lower()))
+        sort_menu.add_command(label="Natural order", command=lambda: self.sort_files(natural_key))
+        sort_menu.add_command(label="Date modified", command=lambda: self.sort_files(self.mtime_key))
+        sort_menu.add_command(label="Page count", command=lambda: self.sort_files(self.page_count_key))
+        sort_button["menu"] = sort_menu
+        sort_button.grid(row=1, column=3, padx=5, pady=5)
         
         # Action frame
         action_frame = ttk.Frame(main_frame)
         action_frame.grid(row=2, column=0, pady=10)
         
         # Action buttons
-        ttk.Button(action_frame, text="Merge PDFs", command=self.merge_pdfs).grid(row=0, column=0, padx=5)
-        ttk.Button(action_frame, text="Close", command=self.root.destroy).grid(row=0, column=1, padx=5)
+        self.merge_button = ttk.Button(action_frame, text="Merge PDFs", command=self.merge_pdfs)
+        self.merge_button.grid(row=0, column=0, padx=5)
+        self.cancel_button = ttk.Button(action_frame, text="Cancel", command=self.cancel_merge, state='disabled')
+        self.cancel_button.grid(row=0, column=1, padx=5)
+        ttk.Button(action_frame, text="Close", command=self.close).grid(row=0, column=2, padx=5)
+        
+        # Merge options
+        self.dedup_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(action_frame, text="Deduplicate fonts/images",
+                        variable=self.dedup_var).grid(row=1, column=0, pady=5)
+        ttk.Label(action_frame, text="Output profile:").grid(row=1, column=1, padx=5)
+        self.profile_var = tk.StringVar(value="fast")
+        self.profile_box = ttk.Combobox(action_frame, textvariable=self.profile_var, state='readonly',
+                                        width=12, values=("fast",), postcommand=self.load_profiles)
+        self.profile_box.grid(row=1, column=2, padx=5)
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(action_frame, text="Only update changed files",
+                        variable=self.incremental_var).grid(row=1, column=3, padx=5)
+        self.bookmarks_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(action_frame, text="Bookmark each file",
+                        variable=self.bookmarks_var).grid(row=1, column=4, padx=5)
+        
+        # Progress bar
+        self.progress = ttk.Progressbar(main_frame, mode='determinate')
+        self.progress.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=5)
         
         # Status label - initialize empty
         self.status_label = ttk.Label(main_frame, text="")
-        self.status_label.grid(row=3, column=0, pady=5)
+        self.status_label.grid(row=4, column=0, pady=5)
+        
+        # Store selected files and their optional page selections
+        self.files = FileCollection()
+        self.pending_rows = []
+        
+        # Pre-flight metadata for the selected files, filled in the background
+        # by one queue so folder scans don't start a thread per batch
+        self.preflight = None
+        self.engine_lock = threading.Lock()
+        self.preflight_queue = ThreadPoolExecutor(max_workers=1)
+        
+        # Background merge state
+        self.cancel_event = threading.Event()
+        self.merge_thread = None
+        
+        # PyMuPDF is imported on the pre-flight thread once the window is up,
+        # so opening the window never waits for it
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after_idle(lambda: self.preflight_queue.submit(self.preflight_cache))
+        
+    def report_ready(self, started):
+        """Log how long the window took to become usable, counted from ``started``"""
+        self.root.after_idle(lambda: self.logger.info(
+            f"PDF merger ready in {time.perf_counter() - started:.3f}s"))
+        
+    def preflight_cache(self):
+        """Return the pre-flight cache, importing the merge engine on first use"""
+        with self.engine_lock:
+            if self.preflight is None:
+                import preflight  # loads PyMuPDF
+                
+                self.preflight = preflight.PreflightCache()
+            return self.preflight
+            
+    def thumbnail_cache(self):
+        """Return the thumbnail renderer, creating it on first use"""
+        with self.engine_lock:
+            if self.thumbnails is None:
+                import thumbnails  # loads PyMuPDF
+                
+                self.thumbnails = thumbnails.ThumbnailCache(width=self.THUMB_WIDTH)
+            return self.thumbnails
+            
+    def show_preview(self):
+        """List the pages of the selected files in the preview pane, in merge order"""
+        pages = []
+        selected = set(self.selected_paths())
+        if selected:
+            import merge_engine
+            
+            for path in self.files:
+                if path not in selected:
+                    continue
+                info = self.preflight.get(path) if self.preflight is not None else None
+                if info is None or not info.ok:
+                    continue
+                page_spec = self.files.entry(path).page_spec
+                try:
+                    numbers = (merge_engine.parse_page_spec(page_spec, info.page_count)
+                               if page_spec else range(info.page_count))
+                except ValueError:
+                    continue
+                pages.extend((path, number) for number in numbers)
+                
+        self.clear_preview()
+        self.preview_generation += 1
+        self.preview_pages = pages
+        self.preview_canvas.configure(scrollregion=(0, 0, self.THUMB_WIDTH + 20,
+                                                    len(pages) * self.THUMB_ROW))
+        self.preview_canvas.yview_moveto(0)
+        self.schedule_preview_draw()
+        
+    def clear_preview(self, keep=()):
+        """Drop the canvas items and pending renders of pages not in ``keep``"""
+        for index in [i for i in self.preview_items if i not in keep]:
+            items, future = self.preview_items.pop(index)
+            for item in items:
+                self.preview_canvas.delete(item)
+            if future is not None:
+                future.cancel()
+            self.preview_photos.pop(index, None)
+            
+    def schedule_preview_draw(self):
+        # Scroll events come in bursts; draw once per burst
+        if not self.preview_draw_pending:
+            self.preview_draw_pending = True
+            self.root.after(30, self.draw_preview)
+            
+    def draw_preview(self):
+        """Draw the visible pages, requesting thumbnails for them only"""
+        self.preview_draw_pending = False
+        if not self.preview_pages:
+            return
+        top = self.preview_canvas.canvasy(0)
+        bottom = self.preview_canvas.canvasy(self.preview_canvas.winfo_height())
+        first = max(int(top // self.THUMB_ROW) - 1, 0)
+        last = min(int(bottom // self.THUMB_ROW) + 1, len(self.preview_pages) - 1)
+        visible = range(first, last + 1)
+        self.clear_preview(keep=visible)
+        
+        cache = self.thumbnail_cache()
+        x = (self.THUMB_WIDTH + 20) // 2
+        for index in visible:
+            if index in self.preview_items:
+                continue
+            path, page = self.preview_pages[index]
+            y = index * self.THUMB_ROW
+            label = self.preview_canvas.create_text(
+                x, y + self.THUMB_ROW - 8, text=f"{os.path.basename(path)[:14]} p.{page + 1}",
+                font=("TkDefaultFont", 7))
+            png = cache.cached(path, page)
+            if png is not None:
+                self.preview_items[index] = ([label, self.place_thumbnail(index, png)], None)
+                continue
+            future = cache.get(path, page)
+            self.preview_items[index] = ([label], future)
+            generation = self.preview_generation
+            future.add_done_callback(
+                lambda f, i=index: self.root.after(0, self.thumbnail_ready, generation, i, f))
+            
+    def thumbnail_ready(self, generation, index, future):
+        if generation != self.preview_generation or future.cancelled():
+            return
+        entry = self.preview_items.get(index)
+        if entry is None or entry[1] is not future or future.exception() is not None:
+            return
+        self.preview_items[index] = (entry[0] + [self.place_thumbnail(index, future.result())], None)
         
-        # Store selected files
-        self.selected_files = []
+    def place_thumbnail(self, index, png):
+        photo = tk.PhotoImage(data=png)
+        self.preview_photos[index] = photo
+        return self.preview_canvas.create_image((self.THUMB_WIDTH + 20) // 2,
+                                                index * self.THUMB_ROW + 4,
+                                                image=photo, anchor=tk.N)
+        
+    def load_profiles(self):
+        import merge_engine
+        
+        self.profile_box.configure(values=list(merge_engine.SAVE_PROFILES))
         
     def add_files(self):
         files = filedialog.askopenfilenames(
@@ -76,54 +306,235 @@ class PDFMergerApp:
         if not files:
             return
             
-        # Check for duplicates
-        new_files = [f for f in files if f not in self.selected_files]
-        if len(new_files) != len(files):
+        # Duplicates are skipped by the collection's path index
+        added = self.files.add(files)
+        if len(added) != len(files):
             messagebox.showwarning("Warning", "Some files were already selected and were skipped.")
             
-        self.selected_files.extend(new_files)
-        self.update_listbox()
+        self.insert_rows(added)
+        self.start_preflight([entry.path for entry in added])
+        
+    def insert_rows(self, entries, batch_size=1000):
+        """Append rows in batches so the window keeps responding for huge lists"""
+        self.pending_rows.extend(entries)
+        if len(self.pending_rows) == len(entries):
+            self.root.after(0, self.insert_row_batch, batch_size)
+            
+    def insert_row_batch(self, batch_size):
+        batch = self.pending_rows[:batch_size]
+        del self.pending_rows[:batch_size]
+        for entry in batch:
+            # Skip files removed before their row was drawn
+            if entry.path in self.files and self.files.entry(entry.path) is entry:
+                self.file_tree.insert("", tk.END, iid=entry.iid, text=self.format_name(entry),
+                                      values=self.format_values(entry.path))
+        if self.pending_rows:
+            self.root.after(1, self.insert_row_batch, batch_size)
+        
+    def add_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder of PDF Files")
+        if not folder:
+            return
+            
+        self.status_label.config(text="Scanning folder...")
+        
+        def scan():
+            found = 0
+            # Batches arrive in natural order while the walk is still running
+            for batch in DirectoryScanner().iter_batches([folder]):
+                found += len(batch)
+                self.root.after(0, lambda b=batch, n=found: self.add_scanned(b, n))
+            self.root.after(0, lambda: self.status_label.config(
+                text=f"Found {found} PDF files in {folder}"))
+                
+        thread = threading.Thread(target=scan)
+        thread.daemon = True
+        thread.start()
+        
+    def add_scanned(self, batch, found):
+        added = self.files.add(batch)
+        self.insert_rows(added)
+        self.start_preflight([entry.path for entry in added])
+        self.status_label.config(text=f"Scanning folder... {found} PDF files found")
+        
+    def start_preflight(self, files, batch_size=256):
+        """Queue new files for scanning, refreshing their rows batch by batch"""
+        for i in range(0, len(files), batch_size):
+            self.preflight_queue.submit(self.preflight_batch, files[i:i + batch_size])
+            
+    def preflight_batch(self, batch):
+        self.preflight_cache().scan(batch)
+        self.root.after(0, lambda: self.refresh_rows(batch))
+        
+    def selected_paths(self):
+        return [self.files.path_for(iid) for iid in self.file_tree.selection()]
         
     def remove_selected(self):
-        selection = self.file_listbox.curselection()
+        selection = self.file_tree.selection()
         if not selection:
             return
             
-        # Remove in reverse order to avoid index issues
-        for index in reversed(selection):
-            self.selected_files.pop(index)
-            
-        self.update_listbox()
+        self.files.remove(self.files.path_for(iid) for iid in selection)
+        self.file_tree.delete(*selection)
+        
+    def can_reorder(self):
+        # Row positions only match the model once every row is drawn
+        return bool(self.file_tree.selection()) and not self.pending_rows
+        
+    def show_moved(self, paths, upward):
+        """Move just the rows for ``paths`` to their new model positions"""
+        chosen = set(paths)
+        positions = [(i, self.files.entry(p).iid) for i, p in enumerate(self.files) if p in chosen]
+        # Moving rows up, place the topmost first; moving down, the bottommost first
+        for index, iid in (positions if upward else reversed(positions)):
+            self.file_tree.move(iid, "", index)
+        self.file_tree.see(positions[0][1] if upward else positions[-1][1])
+        
+    def show_order(self):
+        """Reattach every row in model order with a single Treeview call"""
+        selection = self.file_tree.selection()
+        self.file_tree.set_children("", *(self.files.entry(p).iid for p in self.files))
+        self.file_tree.selection_set(selection)
         
     def move_up(self):
-        selection = self.file_listbox.curselection()
-        if not selection or selection[0] == 0:
+        if not self.can_reorder():
             return
-            
-        index = selection[0]
-        self.selected_files[index], self.selected_files[index - 1] = \
-            self.selected_files[index - 1], self.selected_files[index]
-        self.update_listbox()
-        self.file_listbox.selection_set(index - 1)
+        paths = self.selected_paths()
+        self.files.shift(paths, -1)
+        self.show_moved(paths, upward=True)
         
     def move_down(self):
-        selection = self.file_listbox.curselection()
-        if not selection or selection[0] == len(self.selected_files) - 1:
+        if not self.can_reorder():
+            return
+        paths = self.selected_paths()
+        self.files.shift(paths, 1)
+        self.show_moved(paths, upward=False)
+        
+    def move_to_top(self):
+        if not self.can_reorder():
             return
+        paths = self.selected_paths()
+        self.files.move_to(paths, 0)
+        self.show_moved(paths, upward=True)
+        
+    def move_to_bottom(self):
+        if not self.can_reorder():
+            return
+        paths = self.selected_paths()
+        self.files.move_to(paths, len(self.files))
+        self.show_moved(paths, upward=False)
+        
+    @staticmethod
+    def mtime_key(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return float("inf")
             
-        index = selection[0]
-        self.selected_files[index], self.selected_files[index + 1] = \
-            self.selected_files[index + 1], self.selected_files[index]
-        self.update_listbox()
-        self.file_listbox.selection_set(index + 1)
+    def page_count_key(self, path):
+        # Files not scanned yet (or unreadable) sort last
+        info = self.preflight.get(path) if self.preflight is not None else None
+        return info.page_count if info is not None and info.ok else float("inf")
+        
+    def sort_files(self, key):
+        if self.pending_rows:
+            return
+        self.files.sort(key)
+        self.show_order()
         
-    def update_listbox(self):
-        self.file_listbox.delete(0, tk.END)
-        for file in self.selected_files:
-            self.file_listbox.insert(tk.END, os.path.basename(file))
+    def on_drag_start(self, event):
+        row = self.file_tree.identify_row(event.y)
+        self.drag_row = row or None
+        # Pressing on an already selected row starts a drag of the whole selection,
+        # so keep the Treeview class binding from collapsing it to one row
+        if row and row in self.file_tree.selection() and not event.state & 0x0005:
+            return "break"
+            
+    def on_drag_drop(self, event):
+        source, self.drag_row = self.drag_row, None
+        target = self.file_tree.identify_row(event.y)
+        if not source:
+            return
+        if target == source or not target:
+            # A plain click on a selected row: select just that row
+            if target == source and source in self.file_tree.selection() and not event.state & 0x0005:
+                self.file_tree.selection_set(source)
+            return
+        if target in self.file_tree.selection() or not self.can_reorder():
+            return
+            
+        # Drop above the target when dragging up, below it when dragging down
+        target_path = self.files.path_for(target)
+        after = self.files.index(target_path) > self.files.index(self.files.path_for(source))
+        self.files.move_next_to(self.selected_paths(), target_path, after)
+        self.show_order()
+        
+    def set_pages(self):
+        paths = self.selected_paths()
+        if not paths:
+            return
+            
+        current = self.files.entry(paths[0]).page_spec or ""
+        spec = simpledialog.askstring(
+            "Select Pages",
+            "Pages to merge, e.g. 1-3, 7, 10-, last 2, odd, even\n(leave empty for all pages):",
+            initialvalue=current, parent=self.root)
+        if spec is None:
+            return
+            
+        spec = spec.strip()
+        if spec:
+            import merge_engine
+            
+            try:
+                merge_engine.validate_page_spec(spec)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+                
+        for path in paths:
+            self.files.set_page_spec(path, spec)
+        self.refresh_rows(paths)
+        
+    @staticmethod
+    def format_size(size):
+        for unit in ("B", "KB", "MB"):
+            if size < 1024:
+                return f"{size:.0f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GB"
+        
+    @staticmethod
+    def format_name(entry):
+        name = os.path.basename(entry.path)
+        if entry.page_spec:
+            name += f"  [pages {entry.page_spec}]"
+        return name
+        
+    def format_values(self, path):
+        info = self.preflight.get(path) if self.preflight is not None else None
+        if info is None:
+            return ("", "", "scanning...")
+        if not info.ok:
+            return ("", self.format_size(info.size), f"ERROR: {info.problem}")
+        details = f"PDF {info.version}" + (" (encrypted)" if info.encrypted else "")
+        return (info.page_count, self.format_size(info.size), details)
+        
+    def refresh_rows(self, paths):
+        """Redraw the rows for ``paths`` only"""
+        for path in paths:
+            if path in self.files:
+                entry = self.files.entry(path)
+                if not self.file_tree.exists(entry.iid):
+                    continue
+                self.file_tree.item(entry.iid, text=self.format_name(entry),
+                                    values=self.format_values(path))
+        # Scans and page range edits change what the preview shows
+        if set(paths) & set(self.selected_paths()):
+            self.show_preview()
             
     def merge_pdfs(self):
-        if not self.selected_files:
+        if not self.files:
             messagebox.showerror("Error", "Please select at least one PDF file to merge.")
             return
             
@@ -136,33 +547,160 @@ class PDFMergerApp:
         if not output_file:
             return
             
-        try:
-            # Create a new PDF document
-            merged_pdf = fitz.open()
-            
-            # Add pages from each PDF
-            for pdf_path in self.selected_files:
-                if not os.path.exists(pdf_path):
-                    raise FileNotFoundError(f"File not found: {pdf_path}")
-                    
-                pdf = fitz.open(pdf_path)
-                merged_pdf.insert_pdf(pdf)
-                pdf.close()
-                
-            # Save the merged PDF
-            merged_pdf.save(output_file)
-            merged_pdf.close()
+        files = self.files.merge_inputs()
+        self.cancel_event.clear()
+        self.merge_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self.progress.configure(value=0)
+        self.status_label.config(text="Merging...")
+        
+        self.merge_thread = threading.Thread(target=self.run_merge,
+                                             args=(files, output_file, self.dedup_var.get(),
+                                                   self.profile_var.get(),
+                                                   self.incremental_var.get(),
+                                                   "inputs" if self.bookmarks_var.get() else None))
+        self.merge_thread.daemon = True
+        self.merge_thread.start()
+        
+    def setup_logging(self):
+        log_file = "pdf_merger.log"
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler(log_file),
+                logging.StreamHandler()
+            ]
+        )
+        self.logger = logging.getLogger(__name__)
+        
+    def run_merge(self, files, output_file, dedup, profile, incremental, bookmarks):
+        """Merge in the background, marshalling updates to the Tk thread"""
+        import incremental_merge
+        import merge_engine
+        import preflight
+        
+        # Refuse bad inputs before any merge work is done
+        problems = preflight.find_problems(files, self.preflight_cache())
+        if problems:
+            message = "\n".join(problems[:10])
+            if len(problems) > 10:
+                message += f"\n... and {len(problems) - 10} more"
+            self.root.after(0, lambda: self.finish_merge(f"Merge refused: {len(problems)} unusable files"))
+            self.root.after(0, lambda: messagebox.showerror("Error", f"Cannot merge these files:\n{message}"))
+            return
             
-            self.status_label.config(text=f"Successfully merged {len(self.selected_files)} PDFs")
-            messagebox.showinfo("Success", "PDFs merged successfully!")
+        # The progress bar and ETA follow pages, which are reported within large files too
+        total_pages = preflight.count_pages(files, self.preflight_cache())
+        start = time.perf_counter()
+        
+        def progress(files_done, total_files, pages_done):
+            elapsed = time.perf_counter() - start
+            remaining = elapsed / pages_done * (total_pages - pages_done) if pages_done else None
+            self.root.after(0, lambda: self.update_progress(files_done, total_files, pages_done,
+                                                            total_pages, remaining))
             
+        self.logger.info(f"Merging {len(files)} PDFs into {output_file} (profile={profile}, dedup={dedup})")
+        try:
+            pages = None
+            if incremental:
+                # Reuses the pages of unchanged files already in the output
+                pages = incremental_merge.update_merge(files, output_file, progress=progress,
+                                                       cancel_event=self.cancel_event, dedup=dedup,
+                                                       profile=profile, tracer=self.tracer,
+                                                       bookmarks=bookmarks, lock=preflight.fitz_lock)
+            elif self.server:
+                pages = self.merge_remote(files, output_file, dedup, profile, bookmarks)
+            if pages is None:
+                # Shares PyMuPDF with the preview and preflight threads
+                pages = merge_engine.merge_files(files, output_file, progress=progress,
+                                                 cancel_event=self.cancel_event, dedup=dedup,
+                                                 profile=profile, tracer=self.tracer,
+                                                 bookmarks=bookmarks, lock=preflight.fitz_lock)
+            elapsed = time.perf_counter() - start
+            self.logger.info(f"Merged {len(files)} PDFs ({pages} pages) into {output_file} in {elapsed:.2f}s")
+            self.root.after(0, lambda: self.finish_merge(
+                f"Successfully merged {len(files)} PDFs ({pages} pages) in {elapsed:.1f}s"))
+            self.root.after(0, lambda: messagebox.showinfo("Success", "PDFs merged successfully!"))
+        except merge_engine.MergeCancelled:
+            self.logger.info(f"Merge into {output_file} cancelled")
+            self.root.after(0, lambda: self.finish_merge("Merge cancelled"))
         except Exception as e:
-            self.status_label.config(text="Error during merge")
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            error = str(e)
+            self.logger.error(f"Error merging into {output_file}: {error}")
+            self.root.after(0, lambda: self.finish_merge("Error during merge"))
+            self.root.after(0, lambda: messagebox.showerror("Error", f"An error occurred: {error}"))
+            
+    def merge_remote(self, files, output_file, dedup, profile, bookmarks):
+        """Run the merge on the merge service; None if the service is unreachable"""
+        import merge_engine
+        import merge_service
+        
+        client = merge_service.MergeClient(self.server)
+        try:
+            job = client.submit(files, output_file, dedup=dedup, profile=profile,
+                                bookmarks=bookmarks)
+        except OSError as e:
+            self.logger.warning(f"Merge service at {self.server} unreachable ({e}), merging locally")
+            return None
+        self.root.after(0, lambda: self.status_label.config(text="Merging on the merge service..."))
+        cancel_sent = False
+        while True:
+            info = client.status(job["id"], wait=0.5)
+            if info["status"] == "done":
+                return info["pages"]
+            if info["status"] == "failed":
+                raise RuntimeError(info["error"])
+            if info["status"] == "cancelled":
+                raise merge_engine.MergeCancelled("Merge cancelled")
+            if self.cancel_event.is_set() and not cancel_sent:
+                cancel_sent = True
+                try:
+                    client.cancel(job["id"])
+                except merge_service.ServiceError:
+                    pass  # already running; it cannot be stopped, so wait for it
+                
+    def update_progress(self, files_done, total_files, pages_done, total_pages, remaining):
+        self.progress.configure(value=pages_done, maximum=max(total_pages, 1))
+        text = f"Merged {files_done}/{total_files} files ({pages_done}/{total_pages} pages)"
+        if remaining is not None:
+            text += f" - about {int(max(remaining, 0)) + 1}s remaining"
+        self.status_label.config(text=text)
+        
+    def finish_merge(self, message):
+        self.progress.configure(value=0)
+        self.status_label.config(text=message)
+        self.merge_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        
+    def cancel_merge(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.status_label.config(text="Cancelling...")
+        
+    def close(self):
+        # Stop any running merge so it does not write output after the window is gone
+        self.cancel_event.set()
+        self.preflight_queue.shutdown(wait=False, cancel_futures=True)
+        if self.thumbnails is not None:
+            self.thumbnails.close()
+        self.root.destroy()
 
 def main():
+    # Any command-line arguments switch to headless batch mode
+    if len(sys.argv) > 1 and sys.argv[1] == "split" and not os.path.exists("split"):
+        import split_engine
+        
+        sys.exit(split_engine.main(sys.argv[2:]))
+    if len(sys.argv) > 1:
+        import merge_engine
+        
+        sys.exit(merge_engine.main(sys.argv[1:]))
+        
+    started = time.perf_counter()
     root = tk.Tk()
     app = PDFMergerApp(root)
+    app.report_ready(started)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+import abc
+import os
+import sys
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import fitz  # PyMuPDF
+
+from dir_scanner import DEFAULT_INCLUDE, _matches
+from file_collection import natural_key
+
+# Separates an archive from a member in command-line inputs: docs.zip!2024/report.pdf
+MEMBER_SEPARATOR = "!"
+
+# Archives kept open by open_archive; the least recently used is closed beyond this
+MAX_OPEN_ARCHIVES = 8
+
+
+class PdfSource(abc.ABC):
+    """A merge input that is not a file of its own: a buffer or an archive member.
+
+    Sources can be given to the merge engine wherever a path is accepted,
+    alone or as the first item of a ``(source, page_spec)`` pair. The PDF is
+    opened from memory with ``fitz.open(stream=...)``, so nothing is
+    extracted to a temporary file first. ``read`` is called each time the
+    source is opened, so large members are only held while in use.
+    Subclasses implement ``size`` and ``read``.
+    """
+
+    name = "<source>"
+
+    @property
+    @abc.abstractmethod
+    def size(self) -> int:
+        """The size of the PDF in bytes."""
+
+    @abc.abstractmethod
+    def read(self) -> bytes:
+        """Return the whole PDF."""
+
+    def open(self):
+        return fitz.open(stream=self.read(), filetype="pdf")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+
+class BufferSource(PdfSource):
+    """A PDF in memory: ``bytes``, ``bytearray``, ``memoryview`` or an ``mmap``.
+
+    PyMuPDF reads ``bytes`` in place. It only accepts ``bytes``, so any other
+    buffer is copied into one when the source is opened; that is still one
+    copy in memory instead of a write and a read through a temporary file.
+    Buffers compare by identity: equal contents are still separate inputs.
+    """
+
+    def __init__(self, data, name: str = "<buffer>"):
+        self.data = data
+        self.name = name
+
+    @property
+    def size(self) -> int:
+        return memoryview(self.data).nbytes
+
+    def read(self) -> bytes:
+        if isinstance(self.data, bytes):
+            return self.data
+        with memoryview(self.data) as view:
+            return view.tobytes()
+
+
+class ZipMember(PdfSource):
+    """A PDF inside a ZIP archive, decompressed straight into memory.
+
+    Members are equal when they name the same member of the same archive
+    file, so duplicate inputs can be dropped like duplicate paths.
+    """
+
+    def __init__(self, archive: str, member: str):
+        self.archive = archive
+        self.member = member
+        self.name = f"{archive}{MEMBER_SEPARATOR}{member}"
+        self._size = None
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = open_archive(self.archive).getinfo(self.member).file_size
+        return self._size
+
+    def read(self) -> bytes:
+        return open_archive(self.archive).read(self.member)
+
+    def _key(self):
+        return os.path.abspath(self.archive), self.member
+
+    def __eq__(self, other):
+        if not isinstance(other, ZipMember):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+_archives = OrderedDict()  # absolute path -> ((mtime_ns, size), ZipFile)
+_archives_lock = threading.Lock()
+
+
+def open_archive(archive: str) -> zipfile.ZipFile:
+    """Return an open ``ZipFile``, shared by all members of the same archive.
+
+    Opening an archive parses its whole central directory, which would
+    otherwise be repeated for every member. The archive is opened again
+    if it changes on disk. At most ``MAX_OPEN_ARCHIVES`` stay open; older
+    ones, and replaced versions, are closed so long GUI or service
+    sessions do not leak file handles. A member being read when its
+    archive is closed finishes first: ``ZipFile`` keeps the file open
+    until its last open member is done.
+    """
+    path = os.path.abspath(archive)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    stale = []
+    with _archives_lock:
+        entry = _archives.get(path)
+        if entry is not None and entry[0] == signature:
+            _archives.move_to_end(path)
+            return entry[1]
+        if entry is not None:
+            stale.append(entry[1])
+        zf = zipfile.ZipFile(path)
+        _archives[path] = (signature, zf)
+        _archives.move_to_end(path)
+        while len(_archives) > MAX_OPEN_ARCHIVES:
+            stale.append(_archives.popitem(last=False)[1][1])
+    for old in stale:
+        old.close()
+    return zf
+
+
+def is_source(item) -> bool:
+    return isinstance(item, PdfSource)
+
+
+def source_name(item) -> str:
+    """Return a printable name for a path or source."""
+    return item.name if is_source(item) else item
+
+
+def zip_members(archive: str, include: Sequence[str] = DEFAULT_INCLUDE) -> List[ZipMember]:
+    """Return the members of ``archive`` matching ``include``, in natural order."""
+    patterns = [p.lower() for p in include] or ["*"]
+    infos = [info for info in open_archive(archive).infolist() if not info.is_dir()
+             and _matches(os.path.basename(info.filename), info.filename, patterns)]
+    infos.sort(key=lambda info: natural_key(info.filename))
+    sources = []
+    for info in infos:
+        source = ZipMember(archive, info.filename)
+        source._size = info.file_size
+        sources.append(source)
+    return sources
+
+
+def parse_source(arg: str, include: Sequence[str] = DEFAULT_INCLUDE) -> Optional[List[PdfSource]]:
+    """Turn a command-line input into sources, or return ``None`` for a plain path.
+
+    ``-`` reads one PDF from standard input, ``archive.zip!member.pdf`` takes
+    one member, and an existing ``.zip`` file stands for all its members
+    that match ``include``.
+    """
+    if arg == "-":
+        return [BufferSource(sys.stdin.buffer.read(), "<stdin>")]
+    if MEMBER_SEPARATOR in arg and not os.path.exists(arg):
+        archive, member = arg.split(MEMBER_SEPARATOR, 1)
+        if os.path.isfile(archive) and zipfile.is_zipfile(archive):
+            return [ZipMember(archive, member)]
+    if arg.lower().endswith(".zip") and os.path.isfile(arg):
+        return zip_members(arg, include)
+    return None
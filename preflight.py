@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+import merge_engine
+from pdf_sources import is_source
+
+_PDF_HEADER = re.compile(rb"%PDF-(\d\.\d)")
+
+# MuPDF is not thread-safe: every thread of the GUI (preflight, thumbnails and
+# the merge, see merge_engine.merge_files) takes this lock around PyMuPDF calls
+fitz_lock = threading.Lock()
+
+
+class PdfInfo:
+    """Metadata gathered for one input without loading any page content."""
+
+    def __init__(self, path: str, size: int = 0, page_count: int = 0,
+                 encrypted: bool = False, needs_password: bool = False,
+                 version: str = "", error: Optional[str] = None):
+        self.path = path
+        self.size = size
+        self.page_count = page_count
+        self.encrypted = encrypted
+        self.needs_password = needs_password
+        self.version = version
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None and not self.needs_password
+
+    @property
+    def problem(self):
+        if self.error:
+            return self.error
+        if self.needs_password:
+            return "password protected"
+        return None
+
+
+def scan_pdf(path: str) -> PdfInfo:
+    """Read size, PDF version, page count and encryption state of ``path``."""
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        return PdfInfo(path, error=f"cannot access file ({e.strerror})")
+
+    info = PdfInfo(path, size=stat.st_size)
+    try:
+        with open(path, "rb") as f:
+            header = f.read(1024)
+        _inspect(info, header, lambda: fitz.open(path))
+    except Exception as e:
+        info.error = f"cannot open PDF ({e})"
+    return info
+
+
+def scan_source(source) -> PdfInfo:
+    """``scan_pdf`` for a ``pdf_sources.PdfSource``; the result is not cached."""
+    try:
+        data = source.read()
+    except Exception as e:
+        return PdfInfo(source.name, error=f"cannot read input ({e})")
+    info = PdfInfo(source.name, size=len(data))
+    try:
+        _inspect(info, data[:1024], lambda: fitz.open(stream=data, filetype="pdf"))
+    except Exception as e:
+        info.error = f"cannot open PDF ({e})"
+    return info
+
+
+def _inspect(info, header, open_document):
+    # The header may be preceded by junk, but must be within the first 1 KB
+    match = _PDF_HEADER.search(header)
+    if not match:
+        info.error = "not a PDF file"
+        return
+    info.version = match.group(1).decode()
+
+    # Opening only parses the trailer and xref; no page is loaded
+    with fitz_lock:
+        doc = open_document()
+        try:
+            info.encrypted = bool(doc.is_encrypted or doc.needs_pass)
+            info.needs_password = bool(doc.needs_pass)
+            if not info.needs_password:
+                info.page_count = doc.page_count
+        finally:
+            doc.close()
+
+
+class PreflightCache:
+    """Thread-safe cache of ``PdfInfo`` keyed by path, mtime and size.
+
+    Scans run on ``max_workers`` threads, but only the file access overlaps
+    (stat, the header read, waiting on slow or network drives). Parsing
+    the xref with MuPDF happens under ``fitz_lock``, one file at a time.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self.infos: Dict[str, tuple] = {}  # path -> (signature, PdfInfo)
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[PdfInfo]:
+        """Return the cached info for ``path`` if it is still current."""
+        with self.lock:
+            entry = self.infos.get(path)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return entry[1] if entry[0] == (stat.st_mtime_ns, stat.st_size) else None
+
+    def _scan_one(self, path):
+        info = self.get(path)
+        if info is not None:
+            return info
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        info = scan_pdf(path)
+        if signature is not None:
+            with self.lock:
+                self.infos[path] = (signature, info)
+        return info
+
+    def scan(self, paths: List[str]) -> List[PdfInfo]:
+        """Scan ``paths`` concurrently, reusing cached results, in input order."""
+        if len(paths) <= 1:
+            return [self._scan_one(p) for p in paths]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self._scan_one, paths))
+
+
+def find_problems(inputs, cache: Optional[PreflightCache] = None) -> List[str]:
+    """Return one message per unusable input; empty if the merge can go ahead.
+
+    ``inputs`` are merge inputs (paths or ``(path, page_spec)`` pairs). Page
+    selections are checked against each file's page count. Sources (see
+    ``pdf_sources``) are read and checked one by one.
+    """
+    cache = cache or PreflightCache()
+    items = [merge_engine.split_input(item) for item in inputs]
+    paths = [path for path, _ in items if not is_source(path)]
+    by_path = {info.path: info for info in cache.scan(list(dict.fromkeys(paths)))}
+
+    problems = []
+    for path, page_spec in items:
+        info = scan_source(path) if is_source(path) else by_path[path]
+        if not info.ok:
+            problems.append(f"{info.path}: {info.problem}")
+        elif page_spec:
+            try:
+                merge_engine.parse_page_spec(page_spec, info.page_count)
+            except ValueError as e:
+                problems.append(f"{info.path}: {e}")
+    return problems
+
+
+def count_pages(inputs, cache: Optional[PreflightCache] = None) -> int:
+    """Return how many pages merging ``inputs`` copies, from their pre-flight scans.
+
+    Meant for inputs ``find_problems`` accepted; scans already in ``cache``
+    are reused, so this adds no file access for them.
+    """
+    cache = cache or PreflightCache()
+    items = [merge_engine.split_input(item) for item in inputs]
+    paths = [path for path, _ in items if not is_source(path)]
+    by_path = {info.path: info for info in cache.scan(list(dict.fromkeys(paths)))}
+
+    total = 0
+    for path, page_spec in items:
+        info = scan_source(path) if is_source(path) else by_path[path]
+        total += (len(merge_engine.parse_page_spec(page_spec, info.page_count)) if page_spec
+                  else info.page_count)
+    return total
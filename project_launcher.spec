@@ -9,9 +9,23 @@ a = Analysis(
     datas=[
         ('requirements.txt', '.'),
         ('python_setup.py', '.'),
-        ('pdf_merger.py', '.')
+        ('pdf_merger.py', '.'),
+        ('merge_engine.py', '.'),
+        ('input_cache.py', '.'),
+        ('preflight.py', '.'),
+        ('file_collection.py', '.'),
+        ('dir_scanner.py', '.'),
+        ('merge_trace.py', '.'),
+        ('merge_service.py', '.'),
+        ('job_journal.py', '.'),
+        ('incremental_merge.py', '.'),
+        ('env_cache.py', '.'),
+        ('thumbnails.py', '.'),
+        ('pdf_sources.py', '.'),
+        ('split_engine.py', '.'),
+        ('install_cache.py', '.')
     ],
-    hiddenimports=[],
+    hiddenimports=['pdf_merger', 'merge_engine', 'preflight', 'incremental_merge', 'merge_service', 'thumbnails', 'split_engine', 'install_cache'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
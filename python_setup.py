@@ -5,12 +5,17 @@ import platform
 import logging
 import tkinter as tk
 from tkinter import ttk, messagebox
-import urllib.request
 import json
 import tempfile
 import shutil
 from pathlib import Path
 import ctypes
+import threading
+import time
+
+from env_cache import EnvironmentCache, pip_version
+from install_cache import (INSTALLER_SHA256_ENV, DownloadCache, find_wheelhouse, get_pip_url,
+                           pip_install_command, python_mirror, timed)
 
 class PythonSetupTool:
     def __init__(self):
@@ -20,6 +25,9 @@ class PythonSetupTool:
         # Check for admin privileges
         self.is_admin = self.check_admin_privileges()
         
+        # Installers and get-pip.py are downloaded once and reused
+        self.downloads = DownloadCache()
+        
         # Initialize GUI
         self.root = tk.Tk()
         self.root.title("Python Environment Setup Tool")
@@ -81,8 +89,14 @@ class PythonSetupTool:
     def update_system_info(self):
         info = f"OS: {platform.system()} {platform.release()}\n"
         info += f"Python: {sys.version.split()[0] if sys.version else 'Not installed'}\n"
-        info += f"Pip: {self.get_pip_version() if self.check_pip() else 'Not installed'}"
-        self.system_info.config(text=info)
+        self.system_info.config(text=info + "Pip: checking...")
+        
+        # Filled in from a thread so the window shows at once
+        def load_pip_version():
+            pip_info = f"Pip: {self.get_pip_version() if self.check_pip() else 'Not installed'}"
+            self.root.after(0, lambda: self.system_info.config(text=info + pip_info))
+            
+        threading.Thread(target=load_pip_version, daemon=True).start()
         
     def log_and_update(self, message):
         self.logger.info(message)
@@ -91,20 +105,12 @@ class PythonSetupTool:
         self.root.update()
         
     def check_pip(self):
-        try:
-            subprocess.run([sys.executable, "-m", "pip", "--version"], 
-                         capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
+        return pip_version() is not None
             
     def get_pip_version(self):
+        # Read from the installed package metadata instead of starting pip
         try:
-            result = subprocess.run([sys.executable, "-m", "pip", "--version"],
-                                  capture_output=True, text=True)
-            # Extract just the version number from pip output
-            version = result.stdout.split()[1]
-            return version
+            return pip_version() or "Unknown"
         except Exception as e:
             logging.error(f"Error getting pip version: {e}")
             return "Unknown"
@@ -112,25 +118,29 @@ class PythonSetupTool:
     def download_python_installer(self):
         # Get latest Python version from python.org
         try:
-            response = urllib.request.urlopen("https://www.python.org/ftp/python/")
-            versions = [v for v in response.read().decode().split() if v.startswith("3.")]
+            # The version listing changes rarely; refresh it once a day
+            mirror = python_mirror()
+            listing = self.downloads.fetch_text(f"{mirror}/", max_age=24 * 3600)
+            versions = [v for v in listing.split() if v.startswith("3.")]
             latest_version = max(versions)
             
             # Determine installer URL based on system
             if platform.system() == "Windows":
                 if platform.machine().endswith('64'):
-                    installer_url = f"https://www.python.org/ftp/python/{latest_version}/python-{latest_version}-amd64.exe"
+                    installer_url = f"{mirror}/{latest_version}/python-{latest_version}-amd64.exe"
                 else:
-                    installer_url = f"https://www.python.org/ftp/python/{latest_version}/python-{latest_version}.exe"
+                    installer_url = f"{mirror}/{latest_version}/python-{latest_version}.exe"
             else:
                 raise NotImplementedError("Non-Windows platforms not supported yet")
                 
-            # Download installer
-            self.log_and_update(f"Downloading Python {latest_version} installer...")
+            # Download installer, resuming a partial download and verifying it
+            self.log_and_update(f"Getting Python {latest_version} installer...")
+            cached = self.downloads.fetch(installer_url, sha256=os.environ.get(INSTALLER_SHA256_ENV))
+            
+            # The installer must run under an .exe name; the cached copy has none
             temp_dir = tempfile.gettempdir()
             installer_path = os.path.join(temp_dir, "python_installer.exe")
-            
-            urllib.request.urlretrieve(installer_url, installer_path)
+            shutil.copyfile(cached, installer_path)
             return installer_path
             
         except Exception as e:
@@ -151,46 +161,33 @@ class PythonSetupTool:
     def install_pip(self):
         try:
             self.log_and_update("Installing pip...")
-            # Download get-pip.py
-            get_pip_url = "https://bootstrap.pypa.io/get-pip.py"
-            temp_dir = tempfile.gettempdir()
-            get_pip_path = os.path.join(temp_dir, "get-pip.py")
+            # get-pip.py is reused from the download cache for a week
+            get_pip_path = self.downloads.fetch(get_pip_url(), max_age=7 * 24 * 3600)
             
-            urllib.request.urlretrieve(get_pip_url, get_pip_path)
-            
-            # Install pip
-            subprocess.run([sys.executable, get_pip_path], check=True)
+            # Install pip, from the wheelhouse when installing offline
+            cmd = [sys.executable, get_pip_path]
+            wheelhouse = find_wheelhouse()
+            if wheelhouse:
+                cmd += ["--no-index", "--find-links", wheelhouse]
+            subprocess.run(cmd, check=True)
             self.log_and_update("Pip installation completed successfully")
             
-            # Clean up
-            os.remove(get_pip_path)
-            
         except Exception as e:
             self.log_and_update(f"Error installing pip: {str(e)}")
             raise
             
-    def upgrade_pip(self):
+    def install_requirements(self, upgrade_pip=False):
         try:
-            self.log_and_update("Upgrading pip...")
-            # Use --user flag if not running as admin
-            cmd = [sys.executable, "-m", "pip", "install", "--upgrade", "pip"]
-            if not self.is_admin:
-                cmd.append("--user")
-                
-            subprocess.run(cmd, check=True)
-            self.log_and_update("Pip upgrade completed successfully")
-        except subprocess.CalledProcessError as e:
-            self.log_and_update(f"Error upgrading pip: {str(e)}")
-            raise
-            
-    def install_requirements(self):
-        try:
-            self.log_and_update("Installing requirements...")
+            # One pip run upgrades pip and installs the requirements, using
+            # the local wheelhouse (offline) when there is one
+            wheelhouse = find_wheelhouse()
+            if wheelhouse:
+                self.log_and_update(f"Installing requirements offline from {wheelhouse}...")
+            else:
+                self.log_and_update("Installing requirements...")
             # Use --user flag if not running as admin
-            cmd = [sys.executable, "-m", "pip", "install", "-r", "requirements.txt"]
-            if not self.is_admin:
-                cmd.append("--user")
-                
+            cmd = pip_install_command(wheelhouse=wheelhouse, user=not self.is_admin,
+                                      upgrade_pip=upgrade_pip)
             subprocess.run(cmd, check=True)
             self.log_and_update("Requirements installation completed successfully")
         except subprocess.CalledProcessError as e:
@@ -198,6 +195,14 @@ class PythonSetupTool:
             raise
             
     def start_setup(self):
+        start = time.perf_counter()
+        environment = EnvironmentCache()
+        if environment.is_current():
+            self.log_and_update("Python environment unchanged since last setup. Nothing to do.")
+            self.progress['value'] = 100
+            self.root.after(1500, self.root.destroy)
+            return
+            
         try:
             if not self.is_admin:
                 self.log_and_update("Warning: Running without administrator privileges. Some operations may fail.")
@@ -212,25 +217,28 @@ class PythonSetupTool:
             # Check Python installation
             if not sys.executable:
                 self.log_and_update("Python not found. Downloading installer...")
-                installer_path = self.download_python_installer()
+                with timed("Python installer download", self.log_and_update):
+                    installer_path = self.download_python_installer()
                 self.progress['value'] = 30
-                self.install_python(installer_path)
+                with timed("Python installation", self.log_and_update):
+                    self.install_python(installer_path)
                 self.progress['value'] = 60
                 
-            # Check and upgrade pip
-            if not self.check_pip():
+            # Install pip if missing; otherwise it is upgraded with the requirements
+            has_pip = self.check_pip()
+            if not has_pip:
                 self.log_and_update("Pip not found. Installing pip...")
-                self.install_pip()
-            else:
-                self.log_and_update("Upgrading pip...")
-                self.upgrade_pip()
+                with timed("Pip installation", self.log_and_update):
+                    self.install_pip()
             self.progress['value'] = 80
             
             # Install requirements
-            self.install_requirements()
+            with timed("Requirements installation", self.log_and_update):
+                self.install_requirements(upgrade_pip=has_pip)
             self.progress['value'] = 100
             
-            self.log_and_update("Setup completed successfully!")
+            environment.record()
+            self.log_and_update(f"Setup completed successfully in {time.perf_counter() - start:.1f}s!")
             messagebox.showinfo("Success", "Python environment setup completed successfully!")
             
             # Close the window after a short delay
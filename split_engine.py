@@ -0,0 +1,474 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import fitz  # PyMuPDF
+
+from merge_engine import (SAVE_PROFILES, apply_outline, input_size, input_title, insert_runs,
+                          open_input, outline_entries, page_runs, parse_page_spec, partial_path,
+                          read_outline, save_options, validate_page_spec)
+from pdf_sources import parse_source, source_name
+
+logger = logging.getLogger(__name__)
+
+# Output names; {stem} is the source file name without extension, {n} the
+# 1-based part number, {first}/{last} its first and last source page and
+# {title} the bookmark a part starts at (bookmark mode only)
+DEFAULT_PATTERN = "{stem}-{n:03d}.pdf"
+DEFAULT_BOOKMARK_PATTERN = "{stem}-{n:03d}-{title}.pdf"
+
+# Planned parts aim this far under the byte limit, since sizes are estimated
+SIZE_MARGIN = 0.95
+
+# Bytes of page dictionary, xref entries and trailer per output, roughly
+PAGE_OVERHEAD = 300
+FILE_OVERHEAD = 1024
+
+_UNSAFE_NAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+class SplitPart:
+    """One output of a split: a file and the 0-based source pages it gets, in order."""
+
+    def __init__(self, output: Optional[str], pages: List[int], title: Optional[str] = None):
+        self.output = output
+        self.pages = list(pages)
+        self.title = title
+        self.size = 0
+
+    def __repr__(self):
+        return f"SplitPart({self.output!r}, {len(self.pages)} pages)"
+
+
+def plan_by_pages(page_count: int, pages_per_part: int) -> List[SplitPart]:
+    """Cut the source into parts of ``pages_per_part`` pages (the last may be shorter)."""
+    if pages_per_part < 1:
+        raise ValueError("Pages per part must be at least 1")
+    return [SplitPart(None, range(start, min(start + pages_per_part, page_count)))
+            for start in range(0, page_count, pages_per_part)]
+
+
+def plan_by_bookmarks(doc, level: int = 1) -> List[SplitPart]:
+    """Start a new part at every bookmark of ``level`` or above.
+
+    Pages before the first such bookmark form a part of their own. Several
+    bookmarks on the same page start one part, titled by the first.
+    """
+    starts = {}
+    for entry_level, title, page, _ in read_outline(doc):
+        if entry_level <= level and 0 <= page < doc.page_count:
+            starts.setdefault(page, title)
+    if not starts:
+        raise ValueError(f"No bookmarks at level {level} or above to split at")
+    if 0 not in starts:
+        starts[0] = None
+    pages = sorted(starts)
+    return [SplitPart(None, range(start, end), starts[start])
+            for start, end in zip(pages, pages[1:] + [doc.page_count])]
+
+
+def _stream_length(doc, xref):
+    kind, value = doc.xref_get_key(xref, "Length")
+    if kind == "int":
+        return int(value)
+    if kind == "xref":
+        return int(doc.xref_object(int(value.split()[0])))
+    return len(doc.xref_stream_raw(xref))
+
+
+def _font_streams(doc, xref):
+    """Return the xrefs of the font programs embedded for font ``xref``."""
+    fonts = [xref]
+    kind, value = doc.xref_get_key(xref, "DescendantFonts")
+    if kind == "array":
+        fonts.extend(int(n) for n in re.findall(r"(\d+) 0 R", value))
+    elif kind == "xref":
+        fonts.extend(int(n) for n in re.findall(r"(\d+) 0 R", doc.xref_object(int(value.split()[0]))))
+    streams = []
+    for font in fonts:
+        kind, value = doc.xref_get_key(font, "FontDescriptor")
+        if kind != "xref":
+            continue
+        descriptor = int(value.split()[0])
+        for key in ("FontFile", "FontFile2", "FontFile3"):
+            kind, value = doc.xref_get_key(descriptor, key)
+            if kind == "xref":
+                streams.append(int(value.split()[0]))
+    return streams
+
+
+def page_weights(doc):
+    """Estimate what each page adds to an output, for ``plan_by_size``.
+
+    Returns one ``(own_bytes, resources)`` pair per page: the size of its
+    content streams, and a mapping of the xrefs of the images, form
+    XObjects and embedded fonts it uses to their stream sizes. Resources
+    shared between pages are only stored once per output, so they are
+    counted once per part. Sizes are the compressed lengths from each
+    stream's dictionary; no stream is decompressed.
+    """
+    sizes = {}
+
+    def size_of(xref):
+        if xref not in sizes:
+            try:
+                sizes[xref] = _stream_length(doc, xref)
+            except Exception:
+                sizes[xref] = 0
+        return sizes[xref]
+
+    font_streams = {}
+    weights = []
+    for page in doc:
+        own = PAGE_OVERHEAD + sum(size_of(xref) for xref in page.get_contents())
+        resources = {}
+        for image in page.get_images(full=True):
+            resources[image[0]] = size_of(image[0])
+        for xobject in page.get_xobjects():
+            resources[xobject[0]] = size_of(xobject[0])
+        for font in page.get_fonts(full=True):
+            if font[0] not in font_streams:
+                font_streams[font[0]] = _font_streams(doc, font[0])
+            for xref in font_streams[font[0]]:
+                resources[xref] = size_of(xref)
+        weights.append((own, resources))
+    return weights
+
+
+def plan_by_size(doc, max_bytes: int) -> List[SplitPart]:
+    """Cut the source into consecutive parts estimated to stay under ``max_bytes``.
+
+    Pages are added to a part while the estimate (see ``page_weights``)
+    stays under ``SIZE_MARGIN * max_bytes``. The estimate is checked when
+    the parts are written; see ``write_parts``.
+    """
+    budget = max_bytes * SIZE_MARGIN
+    parts = []
+    pages, used, total = [], set(), FILE_OVERHEAD
+    for number, (own, resources) in enumerate(page_weights(doc)):
+        added = own + sum(size for xref, size in resources.items() if xref not in used)
+        if pages and total + added > budget:
+            parts.append(SplitPart(None, pages))
+            pages, used, total = [], set(), FILE_OVERHEAD
+            added = own + sum(resources.values())
+        pages.append(number)
+        used.update(resources)
+        total += added
+    if pages:
+        parts.append(SplitPart(None, pages))
+    return parts
+
+
+def load_mapping(mapping_path: str) -> List[tuple]:
+    """Load ``(output, page_spec)`` pairs from a CSV or JSON mapping file.
+
+    JSON mappings are an object of output path to page selection, or a list
+    of ``{"output": ..., "pages": ...}`` objects. CSV mappings have one
+    ``output,pages`` row per selection; rows for the same output are
+    joined in file order. Relative outputs are resolved against the
+    mapping's directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(mapping_path))
+    rows = []
+    if mapping_path.lower().endswith(".json"):
+        with open(mapping_path, encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data.items() if isinstance(data, dict) else [
+            (entry["output"], entry["pages"]) for entry in data]
+        rows = [(output, str(pages)) for output, pages in entries]
+    else:
+        with open(mapping_path, newline="", encoding="utf-8") as f:
+            for line_no, row in enumerate(csv.reader(f), start=1):
+                if not row or row[0].startswith("#"):
+                    continue
+                if line_no == 1 and [c.strip().lower() for c in row[:2]] == ["output", "pages"]:
+                    continue
+                if len(row) < 2:
+                    raise ValueError(f"{mapping_path}:{line_no}: expected 'output,pages'")
+                rows.append((row[0].strip(), row[1].strip()))
+
+    # Keep outputs in first-seen order
+    mapping = {}
+    for output, pages in rows:
+        validate_page_spec(pages)
+        output = output if os.path.isabs(output) else os.path.join(base_dir, output)
+        mapping[output] = f"{mapping[output]},{pages}" if output in mapping else pages
+    return list(mapping.items())
+
+
+def plan_by_mapping(mapping: List[tuple], page_count: int) -> List[SplitPart]:
+    """One part per ``(output, page_spec)`` pair; pages may go to several outputs."""
+    return [SplitPart(output, parse_page_spec(spec, page_count)) for output, spec in mapping]
+
+
+def _write_part(pdf, pages, output, options, outline):
+    """Write ``pages`` of ``pdf`` to a temporary file next to ``output``; return its path."""
+    part = fitz.open()
+    try:
+        insert_runs(part, pdf, page_runs(pages))
+        if outline:
+            rows = outline_entries(pdf, 0, pages, outline=outline)
+            if rows:
+                apply_outline(part, rows)
+        partial = partial_path(output)
+        try:
+            part.save(partial, **options)
+        except BaseException:
+            _discard(partial)
+            raise
+        return partial
+    finally:
+        part.close()
+
+
+def _write_batch(source, batch, profile, max_bytes, keep_outline):
+    """Write a batch of ``(output, pages)`` parts from one opening of ``source``.
+
+    Returns, per part, the ``(partial_path, pages, size)`` files written.
+    With ``max_bytes``, a part that turns out larger is split in half and
+    written again until every file fits or holds a single page.
+    """
+    options = save_options(profile)
+    pdf = open_input(source)
+    results = []
+    try:
+        outline = read_outline(pdf) if keep_outline else None
+        for output, pages in batch:
+            written = []
+            results.append(written)
+            pending = [pages]
+            while pending:
+                pages = pending.pop(0)
+                partial = _write_part(pdf, pages, output, options, outline)
+                size = os.path.getsize(partial)
+                if max_bytes and size > max_bytes and len(pages) > 1:
+                    _discard(partial)
+                    half = len(pages) // 2
+                    pending[:0] = [pages[:half], pages[half:]]
+                    continue
+                if size > max_bytes > 0:
+                    logger.warning(f"Page {pages[0] + 1} of {source_name(source)} alone is "
+                                   f"{size / 1024 / 1024:.1f} MB, over the size limit")
+                written.append((partial, pages, size))
+        return results
+    except BaseException:
+        _discard_written(results)
+        raise
+    finally:
+        pdf.close()
+
+
+def _batches(items, workers):
+    # A few batches per worker balances the load; each batch opens the source once
+    size = max(1, -(-len(items) // (workers * 4)))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def part_name(pattern: str, source, number: int, pages: List[int],
+              title: Optional[str] = None) -> str:
+    """Format an output name from ``pattern``; see ``DEFAULT_PATTERN``."""
+    title = _UNSAFE_NAME.sub("_", title or input_title(source)).strip(" .") or "untitled"
+    return pattern.format(stem=input_title(source), n=number, first=pages[0] + 1,
+                          last=pages[-1] + 1, title=title[:80])
+
+
+def write_parts(source, parts: List[SplitPart], pattern: str = DEFAULT_PATTERN,
+                profile: str = "fast", workers: int = 1, max_bytes: int = 0,
+                keep_outline: bool = True) -> List[SplitPart]:
+    """Write the planned ``parts`` of ``source`` and return the parts written.
+
+    ``source`` is a path or ``pdf_sources.PdfSource``. Parts without an
+    output are named from ``pattern``, numbered in order. With ``workers``
+    above one, consecutive parts are written in batches on a process pool;
+    each batch opens the source once, and each part is saved and closed
+    before the next, so memory holds one part at a time. With
+    ``max_bytes``, parts larger than that are halved until they fit (a
+    single page that is larger is written as it is, with a warning). Parts
+    keep the bookmarks that point into them unless ``keep_outline`` is
+    false. Every file is written under a temporary name and renamed into
+    place once all parts are done, so a failed split leaves no outputs.
+    """
+    save_options(profile)
+    # Unnamed parts are written next to where the first of them will go
+    placeholder = part_name(pattern, source, 1, [0], parts[0].title if parts else None)
+    batch_items = [(part.output or placeholder, part.pages) for part in parts]
+    for directory in {os.path.dirname(os.path.abspath(output)) for output, _ in batch_items}:
+        os.makedirs(directory, exist_ok=True)
+
+    if workers > 1 and len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_write_batch, source, batch, profile, max_bytes,
+                                       keep_outline)
+                       for batch in _batches(batch_items, workers)]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append(e)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if errors:
+            for outcome in outcomes:
+                if not isinstance(outcome, Exception):
+                    _discard_written(outcome)
+            raise errors[0]
+        written = [files for outcome in outcomes for files in outcome]
+    else:
+        written = _write_batch(source, batch_items, profile, max_bytes, keep_outline)
+
+    renames = []
+    number = 0
+    for part, files in zip(parts, written):
+        for index, (partial, pages, size) in enumerate(files, start=1):
+            number += 1
+            if part.output is None:
+                output = part_name(pattern, source, number, pages, part.title)
+            elif len(files) == 1:
+                output = part.output
+            else:
+                # A named part that had to be halved to fit max_bytes
+                root, ext = os.path.splitext(part.output)
+                output = f"{root}-{index}{ext}"
+            result = SplitPart(output, pages, part.title)
+            result.size = size
+            renames.append((partial, result))
+    try:
+        for partial, result in renames:
+            os.makedirs(os.path.dirname(os.path.abspath(result.output)), exist_ok=True)
+            os.replace(partial, result.output)
+    except BaseException:
+        _discard_written(written)
+        raise
+    return [result for _, result in renames]
+
+
+def _discard(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _discard_written(written):
+    for files in written:
+        for partial, _, _ in files:
+            _discard(partial)
+
+
+def split_pdf(source, mode: str, value=None, pattern: Optional[str] = None,
+              profile: str = "fast", workers: int = 1,
+              keep_outline: bool = True) -> List[SplitPart]:
+    """Split ``source`` and return the parts written.
+
+    ``mode`` is ``"pages"`` (``value`` pages per part), ``"size"``
+    (``value`` bytes at most per part), ``"bookmarks"`` (a part per
+    bookmark of level ``value`` or above, default 1) or ``"mapping"``
+    (``value`` is a list of ``(output, page_spec)`` pairs, see
+    ``load_mapping``). See ``write_parts`` for the other options.
+    """
+    start = time.perf_counter()
+    with open_input(source) as doc:
+        if doc.needs_pass:
+            raise ValueError(f"{source_name(source)} is password protected")
+        if mode == "pages":
+            parts = plan_by_pages(doc.page_count, int(value))
+        elif mode == "size":
+            parts = plan_by_size(doc, int(value))
+        elif mode == "bookmarks":
+            parts = plan_by_bookmarks(doc, int(value or 1))
+        elif mode == "mapping":
+            parts = plan_by_mapping(value, doc.page_count)
+        else:
+            raise ValueError(f"Unknown split mode {mode!r}")
+    if pattern is None:
+        pattern = DEFAULT_BOOKMARK_PATTERN if mode == "bookmarks" else DEFAULT_PATTERN
+    logger.info(f"Planned {len(parts)} parts of {source_name(source)} "
+                f"in {time.perf_counter() - start:.2f}s")
+
+    written = write_parts(source, parts, pattern, profile, workers,
+                          max_bytes=int(value) if mode == "size" else 0,
+                          keep_outline=keep_outline)
+    logger.info(f"Split {source_name(source)} ({input_size(source) / 1024 / 1024:.1f} MB) "
+                f"into {len(written)} parts in {time.perf_counter() - start:.2f}s")
+    return written
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pdf_merger split",
+        description="Split a PDF into parts by page count, size, bookmarks or a page mapping.")
+    parser.add_argument("source",
+                        help="PDF to split (also ARCHIVE.zip!MEMBER.pdf, or - for standard input)")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--pages", type=int, metavar="N", help="N pages per part")
+    mode.add_argument("--max-mb", type=float, metavar="MB",
+                      help="parts of at most MB megabytes (e.g. for e-mail limits)")
+    mode.add_argument("--bookmarks", type=int, nargs="?", const=1, metavar="LEVEL",
+                      help="a part per bookmark of LEVEL or above (default 1)")
+    mode.add_argument("--mapping", metavar="FILE",
+                      help="CSV (output,pages) or JSON ({output: pages}) file of "
+                           "outputs and the pages each gets")
+    parser.add_argument("-o", "--output", metavar="PATTERN",
+                        help="output name pattern with {stem}, {n}, {first}, {last} and "
+                             f"{{title}} (default {DEFAULT_PATTERN}, or "
+                             f"{DEFAULT_BOOKMARK_PATTERN} with --bookmarks); names "
+                             "without a folder go next to the source. Not used with --mapping")
+    parser.add_argument("--profile", choices=list(SAVE_PROFILES), default="fast",
+                        help="save profile of the parts (default: fast)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of worker processes (0 = one per CPU)")
+    parser.add_argument("--no-outline", action="store_true",
+                        help="do not copy the source's bookmarks into the parts")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    sources = parse_source(args.source)
+    if sources is not None and len(sources) != 1:
+        parser.error("give a single PDF, not a whole archive")
+    source = sources[0] if sources else args.source
+    if sources is None and not os.path.exists(source):
+        parser.error(f"file not found: {source}")
+
+    if args.pages is not None:
+        mode, value = "pages", args.pages
+    elif args.max_mb is not None:
+        mode, value = "size", int(args.max_mb * 1024 * 1024)
+    elif args.bookmarks is not None:
+        mode, value = "bookmarks", args.bookmarks
+    else:
+        mode, value = "mapping", load_mapping(args.mapping)
+
+    pattern = args.output
+    if pattern and sources is None and not os.path.dirname(pattern):
+        pattern = os.path.join(os.path.dirname(os.path.abspath(source)), pattern)
+    elif pattern is None and sources is None:
+        default = DEFAULT_BOOKMARK_PATTERN if mode == "bookmarks" else DEFAULT_PATTERN
+        pattern = os.path.join(os.path.dirname(os.path.abspath(source)), default)
+
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    try:
+        parts = split_pdf(source, mode, value, pattern, args.profile, workers,
+                          keep_outline=not args.no_outline)
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.error(f"Cannot split {source_name(source)}: {e}")
+        return 1
+    for part in parts:
+        logger.info(f"{part.output}: pages {part.pages[0] + 1}-{part.pages[-1] + 1} "
+                    f"({len(part.pages)} pages, {part.size / 1024:.0f} KB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
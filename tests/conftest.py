@@ -0,0 +1,28 @@
+import os
+import sys
+
+import fitz  # PyMuPDF
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_pdf():
+    """Return a function writing a PDF whose pages read ``name:1``, ``name:2``, ...
+
+    It is called as ``make_pdf(path, name, pages, toc=None)`` and returns
+    the path as a string; ``toc`` is a ``set_toc`` outline for the file.
+    """
+    def make(path, name, pages, toc=None):
+        doc = fitz.open()
+        for number in range(pages):
+            doc.new_page().insert_text((72, 72), f"{name}:{number + 1}")
+        if toc:
+            doc.set_toc(toc)
+        doc.save(str(path))
+        doc.close()
+        return str(path)
+
+    return make
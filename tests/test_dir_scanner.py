@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from dir_scanner import DirectoryScanner
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    for path in ("g/top.pdf", "g/readme.txt", "g/2023/r1.pdf", "g/2023/r2.pdf", "g/2023/r10.pdf",
+                 "g/2023/notes.txt", "g/2023/sub/r1.pdf", "g/2024/r1.pdf", "g/2024/r2.pdf",
+                 "g/.hidden/r1.pdf", "g/2024/.r3.pdf"):
+        target = tmp_path / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(b"")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def names(paths):
+    return [path.replace(os.sep, "/") for path in paths]
+
+
+def test_folder_is_walked_depth_first_in_natural_order(tree):
+    assert names(DirectoryScanner().find(["g"])) == [
+        "g/top.pdf", "g/2023/r1.pdf", "g/2023/r2.pdf", "g/2023/r10.pdf",
+        "g/2023/sub/r1.pdf", "g/2024/.r3.pdf", "g/2024/r1.pdf", "g/2024/r2.pdf",
+        "g/.hidden/r1.pdf"]
+
+
+def test_recursive_glob_keeps_folders_together(tree):
+    assert names(DirectoryScanner().find(["g/**/*.pdf"])) == [
+        "g/top.pdf", "g/2023/r1.pdf", "g/2023/r2.pdf", "g/2023/r10.pdf",
+        "g/2023/sub/r1.pdf", "g/2024/r1.pdf", "g/2024/r2.pdf"]
+
+
+@pytest.mark.parametrize("pattern, expected", [
+    ("g/*/r?.pdf", ["g/2023/r1.pdf", "g/2023/r2.pdf", "g/2024/r1.pdf", "g/2024/r2.pdf"]),
+    ("g/202[4]/*.pdf", ["g/2024/r1.pdf", "g/2024/r2.pdf"]),
+    ("g/*.pdf", ["g/top.pdf"]),
+    ("g/.*/*.pdf", ["g/.hidden/r1.pdf"]),
+    # A folder the pattern matches is walked whole
+    ("*/2023/*", ["g/2023/r1.pdf", "g/2023/r2.pdf", "g/2023/r10.pdf", "g/2023/sub/r1.pdf"]),
+    ("g/202?", ["g/2023/r1.pdf", "g/2023/r2.pdf", "g/2023/r10.pdf", "g/2023/sub/r1.pdf",
+                "g/2024/.r3.pdf", "g/2024/r1.pdf", "g/2024/r2.pdf"]),
+    ("missing/**/*.pdf", []),
+])
+def test_glob_patterns(tree, pattern, expected):
+    assert names(DirectoryScanner().find([pattern])) == expected
+
+
+def test_absolute_glob(tree):
+    found = DirectoryScanner().find([os.path.join(str(tree), "g", "**", "r1.pdf")])
+    assert found == [os.path.join(str(tree), "g", *parts, "r1.pdf")
+                     for parts in (("2023",), ("2023", "sub"), ("2024",))]
+
+
+def test_exclude_applies_to_globs(tree):
+    scanner = DirectoryScanner(exclude=["sub", "*/r2.pdf"])
+    assert names(scanner.find(["g/**/*.pdf"])) == [
+        "g/top.pdf", "g/2023/r1.pdf", "g/2023/r10.pdf", "g/2024/r1.pdf"]
+
+
+def test_include_applies_to_glob_matches_and_walked_folders(tree):
+    # g/readme.txt is matched by the glob itself, g/2023/notes.txt found by walking g/2023
+    assert names(DirectoryScanner().find(["g/**"])) == [
+        "g/top.pdf", "g/2023/r1.pdf", "g/2023/r2.pdf", "g/2023/r10.pdf",
+        "g/2023/sub/r1.pdf", "g/2024/.r3.pdf", "g/2024/r1.pdf", "g/2024/r2.pdf"]
+    assert names(DirectoryScanner(include=["*.txt"]).find(["g/**"])) == [
+        "g/readme.txt", "g/2023/notes.txt"]
+    assert names(DirectoryScanner(include=["*.txt"]).find(["g/*.txt"])) == ["g/readme.txt"]
+    assert DirectoryScanner().find(["g/*.txt"]) == []
@@ -0,0 +1,75 @@
+import pytest
+
+from file_collection import FileCollection, natural_key
+
+
+@pytest.fixture
+def files():
+    collection = FileCollection()
+    collection.add(list("abcdef"))
+    return collection
+
+
+def test_add_skips_duplicates(files):
+    assert [e.path for e in files.add(["a", "g", "g"])] == ["g"]
+    assert list(files) == list("abcdefg")
+
+
+def test_remove(files):
+    removed = files.remove(["b", "e", "x"])
+    assert [e.path for e in removed] == ["b", "e"]
+    assert list(files) == list("acdf")
+    assert all(e.iid in files.by_iid for e in files.entries.values())
+
+
+@pytest.mark.parametrize("chosen, step, expected", [
+    ("c", -1, "acbdef"),
+    ("c", 1, "abdcef"),
+    ("bc", -1, "bcadef"),
+    ("ce", -1, "acbedf"),
+    # Blocks stop at the ends instead of wrapping or splitting
+    ("ab", -1, "abcdef"),
+    ("af", 1, "bacdef"),
+    ("ef", 1, "abcdef"),
+    ("acf", -1, "acbdfe"),
+])
+def test_shift(files, chosen, step, expected):
+    files.shift(chosen, step)
+    assert "".join(files) == expected
+
+
+@pytest.mark.parametrize("chosen, index, expected", [
+    ("ce", 0, "ceabdf"),
+    ("ce", 4, "abdfce"),
+    ("ce", 99, "abdfce"),
+    ("ce", -5, "ceabdf"),
+    ("ec", 1, "acebdf"),
+    ("", 2, "abcdef"),
+])
+def test_move_to(files, chosen, index, expected):
+    files.move_to(chosen, index)
+    assert "".join(files) == expected
+
+
+@pytest.mark.parametrize("chosen, target, after, expected", [
+    ("ab", "e", False, "cdabef"),
+    ("ab", "e", True, "cdeabf"),
+    ("ef", "a", False, "efabcd"),
+    ("be", "f", True, "acdfbe"),
+    # Dropping a block before one of its own rows gathers it there
+    ("bd", "d", False, "acbdef"),
+])
+def test_move_next_to(files, chosen, target, after, expected):
+    files.move_next_to(chosen, target, after)
+    assert "".join(files) == expected
+
+
+def test_merge_inputs_carry_page_specs(files):
+    files.set_page_spec("b", "1-2")
+    files.set_page_spec("c", "")
+    assert files.merge_inputs() == ["a", ("b", "1-2"), "c", "d", "e", "f"]
+
+
+def test_natural_key_uses_numbers_and_the_name_only():
+    paths = ["x/page10.pdf", "y/Page2.pdf", "z/page1.pdf"]
+    assert sorted(paths, key=natural_key) == ["z/page1.pdf", "y/Page2.pdf", "x/page10.pdf"]
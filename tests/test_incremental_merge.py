@@ -0,0 +1,99 @@
+import fitz
+import pytest
+
+import incremental_merge
+from merge_engine import parse_page_spec, split_input
+
+
+def page_texts(path):
+    with fitz.open(path) as doc:
+        return [page.get_text().strip() for page in doc]
+
+
+def expected_texts(inputs):
+    texts = []
+    for item in inputs:
+        path, spec = split_input(item)
+        pages = page_texts(path)
+        texts.extend(pages if spec is None else [pages[i] for i in parse_page_spec(spec, len(pages))])
+    return texts
+
+
+@pytest.fixture
+def inputs(tmp_path, make_pdf):
+    return {name: make_pdf(tmp_path / f"{name}.pdf", name, pages)
+            for name, pages in (("a", 2), ("b", 3), ("c", 1), ("d", 2))}
+
+
+@pytest.fixture
+def full_merges(monkeypatch):
+    calls = []
+    full_merge = incremental_merge._full_merge
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return full_merge(*args, **kwargs)
+
+    monkeypatch.setattr(incremental_merge, "_full_merge", counting)
+    return calls
+
+
+@pytest.mark.parametrize("before, after", [
+    ("abc", "abdc"),   # insert
+    ("abc", "abcd"),   # append
+    ("abc", "dabc"),   # prepend
+    ("abcd", "acd"),   # delete
+    ("abcd", "a"),     # delete several spans
+    ("abcd", "adcb"),  # reorder
+    ("abcd", "dcba"),  # reverse
+], ids=lambda v: v)
+def test_splice_matches_a_fresh_merge(tmp_path, inputs, full_merges, before, after):
+    output = str(tmp_path / "out.pdf")
+    incremental_merge.update_merge([inputs[n] for n in before], output)
+    assert len(full_merges) == 1
+
+    updated = [inputs[n] for n in after]
+    pages = incremental_merge.update_merge(updated, output)
+    assert len(full_merges) == 1
+    assert page_texts(output) == expected_texts(updated)
+    assert pages == len(page_texts(output))
+
+
+@pytest.mark.parametrize("spec", ["3-1", "2", "2,2,1"])
+def test_splice_page_spec_change(tmp_path, inputs, full_merges, spec):
+    output = str(tmp_path / "out.pdf")
+    incremental_merge.update_merge([inputs["a"], inputs["b"], inputs["c"]], output)
+    updated = [inputs["a"], (inputs["b"], spec), inputs["c"]]
+    incremental_merge.update_merge(updated, output)
+    assert len(full_merges) == 1
+    assert page_texts(output) == expected_texts(updated)
+
+
+def test_splice_changed_contents(tmp_path, inputs, full_merges, make_pdf):
+    output = str(tmp_path / "out.pdf")
+    order = [inputs["a"], inputs["b"], inputs["c"]]
+    incremental_merge.update_merge(order, output)
+    make_pdf(inputs["b"], "b2", 4)
+    incremental_merge.update_merge(order, output)
+    assert len(full_merges) == 1
+    assert page_texts(output) == ["a:1", "a:2", "b2:1", "b2:2", "b2:3", "b2:4", "c:1"]
+
+
+def test_unchanged_inputs_leave_the_output_alone(tmp_path, inputs, full_merges):
+    output = str(tmp_path / "out.pdf")
+    order = [inputs["a"], inputs["b"]]
+    incremental_merge.update_merge(order, output)
+    with open(output, "rb") as f:
+        data = f.read()
+    assert incremental_merge.update_merge(order, output) == 5
+    with open(output, "rb") as f:
+        assert f.read() == data
+
+
+def test_changed_profile_merges_afresh(tmp_path, inputs, full_merges):
+    output = str(tmp_path / "out.pdf")
+    incremental_merge.update_merge([inputs["a"]], output)
+    incremental_merge.update_merge([inputs["a"], inputs["c"]], output, profile="compact")
+    assert len(full_merges) == 2
+    assert page_texts(output) == ["a:1", "a:2", "c:1"]
+
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from install_cache import ChecksumError, DownloadCache
+
+
+class FileServer:
+    """What the stand-in server sends for ``/file``, and the requests it saw."""
+
+    def __init__(self):
+        self.content = os.urandom(300_000)
+        self.etag = '"v1"'
+        self.truncate = None  # send only this many bytes of the next response
+        self.honour_if_range = True
+        self.requests = []
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        state = self.server.state
+        ranged, if_range = self.headers.get("Range"), self.headers.get("If-Range")
+        state.requests.append((ranged, if_range))
+        start = 0
+        if ranged and (if_range == state.etag or not state.honour_if_range):
+            start = int(ranged[len("bytes="):-1])
+        body = state.content[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header("Content-Range",
+                             f"bytes {start}-{len(state.content) - 1}/{len(state.content)}")
+        self.send_header("Content-Length", str(len(body)))
+        if state.etag:
+            self.send_header("ETag", state.etag)
+        self.end_headers()
+        if state.truncate is not None:
+            body, state.truncate = body[:state.truncate], None
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    for name in ("http_proxy", "HTTP_PROXY", "all_proxy", "ALL_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    httpd.state = FileServer()
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd.state, f"http://127.0.0.1:{httpd.server_address[1]}/file"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def interrupt(cache, state, url, digest=None):
+    state.truncate = 100_000
+    with pytest.raises(ChecksumError, match="incomplete"):
+        cache.fetch(url, digest)
+
+
+def test_resumes_the_same_version_with_range_and_if_range(tmp_path, server):
+    state, url = server
+    cache = DownloadCache(str(tmp_path))
+    interrupt(cache, state, url)
+    path = cache.fetch(url)
+    assert read(path) == state.content
+    assert state.requests == [(None, None), ("bytes=100000-", '"v1"')]
+
+
+def test_changed_file_is_downloaded_whole(tmp_path, server):
+    state, url = server
+    cache = DownloadCache(str(tmp_path))
+    interrupt(cache, state, url)
+    state.content, state.etag = os.urandom(250_000), '"v2"'
+    # If-Range no longer matches, so the server answers 200 with the new file
+    assert read(cache.fetch(url, sha256(state.content))) == state.content
+    assert state.requests[-1] == ("bytes=100000-", '"v1"')
+
+
+def test_range_from_another_version_is_discarded(tmp_path, server):
+    state, url = server
+    cache = DownloadCache(str(tmp_path))
+    interrupt(cache, state, url)
+    state.content, state.etag = os.urandom(300_000), '"v2"'
+    state.honour_if_range = False
+    assert read(cache.fetch(url)) == state.content
+    assert state.requests[1:] == [("bytes=100000-", '"v1"'), (None, None)]
+
+
+def test_weak_etag_without_a_hash_starts_over(tmp_path, server):
+    state, url = server
+    state.etag = 'W/"v1"'
+    cache = DownloadCache(str(tmp_path))
+    interrupt(cache, state, url)
+    assert read(cache.fetch(url)) == state.content
+    assert state.requests == [(None, None), (None, None)]
+
+
+def test_checksum_mismatch_is_refused(tmp_path, server):
+    state, url = server
+    cache = DownloadCache(str(tmp_path))
+    with pytest.raises(ChecksumError, match="mismatch"):
+        cache.fetch(url, sha256(b"something else"))
+    assert not os.listdir(tmp_path / "partial")
+
+
+def test_upper_case_hash_hits_the_cache(tmp_path, server):
+    state, url = server
+    cache = DownloadCache(str(tmp_path))
+    digest = sha256(state.content).upper()
+    first = cache.fetch(url, digest)
+    assert cache.fetch(url, digest) == first
+    assert os.path.basename(first) == digest.lower()
+    assert (cache.downloads, cache.hits, len(state.requests)) == (1, 1, 1)
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import merge_benchmark
+import merge_engine
+
+
+@pytest.fixture
+def run_jobs(monkeypatch):
+    calls = []
+
+    def fake_run_jobs(jobs, **options):
+        calls.append((jobs, options))
+        return [merge_engine.MergeResult(job, pages=1) for job in jobs]
+
+    monkeypatch.setattr(merge_engine, "run_jobs", fake_run_jobs)
+    return calls
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    path = tmp_path / "jobs.json"
+    path.write_text(json.dumps([{"output": str(tmp_path / "out.pdf"),
+                                 "inputs": [str(tmp_path / "a.pdf")]}]))
+    return str(path)
+
+
+def test_run_options_are_forwarded(run_jobs, manifest, tmp_path, capsys):
+    trace = tmp_path / "trace.jsonl"
+    merge_benchmark.run_manifest(manifest, f"--tree 64 -j 4 --cache-mb 8 --bookmarks "
+                                           f"--profile compact --dedup --fail-fast "
+                                           f"--max-pending 3 --trace {trace}")
+    (jobs, options), = run_jobs
+    assert [job.output for job in jobs] == [str(tmp_path / "out.pdf")]
+    assert options == dict(fail_fast=True, workers=4, max_pending=3, tree_chunk_size=64,
+                           memory_budget=0, cache_bytes=8 * 1024 * 1024,
+                           trace_path=str(trace), incremental=False, dedup=True,
+                           profile="compact", bookmarks="inputs")
+    assert "seconds" in json.loads(capsys.readouterr().out)
+
+
+def test_incremental_and_memory_budget_are_forwarded(run_jobs, manifest):
+    merge_benchmark.run_manifest(manifest, "--incremental --bookmarks outlines")
+    merge_benchmark.run_manifest(manifest, "--memory-budget 16")
+    assert run_jobs[0][1]["incremental"] is True
+    assert run_jobs[0][1]["bookmarks"] == "outlines"
+    assert run_jobs[1][1]["memory_budget"] == 16 * 1024 * 1024
+    assert run_jobs[1][1]["workers"] == 1
+
+
+def test_defaults_match_the_command_line(run_jobs, manifest):
+    merge_benchmark.run_manifest(manifest, "")
+    args = merge_engine.build_parser().parse_args([])
+    assert run_jobs[0][1] == merge_engine.run_options(args)
+
+
+@pytest.mark.parametrize("engine_args", [
+    "extra.pdf", "-o out.pdf", "--manifest m.csv", "--server http://localhost:1",
+    "--journal j.db", "--preflight", "--cprofile p.prof", "--tracemalloc",
+    "--exclude *.tmp",
+    # Refused by the merge engine too
+    "--incremental --tree 8", "--memory-budget 8 --dedup",
+])
+def test_options_that_cannot_apply_are_rejected(run_jobs, manifest, engine_args):
+    with pytest.raises(SystemExit):
+        merge_benchmark.run_manifest(manifest, engine_args)
+    assert not run_jobs
+
+
+def test_server_from_the_environment_is_ignored(run_jobs, manifest, monkeypatch):
+    monkeypatch.setenv("PDF_MERGER_SERVER", "http://localhost:1")
+    merge_benchmark.run_manifest(manifest, "--tree 4")
+    assert run_jobs[0][1]["tree_chunk_size"] == 4
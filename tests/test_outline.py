@@ -0,0 +1,88 @@
+import fitz
+import pytest
+
+import incremental_merge
+from merge_engine import merge_files, outline_entries, read_outline
+
+
+def levels(rows):
+    return [(row[0], row[1], row[2]) for row in rows]
+
+
+@pytest.fixture
+def pdf():
+    doc = fitz.open()
+    for _ in range(4):
+        doc.new_page()
+    yield doc
+    doc.close()
+
+
+# (level, title, 0-based page, dest) as returned by read_outline
+OUTLINE = [(1, "A", 0, "d"), (2, "A1", 1, "d"), (3, "A1a", 2, "d"), (1, "B", 3, "d")]
+
+
+def test_all_pages_shift_by_the_offset(pdf):
+    assert levels(outline_entries(pdf, 10, outline=OUTLINE)) == [
+        (1, "A", 11), (2, "A1", 12), (3, "A1a", 13), (1, "B", 14)]
+
+
+def test_title_nests_the_outline(pdf):
+    assert levels(outline_entries(pdf, 0, title="file", outline=OUTLINE)) == [
+        (1, "file", 1), (2, "A", 1), (3, "A1", 2), (4, "A1a", 3), (2, "B", 4)]
+
+
+def test_dropped_parent_moves_children_up(pdf):
+    # Page 1 is not copied: A1 goes, and A1a may only be one level below A
+    rows = outline_entries(pdf, 0, pages=[0, 2, 3], outline=OUTLINE)
+    assert levels(rows) == [(1, "A", 1), (2, "A1a", 2), (1, "B", 3)]
+
+
+def test_dropped_first_entries_start_at_the_top(pdf):
+    rows = outline_entries(pdf, 0, pages=[2, 3], outline=OUTLINE)
+    assert levels(rows) == [(1, "A1a", 1), (1, "B", 2)]
+    rows = outline_entries(pdf, 0, pages=[2, 3], title="file", outline=OUTLINE)
+    assert levels(rows) == [(1, "file", 1), (2, "A1a", 1), (2, "B", 2)]
+
+
+def test_selected_pages_in_output_order(pdf):
+    # Reversed and repeated pages: each entry points at its page's first copy
+    rows = outline_entries(pdf, 5, pages=[3, 2, 1, 0, 3], outline=OUTLINE)
+    assert levels(rows) == [(1, "A", 9), (2, "A1", 8), (3, "A1a", 7), (1, "B", 6)]
+
+
+def test_entries_without_a_destination_are_kept(pdf):
+    rows = outline_entries(pdf, 0, pages=[0], outline=[(1, "web", -1, "d"), (2, "A", 0, "d")])
+    assert levels(rows) == [(1, "web", -1), (2, "A", 1)]
+
+
+def test_no_outline(pdf):
+    assert outline_entries(pdf, 0, outline=[]) == []
+    assert levels(outline_entries(pdf, 3, title="file", outline=[])) == [(1, "file", 4)]
+
+
+def test_rows_are_accepted_by_set_toc(tmp_path, make_pdf):
+    source = fitz.open(make_pdf(tmp_path / "a.pdf", "a", 4, [
+        [1, "A", 1], [2, "A1", 2], [3, "A1a", 3], [4, "A1a1", 3], [1, "B", 4]]))
+    merged = fitz.open()
+    merged.insert_pdf(source, from_page=3, to_page=2)
+    rows = outline_entries(source, 0, pages=[3, 2], title="a", outline=read_outline(source))
+    merged.set_toc(rows)
+    assert [row[:3] for row in merged.get_toc()] == [
+        [1, "a", 1], [2, "A1a", 2], [3, "A1a1", 2], [2, "B", 1]]
+
+
+@pytest.mark.parametrize("bookmarks", ["inputs", "outlines"])
+def test_splice_keeps_the_outline_of_a_fresh_merge(tmp_path, monkeypatch, make_pdf, bookmarks):
+    paths = {n: make_pdf(tmp_path / f"{n}.pdf", n, 3, [[1, f"{n} start", 1], [2, f"{n} end", 3]])
+             for n in "abcd"}
+    output = str(tmp_path / "out.pdf")
+    incremental_merge.update_merge([paths[n] for n in "abc"], output, bookmarks=bookmarks)
+    monkeypatch.setattr(incremental_merge, "_full_merge", None)  # must splice
+    updated = [paths["c"], (paths["a"], "3-2"), paths["d"]]
+    incremental_merge.update_merge(updated, output, bookmarks=bookmarks)
+
+    fresh = str(tmp_path / "fresh.pdf")
+    merge_files(updated, fresh, bookmarks=bookmarks)
+    with fitz.open(output) as spliced, fitz.open(fresh) as merged:
+        assert spliced.get_toc() == merged.get_toc()
@@ -0,0 +1,60 @@
+import pytest
+
+from merge_engine import page_runs, parse_page_spec, validate_page_spec
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("1", [0]),
+    ("2-4", [1, 2, 3]),
+    ("8-", [7, 8, 9]),
+    ("-3", [0, 1, 2]),
+    ("last 2", [8, 9]),
+    ("LAST 20", list(range(10))),
+    ("odd", [0, 2, 4, 6, 8]),
+    ("even", [1, 3, 5, 7, 9]),
+    ("1, 3-4 ,10", [0, 2, 3, 9]),
+])
+def test_parse_page_spec(spec, expected):
+    assert parse_page_spec(spec, 10) == expected
+
+
+def test_parse_page_spec_keeps_written_order_and_duplicates():
+    assert parse_page_spec("5-3,1,1", 10) == [4, 3, 2, 0, 0]
+    assert parse_page_spec("3-1,1-3", 10) == [2, 1, 0, 0, 1, 2]
+
+
+@pytest.mark.parametrize("spec", ["", "0", "11", "2-11", "1,,2", "-", "a", "3-x", "last"])
+def test_parse_page_spec_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_page_spec(spec, 10)
+
+
+def test_validate_page_spec_does_not_check_the_range():
+    validate_page_spec("1-999")
+    with pytest.raises(ValueError):
+        validate_page_spec("1-2-3")
+
+
+@pytest.mark.parametrize("pages, expected", [
+    ([], []),
+    ([4], [(4, 4)]),
+    ([0, 1, 2, 5, 6], [(0, 2), (5, 6)]),
+    ([4, 3, 2, 0], [(4, 2), (0, 0)]),
+    # A run keeps its direction; the next page in the other direction starts a new one
+    ([1, 2, 3, 2, 1], [(1, 3), (2, 1)]),
+    ([3, 2, 3, 4], [(3, 2), (3, 4)]),
+    # Repeated pages are never folded into a run
+    ([0, 0, 0], [(0, 0), (0, 0), (0, 0)]),
+    ([2, 1, 0, 0, 1, 2], [(2, 0), (0, 2)]),
+])
+def test_page_runs(pages, expected):
+    assert page_runs(pages) == expected
+
+
+def test_page_runs_cover_the_selection():
+    pages = parse_page_spec("9-7,1-3,3,odd,last 2", 10)
+    expanded = []
+    for start, end in page_runs(pages):
+        step = 1 if end >= start else -1
+        expanded.extend(range(start, end + step, step))
+    assert expanded == pages
@@ -0,0 +1,62 @@
+import os
+import zipfile
+
+import pytest
+
+import pdf_sources
+from pdf_sources import ZipMember, open_archive
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def no_open_archives():
+    yield
+    for _, zf in pdf_sources._archives.values():
+        zf.close()
+    pdf_sources._archives.clear()
+
+
+def test_archives_are_shared_and_evicted_ones_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_sources, "MAX_OPEN_ARCHIVES", 2)
+    paths = [make_zip(tmp_path / f"{n}.zip", {"a.pdf": n}) for n in "xyz"]
+    first = open_archive(paths[0])
+    assert open_archive(paths[0]) is first
+    second = open_archive(paths[1])
+    open_archive(paths[0])  # now the most recently used
+    open_archive(paths[2])
+    assert first.fp is not None and second.fp is None
+    assert list(pdf_sources._archives) == [os.path.abspath(paths[0]), os.path.abspath(paths[2])]
+
+
+def test_changed_archive_is_reopened_and_the_old_one_closed(tmp_path):
+    path = make_zip(tmp_path / "a.zip", {"a.pdf": "old"})
+    old = open_archive(path)
+    make_zip(path, {"a.pdf": "new contents"})
+    assert open_archive(path).read("a.pdf") == b"new contents"
+    assert old.fp is None
+
+
+def test_member_being_read_survives_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_sources, "MAX_OPEN_ARCHIVES", 1)
+    data = os.urandom(100_000)
+    zf = open_archive(make_zip(tmp_path / "a.zip", {"a.pdf": data}))
+    with zf.open("a.pdf") as member:
+        start = member.read(10)
+        open_archive(make_zip(tmp_path / "b.zip", {"b.pdf": "b"}))
+        assert start + member.read() == data
+
+
+def test_zip_members_compare_by_archive_and_name(tmp_path, monkeypatch):
+    path = make_zip(tmp_path / "a.zip", {"d/a.pdf": "a", "d/b.pdf": "b"})
+    monkeypatch.chdir(tmp_path)
+    members = pdf_sources.zip_members("a.zip", ["*.pdf"])
+    assert ZipMember(path, "d/b.pdf") in members
+    assert list(dict.fromkeys([ZipMember("a.zip", "d/b.pdf"), *members])) == [
+        ZipMember("a.zip", "d/b.pdf"), ZipMember("a.zip", "d/a.pdf")]
+    assert ZipMember(path, "d/a.pdf") != ZipMember(path, "d/b.pdf")
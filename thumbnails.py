@@ -0,0 +1,208 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+from incremental_merge import file_sha256
+from input_cache import InputCache
+from preflight import fitz_lock
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".pdf_merger", "thumbnails")
+
+
+class ThumbnailCache:
+    """Page thumbnails rendered in the background, each page at most once.
+
+    Thumbnails are PNG bytes ``width`` pixels wide, keyed by the SHA-256 of
+    the file's contents and the page number, so renamed or copied files
+    reuse them and edited files do not. Lookups go to an in-memory LRU
+    bounded by ``max_bytes``, then to ``cache_dir`` on disk, and only then
+    render with ``get_pixmap``. Concurrent requests for the same page share
+    one future, and requests that are cancelled before they start (pages
+    scrolled out of view) cost nothing. Each file is hashed once, however
+    many of its pages are requested together. MuPDF calls take the shared
+    ``preflight.fitz_lock``; hashing and disk access run in parallel.
+
+    The disk cache is kept under ``max_disk_bytes``: once a write takes it
+    over, the least recently used thumbnails are deleted until it is back
+    to 80% of the limit. Disk hits refresh a file's mtime, which serves as
+    its last use.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, width: int = 96,
+                 max_bytes: int = 32 * 1024 * 1024, workers: int = 4,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.width = width
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_bytes = None  # measured on the first write
+        self.memory = OrderedDict()  # (sha256, page) -> PNG bytes
+        self.memory_bytes = 0
+        self.pending = {}  # (path, page) -> Future
+        self.hashes = {}  # (path, mtime_ns, size) -> sha256
+        self.hashing = {}  # (path, mtime_ns, size) -> Future of sha256
+        self.lock = threading.Lock()
+        self.prune_lock = threading.Lock()
+        self.documents = InputCache(max_bytes=128 * 1024 * 1024, max_entries=16)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.rendered = 0
+        self.disk_hits = 0
+
+    def _signature(self, path):
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def cached(self, path: str, page: int) -> Optional[bytes]:
+        """Return the thumbnail if it is in memory; never blocks on disk or rendering."""
+        try:
+            sha256 = self.hashes.get(self._signature(path))
+        except OSError:
+            return None
+        if sha256 is None:
+            return None
+        with self.lock:
+            png = self.memory.get((sha256, page))
+            if png is not None:
+                self.memory.move_to_end((sha256, page))
+            return png
+
+    def get(self, path: str, page: int) -> Future:
+        """Return a future for the PNG thumbnail of ``page`` (0-based) of ``path``."""
+        key = (path, page)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._load, path, page)
+                self.pending[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def _file_hash(self, path):
+        signature = self._signature(path)
+        with self.lock:
+            sha256 = self.hashes.get(signature)
+            if sha256 is not None:
+                return sha256
+            future = self.hashing.get(signature)
+            owner = future is None
+            if owner:
+                future = self.hashing[signature] = Future()
+        if not owner:
+            # Another worker is reading this file already
+            return future.result()
+        try:
+            sha256 = file_sha256(path)
+        except BaseException as e:
+            with self.lock:
+                del self.hashing[signature]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.hashes[signature] = sha256
+            del self.hashing[signature]
+        future.set_result(sha256)
+        return sha256
+
+    def _disk_path(self, sha256, page):
+        return os.path.join(self.cache_dir, sha256[:2], f"{sha256}-{page}-{self.width}.png")
+
+    def _load(self, path, page):
+        sha256 = self._file_hash(path)
+        key = (sha256, page)
+        with self.lock:
+            png = self.memory.get(key)
+        if png is not None:
+            return png
+
+        disk_path = self._disk_path(sha256, page) if self.cache_dir else None
+        if disk_path is not None and os.path.exists(disk_path):
+            with open(disk_path, "rb") as f:
+                png = f.read()
+            self.disk_hits += 1
+            try:
+                os.utime(disk_path)
+            except OSError:
+                pass
+        else:
+            png = self._render(path, page)
+            if disk_path is not None:
+                self._store_on_disk(disk_path, png)
+
+        with self.lock:
+            self.memory[key] = png
+            self.memory_bytes += len(png)
+            while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+                _, old = self.memory.popitem(last=False)
+                self.memory_bytes -= len(old)
+        return png
+
+    def _render(self, path, page):
+        with fitz_lock:
+            doc = self.documents.open(path)
+            pdf_page = doc[page]
+            zoom = self.width / max(pdf_page.rect.width, 1)
+            pixmap = pdf_page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            png = pixmap.tobytes("png")
+        self.rendered += 1
+        return png
+
+    def _store_on_disk(self, disk_path, png):
+        # The disk cache is only an optimisation; a read-only or full disk is not an error
+        try:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            partial = f"{disk_path}.{threading.get_ident()}.tmp"
+            with open(partial, "wb") as f:
+                f.write(png)
+            os.replace(partial, disk_path)
+        except OSError:
+            return
+        with self.lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += len(png)
+        if self.disk_bytes is None or self.disk_bytes > self.max_disk_bytes:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Measure the disk cache and delete the least recently used files if it is too big."""
+        if not self.prune_lock.acquire(blocking=False):
+            return  # another worker is on it
+        try:
+            entries = []
+            for directory, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_disk_bytes:
+                entries.sort()
+                target = self.max_disk_bytes * 0.8
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
+            with self.lock:
+                self.disk_bytes = total
+        finally:
+            self.prune_lock.release()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with fitz_lock:
+            self.documents.clear()